@@ -1,58 +1,68 @@
 """
 TA Agent - RAG-powered Teaching Assistant
-Uses ChromaDB for context retrieval and Groq API for responses.
+Uses ChromaDB for context retrieval and the configured LLM provider
+(Groq by default) for responses.
 """
 
+import asyncio
 import os
+from contextlib import aclosing
 from pathlib import Path
-from groq import Groq
+from typing import AsyncIterator, Optional
 
-from app.core.config import settings
-from app.ai_engine.rag.ingest import get_vectorstore as get_rag_vectorstore
+from app.ai_engine.rag.ingest import lab_filter
+from app.ai_engine.rag.store import get_knowledge_base
+from app.ai_engine.answer_cache import cache_generation, get_answer_cache
+from app.ai_engine.conversation import Conversation
+from app.ai_engine.evidence import gather_evidence
+from app.ai_engine.llm.providers import LLMUnavailableError
+from app.ai_engine.llm.resilience import close_llm, get_llm
+from app.ai_engine.prompt_builder import FALLBACK_SYSTEM_PROMPT, SystemPrompt, build_prompt
+from app.ai_engine.single_flight import flight_key, get_single_flight
 
 
 # Load the Socratic TA prompt
 PROMPTS_DIR = Path(__file__).parent.parent / "prompts"
 
 
+system_prompt = SystemPrompt(PROMPTS_DIR / "socratic_ta.txt", FALLBACK_SYSTEM_PROMPT)
+
+
 def load_system_prompt():
-    """Load the system prompt from file."""
-    prompt_file = PROMPTS_DIR / "socratic_ta.txt"
-    if prompt_file.exists():
-        return prompt_file.read_text(encoding="utf-8")
-    return "You are a helpful teaching assistant for a programming course. Guide students using the Socratic method - ask leading questions rather than giving direct answers."
+    """Load the system prompt (cached, re-read when the file changes)."""
+    return system_prompt.get()
 
 
 def get_vectorstore():
-    """Get the ChromaDB vectorstore for RAG retrieval."""
-    try:
-        return get_rag_vectorstore()
-    except Exception as e:
-        print(f"Warning: Could not load vectorstore: {e}")
-        return None
+    """Get the shared retriever (hybrid or vector store) for RAG retrieval (None until it is loaded)."""
+    return get_knowledge_base().retriever
 
 
-def retrieve_context(vectorstore, question: str, student_code: str, k: int = 3) -> tuple:
+def retrieve_context(vectorstore, question: str, student_code: str, k: int = 3, lab_id: Optional[str] = None) -> tuple:
     """Retrieve relevant context from the knowledge base using RAG.
     
+    With a lab_id, only that lab's assignment and the shared course
+    material (concepts, style guide, syllabus) are searched.
+    
     Returns:
-        tuple: (context_string, list of source dicts with name, path, and snippet)
+        tuple: (list of chunk dicts with source and text, best first,
+                list of source dicts with name, path, and snippet)
     """
     if vectorstore is None:
-        return "No knowledge base available.", []
+        return [], []
     
     try:
         # Combine question and code for better context matching
         query = f"{question}\n\nStudent code: {student_code[:500]}"
         
         # Retrieve relevant documents
-        docs = vectorstore.similarity_search(query, k=k)
+        docs = vectorstore.similarity_search(query, k=k, filter=lab_filter(lab_id))
         
         if not docs:
-            return "No relevant context found in knowledge base.", []
+            return [], []
         
-        # Format the context and collect sources
-        context_parts = []
+        # Collect the chunks and their sources
+        chunks = []
         sources = []
         seen_sources = set()  # Avoid duplicates
         
@@ -60,7 +70,7 @@ def retrieve_context(vectorstore, question: str, student_code: str, k: int = 3)
             source_path = doc.metadata.get("source", "")
             source_name = Path(source_path).name if source_path else "unknown"
             
-            context_parts.append(f"[Source: {source_name}]\n{doc.page_content}")
+            chunks.append({"source": source_name, "text": doc.page_content})
             
             # Add unique sources to the list
             if source_name not in seen_sources:
@@ -71,95 +81,280 @@ def retrieve_context(vectorstore, question: str, student_code: str, k: int = 3)
                     "snippet": doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content
                 })
         
-        return "\n\n---\n\n".join(context_parts), sources
+        return chunks, sources
         
     except Exception as e:
         print(f"Error retrieving context: {e}")
-        return "Error retrieving context from knowledge base.", []
+        return [], []
+
+
+def error_answer(e: Exception) -> str:
+    """Student-facing message for a failed completion."""
+    if isinstance(e, LLMUnavailableError):
+        wait = f" in about {int(e.retry_after) + 1} seconds" if e.retry_after else " in a minute"
+        return f"The TA is busy right now (too many questions at once, or the AI service is down). Please ask again{wait}."
+    error_msg = str(e)
+    if "authentication" in error_msg.lower() or "api key" in error_msg.lower():
+        return "API key error. Please check your GROQ_API_KEY in the .env file."
+    return f"I'm having trouble responding right now. Error: {error_msg}"
+
+
+def lookup_cached_answer(question: str, student_code: str, lab_id: Optional[str], system_prompt: str, language: str = "python") -> tuple:
+    """
+    Look the question up in the semantic answer cache.
+    
+    Returns:
+        (hit, key): hit is a dict with answer, sources and similarity, or
+        None; key is passed to store_cached_answer (None when caching is off)
+    """
+    cache = get_answer_cache()
+    knowledge_base = get_knowledge_base()
+    if cache is None or knowledge_base.embeddings is None:
+        return None, None
+    
+    vector = knowledge_base.embeddings.embed_query(question)
+    generation = cache_generation(knowledge_base.loaded_at, system_prompt)
+    key = (lab_id, student_code, language, vector, generation)
+    return cache.get(*key), key
 
 
-# Initialize client
-def get_groq_client():
-    """Get Groq client instance."""
-    api_key = settings.groq_api_key
-    if not api_key:
-        raise ValueError("GROQ_API_KEY not set. Please create a .env file in the backend folder with your Groq API key.")
-    return Groq(api_key=api_key)
+def store_cached_answer(key: Optional[tuple], answer: str, sources: list):
+    """Remember a successful answer for similar questions."""
+    cache = get_answer_cache()
+    if key is not None and cache is not None and answer:
+        cache.put(*key[:4], answer, sources, key[4])
 
 
-async def get_ta_response(vectorstore, question: str, student_code: str) -> dict:
+async def get_ta_response(
+    vectorstore,
+    question: str,
+    student_code: str,
+    lab_id: Optional[str] = None,
+    language: str = "python"
+) -> dict:
     """
-    Get a response from the TA agent using RAG + Groq API.
+    Get a response from the TA agent using RAG + the LLM provider.
     
     Args:
         vectorstore: ChromaDB vectorstore for context retrieval
         question: The student's question
         student_code: The student's current code
+        lab_id: Lab the question is about; retrieval is scoped to it and
+            answers are only shared within a lab
+        language: Language of the student's code, for the sandboxed run
     
     Returns:
-        dict with 'answer' and 'sources' keys
+        dict with 'answer', 'sources' and 'cached' keys
     """
+    system_prompt = load_system_prompt()
+    
+    # A close enough question on the same lab and code (and language) was already answered
+    hit, cache_key = await asyncio.to_thread(
+        lookup_cached_answer, question, student_code, lab_id, system_prompt, language
+    )
+    if hit is not None:
+        return {
+            "answer": hit["answer"],
+            "sources": hit["sources"],
+            "cached": True
+        }
+    
     try:
-        client = get_groq_client()
+        llm = get_llm()
     except ValueError as e:
         return {
             "answer": str(e),
-            "sources": []
+            "sources": [],
+            "cached": False
         }
     
-    system_prompt = load_system_prompt()
-    
-    # Retrieve relevant context using RAG
-    context, sources = retrieve_context(vectorstore, question, student_code)
+    # Retrieve relevant context using RAG (embedding the query is CPU work)
+    # while the code runs in the sandbox and is checked statically
+    evidence = await gather_evidence(
+        asyncio.to_thread(retrieve_context, vectorstore, question, student_code, 3, lab_id),
+        student_code,
+        language
+    )
+    sources = evidence["sources"]
+    messages, _ = build_prompt(
+        system_prompt, evidence["chunks"], question, student_code, evidence["evidence"], language=language
+    )
     
     try:
-        # Call Groq API
-        chat_completion = client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"""
-## Relevant Course Materials
-{context}
-
-## Student's Code
-```python
-{student_code}
-```
-
-## Student's Question
-{question}
-
-Please respond as a helpful teaching assistant. Use the Socratic method: guide the student to discover the answer themselves through questions, hints, and explanations. Reference the course materials when relevant.
-"""}
-            ],
-            model=settings.groq_model,
-            temperature=0.3,
-            max_tokens=1024
-        )
-        
-        answer = chat_completion.choices[0].message.content
+        # Deadline, retries, rate limiting and circuit breaker are in the client
+        answer = await llm.complete(messages, max_tokens=1024, temperature=0.3)
+        store_cached_answer(cache_key, answer, sources)
         
         return {
             "answer": answer,
-            "sources": sources  # Return the actual source files with details
+            "sources": sources,  # Return the actual source files with details
+            "cached": False
         }
     
     except Exception as e:
-        error_msg = str(e)
-        if "authentication" in error_msg.lower() or "api key" in error_msg.lower():
-            return {
-                "answer": "API key error. Please check your GROQ_API_KEY in the .env file.",
-                "sources": []
-            }
         return {
-            "answer": f"I'm having trouble responding right now. Error: {error_msg}",
-            "sources": []
+            "answer": error_answer(e),
+            "sources": [],
+            "cached": False
         }
 
 
+async def stream_ta_response(
+    vectorstore,
+    question: str,
+    student_code: str,
+    lab_id: Optional[str] = None,
+    language: str = "python",
+    conversation: Optional[Conversation] = None
+) -> AsyncIterator[dict]:
+    """
+    Stream a TA response token by token.
+    
+    Yields {"type": "token", "data": str} events as the model produces
+    them, then one {"type": "message", "response", "sources", "cached"}
+    event with the full answer ("error": True when it is an error
+    message). A cached answer arrives as a single token.
+    
+    With a conversation that has history, the earlier turns go into the
+    prompt and the answer cache is bypassed (the answer depends on them).
+    """
+    system_prompt = load_system_prompt()
+    history = conversation.messages() if conversation is not None and conversation.has_history() else None
+    if history:
+        hit, cache_key = None, None
+    else:
+        hit, cache_key = await asyncio.to_thread(
+            lookup_cached_answer, question, student_code, lab_id, system_prompt, language
+        )
+    if hit is not None:
+        yield {"type": "token", "data": hit["answer"]}
+        yield {"type": "message", "response": hit["answer"], "sources": hit["sources"], "cached": True}
+        return
+    
+    try:
+        llm = get_llm()
+    except ValueError as e:
+        yield {"type": "message", "response": str(e), "sources": [], "cached": False, "error": True}
+        return
+    
+    retrieval_question = conversation.retrieval_question(question) if history else question
+    evidence = await gather_evidence(
+        asyncio.to_thread(retrieve_context, vectorstore, retrieval_question, student_code, 3, lab_id),
+        student_code,
+        language
+    )
+    sources = evidence["sources"]
+    messages, _ = build_prompt(
+        system_prompt, evidence["chunks"], question, student_code, evidence["evidence"], history, language
+    )
+    
+    parts = []
+    try:
+        async for delta in llm.stream(messages, max_tokens=1024, temperature=0.3):
+            parts.append(delta)
+            yield {"type": "token", "data": delta}
+    
+    except Exception as e:
+        yield {"type": "message", "response": error_answer(e), "sources": [], "cached": False, "error": True}
+        return
+    
+    answer = "".join(parts)
+    store_cached_answer(cache_key, answer, sources)
+    yield {"type": "message", "response": answer, "sources": sources, "cached": False}
+
+
+async def coalesced_ta_stream(
+    vectorstore,
+    question: str,
+    student_code: str,
+    lab_id: Optional[str] = None,
+    language: str = "python"
+) -> AsyncIterator[dict]:
+    """
+    stream_ta_response, shared by identical concurrent requests.
+    
+    The first request runs it; the others replay its events so far and
+    then follow it live. The final message event carries "coalesced":
+    True for requests that joined another one.
+    """
+    flights = get_single_flight()
+    if flights is None:
+        async for event in stream_ta_response(vectorstore, question, student_code, lab_id, language):
+            yield event
+        return
+    
+    flight, leader = flights.join(
+        flight_key(question, student_code, lab_id, language),
+        lambda: stream_ta_response(vectorstore, question, student_code, lab_id, language)
+    )
+    async for event in flight.follow():
+        if event["type"] == "message":
+            event = {**event, "coalesced": not leader}
+        yield event
+
+
+async def conversation_ta_stream(
+    vectorstore,
+    question: str,
+    student_code: str,
+    conversation: Conversation,
+    lab_id: Optional[str] = None,
+    language: str = "python"
+) -> AsyncIterator[dict]:
+    """
+    TA response stream for a chat connection that remembers earlier turns.
+    
+    The opening question is coalesced with identical ones in flight;
+    follow-ups depend on this conversation and are answered on their own.
+    Each successful answer is added to the conversation.
+    """
+    if conversation.has_history():
+        events = stream_ta_response(vectorstore, question, student_code, lab_id, language, conversation)
+    else:
+        events = coalesced_ta_stream(vectorstore, question, student_code, lab_id, language)
+    async with aclosing(events):
+        async for event in events:
+            if event["type"] == "message" and not event.get("error"):
+                conversation.add_turn(question, event["response"])
+            yield event
+
+
+async def coalesced_ta_response(
+    vectorstore,
+    question: str,
+    student_code: str,
+    lab_id: Optional[str] = None,
+    language: str = "python"
+) -> dict:
+    """
+    get_ta_response, shared by identical concurrent requests (streaming or not).
+    
+    Returns:
+        dict with 'answer', 'sources', 'cached' and 'coalesced' keys
+    """
+    if get_single_flight() is None:
+        response = await get_ta_response(vectorstore, question, student_code, lab_id, language)
+        return {**response, "coalesced": False}
+    
+    async for event in coalesced_ta_stream(vectorstore, question, student_code, lab_id, language):
+        if event["type"] == "message":
+            return {
+                "answer": event["response"],
+                "sources": event["sources"],
+                "cached": event["cached"],
+                "coalesced": event["coalesced"]
+            }
+    raise RuntimeError("TA response ended without an answer")
+
+
 # Synchronous version
 def get_ta_response_sync(vectorstore, question: str, student_code: str) -> dict:
     """Synchronous version of get_ta_response."""
-    import asyncio
-    return asyncio.run(get_ta_response(vectorstore, question, student_code))
-
+    async def run():
+        try:
+            return await get_ta_response(vectorstore, question, student_code)
+        finally:
+            # The pooled connections belong to this event loop
+            await close_llm()
+    
+    return asyncio.run(run())
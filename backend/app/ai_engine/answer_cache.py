@@ -0,0 +1,181 @@
+"""
+Semantic Answer Cache
+Reuses TA answers across students: when a question is close enough in
+embedding space to one already answered for the same lab and the same
+code in the same language, the stored answer is served without another RAG + LLM round trip.
+
+Entries expire by age, the cache stays under a byte budget, and all
+entries are dropped when the knowledge base or system prompt changes.
+"""
+
+import hashlib
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Optional
+
+from app.core.config import settings
+
+
+def code_fingerprint(code: str, language: str = "python") -> str:
+    """
+    Hash of the code ignoring blank lines and trailing whitespace, and in
+    Python also comment-only lines (in C and C++ a leading # is a
+    preprocessor directive, which changes the program).
+    """
+    python = language.lower() in ("python", "python3")
+    lines = [
+        line.rstrip()
+        for line in code.splitlines()
+        if line.strip() and not (python and line.strip().startswith("#"))
+    ]
+    return hashlib.sha256("\n".join(lines).encode("utf-8")).hexdigest()
+
+
+def cache_generation(knowledge_base_version, system_prompt: str) -> tuple:
+    """Everything that invalidates all answers when it changes."""
+    return (knowledge_base_version, hashlib.sha256(system_prompt.encode("utf-8")).hexdigest())
+
+
+class AnswerCache:
+    """
+    Answers bucketed by (lab_id, language, code fingerprint), matched by cosine
+    similarity of the question embedding (embeddings are normalized, so
+    a dot product).
+    """
+
+    def __init__(self, max_bytes: int, ttl: int, threshold: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, dict]" = OrderedDict()  # LRU order
+        self._buckets: dict = {}  # (lab_id, language, fingerprint) -> set of entry ids
+        self._next_id = 0
+        self._bytes = 0
+        self.generation = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _check_generation(self, generation: tuple):
+        if generation != self.generation:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._buckets.clear()
+            self._bytes = 0
+            self.generation = generation
+
+    def get(self, lab_id: Optional[str], code: str, language: str, vector: list, generation: tuple) -> Optional[dict]:
+        """
+        Best stored answer for a similar question on the same lab and code.
+
+        Returns:
+            dict with answer, sources and similarity, or None on a miss
+        """
+        bucket = (lab_id or "", language.lower(), code_fingerprint(code, language))
+        now = time.monotonic()
+        with self._lock:
+            self._check_generation(generation)
+            best, best_score = None, self.threshold
+            for entry_id in list(self._buckets.get(bucket, ())):
+                entry = self._entries[entry_id]
+                if entry["expires_at"] <= now:
+                    self._drop(entry_id)
+                    continue
+                score = sum(a * b for a, b in zip(vector, entry["vector"]))
+                if score >= best_score:
+                    best, best_score = entry_id, score
+
+            if best is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best)
+            self.hits += 1
+            entry = self._entries[best]
+            return {
+                "answer": entry["answer"],
+                "sources": entry["sources"],
+                "similarity": round(best_score, 4)
+            }
+
+    def put(self, lab_id: Optional[str], code: str, language: str, vector: list, answer: str, sources: list, generation: tuple):
+        """Store an answer, evicting least recently used entries to fit."""
+        packed = array("f", vector)
+        size = (
+            packed.itemsize * len(packed)
+            + len(answer.encode("utf-8"))
+            + sum(len(source.get("snippet", "")) + 200 for source in sources)
+            + 300
+        )
+        if size > self.max_bytes:
+            return
+
+        bucket = (lab_id or "", language.lower(), code_fingerprint(code, language))
+        with self._lock:
+            self._check_generation(generation)
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = {
+                "bucket": bucket,
+                "vector": packed,
+                "answer": answer,
+                "sources": sources,
+                "size": size,
+                "expires_at": time.monotonic() + self.ttl,
+            }
+            self._buckets.setdefault(bucket, set()).add(entry_id)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+
+    def _drop(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        self._bytes -= entry["size"]
+        members = self._buckets[entry["bucket"]]
+        members.discard(entry_id)
+        if not members:
+            del self._buckets[entry["bucket"]]
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "enabled": True,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+                "invalidations": self.invalidations,
+            }
+
+
+# Cache instance
+answer_cache: Optional[AnswerCache] = None
+
+
+def get_answer_cache() -> Optional[AnswerCache]:
+    """Get or create the answer cache, or None when it is disabled."""
+    global answer_cache
+    if not settings.answer_cache_enabled:
+        return None
+    if answer_cache is None:
+        answer_cache = AnswerCache(
+            max_bytes=settings.answer_cache_max_bytes,
+            ttl=settings.answer_cache_ttl,
+            threshold=settings.answer_cache_threshold
+        )
+    return answer_cache
+
+
+def get_answer_cache_stats() -> dict:
+    """Answer cache statistics for the stats endpoint."""
+    if answer_cache is None:
+        return {"enabled": settings.answer_cache_enabled}
+    return answer_cache.stats()
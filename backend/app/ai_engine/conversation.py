@@ -0,0 +1,172 @@
+"""
+Conversation Memory
+Per-connection chat state, so follow-ups ("what about line 5?") keep
+their context without the prompt growing with every turn. The last few
+turns are sent verbatim; older ones are folded into a running summary
+with a fixed token budget.
+
+Folding happens in a background task after a reply, never on the
+request path. Turns still being folded stay in the prompt verbatim until
+the summary includes them. The summary is written by the LLM; if that
+fails or times out, a short extractive digest of the questions is kept
+instead.
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import List, Optional
+
+from app.core.config import settings
+from app.ai_engine.llm.resilience import get_llm
+from app.ai_engine.prompt_builder import estimate_tokens, truncate_tokens
+
+
+SUMMARY_INSTRUCTIONS = (
+    "You keep notes on a tutoring conversation between a programming student and a teaching "
+    "assistant. Update the notes with the new exchanges: what the student is working on, what "
+    "they asked, which errors and lines of code came up, and what hints they were already given. "
+    "Reply with the updated notes only, in at most {words} words."
+)
+
+# Tokens kept of each folded question in a digest
+DIGEST_QUESTION_TOKENS = 40
+
+
+class ConversationStats:
+    """Conversation and summary counts across all connections."""
+
+    def __init__(self):
+        self.opened = 0
+        self.closed = 0
+        self.turns = 0
+        self.folded = 0
+        self.summaries = {"llm": 0, "digest": 0}
+        self.summary_seconds = 0.0
+
+    def record_summary(self, method: str, turns: int, seconds: float):
+        self.summaries[method] += 1
+        self.folded += turns
+        self.summary_seconds += seconds
+
+    def stats(self) -> dict:
+        summaries = sum(self.summaries.values())
+        return {
+            "active": self.opened - self.closed,
+            "conversations": self.opened,
+            "turns": self.turns,
+            "turns_folded": self.folded,
+            "summaries": dict(self.summaries),
+            "mean_summary_ms": round(self.summary_seconds / summaries * 1000, 1) if summaries else 0.0,
+        }
+
+
+# Stats instance
+conversation_stats = ConversationStats()
+
+
+def get_conversation_stats() -> dict:
+    """Conversation memory statistics for the stats endpoint."""
+    return conversation_stats.stats()
+
+
+def format_turns(turns: List[tuple]) -> str:
+    return "\n\n".join(f"Student: {question}\nTA: {answer}" for question, answer in turns)
+
+
+def digest(summary: str, turns: List[tuple]) -> str:
+    """Extractive fallback: one line per question, oldest dropped first to fit the budget."""
+    lines = summary.splitlines() if summary else []
+    lines += [
+        f"- Student asked: {truncate_tokens(' '.join(question.split()), DIGEST_QUESTION_TOKENS)}"
+        for question, _ in turns
+    ]
+    while len(lines) > 1 and estimate_tokens("\n".join(lines)) > settings.conversation_summary_max_tokens:
+        lines.pop(0)
+    return truncate_tokens("\n".join(lines), settings.conversation_summary_max_tokens)
+
+
+async def summarize(summary: str, turns: List[tuple]) -> tuple:
+    """
+    Fold `turns` into `summary`.
+
+    Returns:
+        (new summary, method) where method is "llm" or "digest"
+    """
+    if settings.conversation_summary_llm:
+        budget = settings.conversation_summary_max_tokens
+        messages = [
+            {"role": "system", "content": SUMMARY_INSTRUCTIONS.format(words=budget * 3 // 4)},
+            {"role": "user", "content": f"Current notes:\n{summary or '(none yet)'}\n\nNew exchanges:\n{format_turns(turns)}"},
+        ]
+        try:
+            text = await get_llm().complete(
+                messages,
+                max_tokens=budget,
+                temperature=0.0,
+                deadline=settings.conversation_summary_deadline
+            )
+            if text.strip():
+                return truncate_tokens(text.strip(), budget), "llm"
+        except Exception as e:
+            print(f"⚠️ Conversation summary fell back to a digest: {e}")
+    return digest(summary, turns), "digest"
+
+
+class Conversation:
+    """
+    Memory of one chat connection: the recent turns verbatim and a summary
+    of the ones before. Used from a single event loop.
+    """
+
+    def __init__(self):
+        self.turns: deque = deque()  # (question, answer), oldest first
+        self.folding: list = []  # turns leaving `turns`, not yet in the summary
+        self.summary = ""
+        self._task: Optional[asyncio.Task] = None
+        conversation_stats.opened += 1
+
+    def has_history(self) -> bool:
+        return bool(self.turns or self.folding or self.summary)
+
+    def retrieval_question(self, question: str) -> str:
+        """The question with the previous one, so short follow-ups still retrieve on topic."""
+        recent = self.folding + list(self.turns)
+        return f"{recent[-1][0]}\n{question}" if recent else question
+
+    def messages(self) -> List[dict]:
+        """Chat messages carrying the conversation so far, to go before the new question."""
+        messages = []
+        if self.summary:
+            messages.append({"role": "system", "content": f"Notes on the conversation so far:\n{self.summary}"})
+        for question, answer in self.folding + list(self.turns):
+            messages.append({"role": "user", "content": question})
+            messages.append({"role": "assistant", "content": answer})
+        return messages
+
+    def add_turn(self, question: str, answer: str):
+        """Remember a finished turn and fold the overflow into the summary in the background."""
+        self.turns.append((
+            truncate_tokens(question, settings.prompt_question_max_tokens),
+            truncate_tokens(answer, settings.conversation_turn_max_tokens)
+        ))
+        conversation_stats.turns += 1
+        while len(self.turns) > max(0, settings.conversation_turns):
+            self.folding.append(self.turns.popleft())
+        if self.folding and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._fold())
+
+    async def _fold(self):
+        while self.folding:
+            turns = list(self.folding)
+            started = time.perf_counter()
+            self.summary, method = await summarize(self.summary, turns)
+            # Turns added meanwhile stay for the next round
+            del self.folding[:len(turns)]
+            conversation_stats.record_summary(method, len(turns), time.perf_counter() - started)
+
+    def close(self):
+        """Drop the conversation (connection closed)."""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        conversation_stats.closed += 1
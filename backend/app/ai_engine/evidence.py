@@ -0,0 +1,155 @@
+"""
+Evidence Gathering
+Collects what the TA looks at before answering, all at once: course
+material retrieval, a sandboxed run of the student's code, and static
+checks. The request waits for the slowest tool rather than the sum of
+them. Each tool has its own deadline, clipped to the overall gather
+budget; a tool that misses it is left out of the prompt and the
+completion starts anyway.
+"""
+
+import asyncio
+import time
+from typing import Awaitable, Optional
+
+from app.core.config import settings
+from app.ai_engine.tools import analyze_code_output, static_analysis
+
+
+TOOLS = ("retrieval", "run", "analysis")
+
+
+class EvidenceStats:
+    """Per-tool outcomes and latency, and what running them together saved."""
+
+    def __init__(self):
+        self.gathers = 0
+        self.wall_seconds = 0.0
+        self.sequential_seconds = 0.0  # sum of tool latencies, as if run in turn
+        self.tools = {name: {"calls": 0, "timeouts": 0, "errors": 0, "seconds": 0.0} for name in TOOLS}
+
+    def record(self, timings: dict, wall: float):
+        self.gathers += 1
+        self.wall_seconds += wall
+        for name, (outcome, seconds) in timings.items():
+            tool = self.tools[name]
+            tool["calls"] += 1
+            tool["seconds"] += seconds
+            if outcome == "timeout":
+                tool["timeouts"] += 1
+            elif outcome == "error":
+                tool["errors"] += 1
+            self.sequential_seconds += seconds
+
+    def stats(self) -> dict:
+        gathers = self.gathers or 1
+        return {
+            "enabled": settings.ta_tools_enabled,
+            "gathers": self.gathers,
+            "budget": settings.ta_gather_budget,
+            "mean_wall_ms": round(self.wall_seconds / gathers * 1000, 1),
+            "mean_sequential_ms": round(self.sequential_seconds / gathers * 1000, 1),
+            "tools": {
+                name: {
+                    "calls": tool["calls"],
+                    "timeouts": tool["timeouts"],
+                    "errors": tool["errors"],
+                    "mean_ms": round(tool["seconds"] / tool["calls"] * 1000, 1) if tool["calls"] else 0.0,
+                }
+                for name, tool in self.tools.items()
+            },
+        }
+
+
+# Stats instance
+evidence_stats = EvidenceStats()
+
+
+def get_evidence_stats() -> dict:
+    """Tool timing statistics for the stats endpoint."""
+    return evidence_stats.stats()
+
+
+async def run_tool(name: str, work: Awaitable, timeout: float, default) -> tuple:
+    """
+    Await one tool within `timeout` seconds.
+
+    Returns:
+        (result or `default`, outcome, seconds) where outcome is
+        "ok", "timeout" or "error" (e.g. the TA's sandbox was busy, so
+        the tool is left out of the prompt)
+    """
+    started = time.perf_counter()
+    try:
+        result = await asyncio.wait_for(work, max(0.0, timeout))
+        outcome = "ok"
+    except asyncio.TimeoutError:
+        result, outcome = default, "timeout"
+    except Exception as e:
+        print(f"⚠️ TA tool {name} failed: {e}")
+        result, outcome = default, "error"
+    return result, outcome, time.perf_counter() - started
+
+
+def format_evidence(run: Optional[dict], findings: list) -> str:
+    """Prompt text for the code run and static check results ("" if there are none)."""
+    parts = []
+    if run is not None:
+        if run.get("timed_out"):
+            parts.append("Running the code timed out (it may never finish, e.g. an infinite loop).")
+        else:
+            status = "finished without errors" if run.get("success") else "failed"
+            parts.append(f"Running the code (no input given) {status}.")
+        if run.get("output"):
+            parts.append(f"Output:\n{run['output']}")
+        if run.get("error"):
+            parts.append(f"Error:\n{run['error']}")
+    if findings:
+        parts.append("Static checks:\n" + "\n".join(f"- {finding}" for finding in findings))
+    return "\n\n".join(parts)
+
+
+async def gather_evidence(retrieval: Awaitable, student_code: str, language: str = "python") -> dict:
+    """
+    Run retrieval, the sandboxed code run and static analysis concurrently.
+
+    Args:
+        retrieval: Awaitable returning (chunks, sources), e.g. retrieve_context in a thread
+        student_code: The student's current code
+        language: Language of the code
+
+    Returns:
+        dict with chunks, sources, evidence (prompt text from the run and
+        static checks) and timings ({tool: (outcome, seconds)})
+    """
+    budget = settings.ta_gather_budget
+    jobs = {"retrieval": run_tool("retrieval", retrieval, min(settings.ta_retrieval_timeout, budget), ([], []))}
+    if settings.ta_tools_enabled and student_code.strip():
+        # Shielded: a run past the deadline keeps its admission slot until the
+        # sandbox thread is really done, instead of freeing it while the
+        # program still runs (with result_cache_enabled, the finished run
+        # also answers the next question about the same code)
+        run = asyncio.ensure_future(analyze_code_output(student_code, language))
+        run.add_done_callback(lambda task: task.cancelled() or task.exception())
+        jobs["run"] = run_tool("run", asyncio.shield(run), min(settings.ta_run_timeout, budget), None)
+        jobs["analysis"] = run_tool(
+            "analysis",
+            asyncio.to_thread(static_analysis, student_code, language),
+            min(settings.ta_analysis_timeout, budget),
+            []
+        )
+
+    started = time.perf_counter()
+    results = dict(zip(jobs, await asyncio.gather(*jobs.values())))
+    timings = {name: (outcome, seconds) for name, (_, outcome, seconds) in results.items()}
+    evidence_stats.record(timings, time.perf_counter() - started)
+
+    chunks, sources = results["retrieval"][0]
+    run_result = results["run"][0] if "run" in results else None
+    findings = results["analysis"][0] if "analysis" in results else []
+    return {
+        "chunks": chunks,
+        "sources": sources,
+        "evidence": format_evidence(run_result, findings),
+        "timings": timings,
+    }
@@ -0,0 +1 @@
+"""LLM package initialization."""
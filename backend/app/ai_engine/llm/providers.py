@@ -0,0 +1,211 @@
+"""
+LLM Providers
+One interface over the chat completion backends: the hosted Groq API and
+any server speaking the OpenAI chat completions protocol (the local stub
+server used for tests and load runs, or a self-hosted model).
+
+Providers make exactly one attempt per call and report failures as
+LLMError, marked retryable for rate limits, server errors, timeouts and
+connection problems. Retries, deadlines, rate limiting and the circuit
+breaker live in `resilience.py`.
+"""
+
+import json
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, List, Optional
+
+import groq
+import httpx
+
+
+# HTTP statuses worth another attempt: request timeout, rate limit, server errors
+RETRYABLE_STATUSES = frozenset({408, 409, 429, 500, 502, 503, 504})
+
+
+class LLMError(Exception):
+    """A failed completion attempt."""
+
+    def __init__(self, message: str, status: Optional[int] = None, retryable: bool = False, retry_after: Optional[float] = None):
+        self.status = status
+        self.retryable = retryable
+        self.retry_after = retry_after
+        super().__init__(message)
+
+
+class LLMUnavailableError(LLMError):
+    """Raised without calling upstream: the circuit is open or the rate limit would be exceeded."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message, status=503, retryable=False, retry_after=retry_after)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds from a Retry-After header (only the delta-seconds form)."""
+    try:
+        return max(0.0, float(value)) if value else None
+    except ValueError:
+        return None
+
+
+def status_error(status: int, message: str, retry_after: Optional[str] = None) -> LLMError:
+    return LLMError(
+        f"LLM request failed ({status}): {message}",
+        status=status,
+        retryable=status in RETRYABLE_STATUSES,
+        retry_after=parse_retry_after(retry_after)
+    )
+
+
+class LLMProvider(ABC):
+    """Chat completion backend. Subclasses implement one attempt per call."""
+
+    name = "base"
+
+    @abstractmethod
+    async def complete(self, messages: List[dict], max_tokens: int, temperature: float) -> str:
+        """The full answer to `messages`."""
+
+    @abstractmethod
+    def stream(self, messages: List[dict], max_tokens: int, temperature: float) -> AsyncIterator[str]:
+        """The answer to `messages`, piece by piece as it is generated."""
+
+    async def close(self):
+        """Release pooled connections."""
+
+
+class OpenAICompatibleProvider(LLMProvider):
+    """A server implementing POST {base_url}/chat/completions, with SSE streaming."""
+
+    name = "openai"
+
+    def __init__(self, base_url: str, api_key: str, model: str, timeout: float, max_connections: int):
+        self.model = model
+        headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self.client = httpx.AsyncClient(
+            base_url=base_url.rstrip("/"),
+            headers=headers,
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections
+            )
+        )
+
+    def payload(self, messages: List[dict], max_tokens: int, temperature: float, stream: bool) -> dict:
+        return {
+            "model": self.model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "stream": stream,
+        }
+
+    async def complete(self, messages: List[dict], max_tokens: int, temperature: float) -> str:
+        try:
+            response = await self.client.post(
+                "/chat/completions",
+                json=self.payload(messages, max_tokens, temperature, False)
+            )
+        except httpx.TimeoutException as e:
+            raise LLMError(f"LLM request timed out: {e!r}", retryable=True) from e
+        except httpx.TransportError as e:
+            raise LLMError(f"LLM connection failed: {e!r}", retryable=True) from e
+        if response.status_code != 200:
+            raise status_error(response.status_code, response.text[:200], response.headers.get("retry-after"))
+        return response.json()["choices"][0]["message"]["content"] or ""
+
+    async def stream(self, messages: List[dict], max_tokens: int, temperature: float) -> AsyncIterator[str]:
+        try:
+            async with self.client.stream(
+                "POST",
+                "/chat/completions",
+                json=self.payload(messages, max_tokens, temperature, True)
+            ) as response:
+                if response.status_code != 200:
+                    body = (await response.aread()).decode("utf-8", "replace")
+                    raise status_error(response.status_code, body[:200], response.headers.get("retry-after"))
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        return
+                    choices = json.loads(data).get("choices") or [{}]
+                    delta = choices[0].get("delta", {}).get("content")
+                    if delta:
+                        yield delta
+        except httpx.TimeoutException as e:
+            raise LLMError(f"LLM request timed out: {e!r}", retryable=True) from e
+        except httpx.TransportError as e:
+            raise LLMError(f"LLM connection failed: {e!r}", retryable=True) from e
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class GroqProvider(LLMProvider):
+    """The Groq API through its SDK, with the SDK's own retries turned off."""
+
+    name = "groq"
+
+    def __init__(self, api_key: str, model: str, timeout: float, max_connections: int):
+        self.model = model
+        self.client = groq.AsyncGroq(
+            api_key=api_key,
+            timeout=timeout,
+            max_retries=0,
+            http_client=httpx.AsyncClient(
+                timeout=timeout,
+                limits=httpx.Limits(
+                    max_connections=max_connections,
+                    max_keepalive_connections=max_connections
+                )
+            )
+        )
+
+    def translate(self, e: Exception) -> Optional[LLMError]:
+        """LLMError for a Groq SDK exception, None for anything else."""
+        if isinstance(e, groq.APIStatusError):
+            return status_error(e.status_code, e.message, e.response.headers.get("retry-after"))
+        if isinstance(e, groq.APITimeoutError):
+            return LLMError(f"LLM request timed out: {e}", retryable=True)
+        if isinstance(e, groq.APIConnectionError):
+            return LLMError(f"LLM connection failed: {e}", retryable=True)
+        return None
+
+    async def complete(self, messages: List[dict], max_tokens: int, temperature: float) -> str:
+        try:
+            chat_completion = await self.client.chat.completions.create(
+                messages=messages,
+                model=self.model,
+                temperature=temperature,
+                max_tokens=max_tokens
+            )
+        except Exception as e:
+            error = self.translate(e)
+            if error is None:
+                raise
+            raise error from e
+        return chat_completion.choices[0].message.content or ""
+
+    async def stream(self, messages: List[dict], max_tokens: int, temperature: float) -> AsyncIterator[str]:
+        try:
+            stream = await self.client.chat.completions.create(
+                messages=messages,
+                model=self.model,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True
+            )
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    yield delta
+        except Exception as e:
+            error = self.translate(e)
+            if error is None:
+                raise
+            raise error from e
+
+    async def close(self):
+        await self.client.close()
@@ -0,0 +1,373 @@
+"""
+Resilient LLM Client
+Wraps a provider with the protections a whole class hitting one API key
+needs:
+
+- a deadline per call, covering rate-limit waits, attempts and backoff
+- retries with full-jitter exponential backoff on 429, 5xx, timeouts and
+  connection errors (honouring Retry-After), before any output was sent
+- token buckets for requests and tokens per minute, set to the account's
+  quota, so bursts queue here instead of coming back as 429s
+- a circuit breaker that fails calls immediately while the upstream keeps
+  failing (server errors, timeouts, connection errors; a 429 only means
+  slow down), and lets one trial call through after a cool-down
+"""
+
+import asyncio
+import random
+import time
+from typing import AsyncIterator, List, Optional
+
+from app.core.config import settings
+from app.ai_engine.prompt_builder import estimate_tokens
+from app.ai_engine.llm.providers import (
+    GroqProvider,
+    LLMError,
+    LLMProvider,
+    LLMUnavailableError,
+    OpenAICompatibleProvider,
+)
+
+
+class TokenBucket:
+    """
+    `rate_per_minute` units refilled continuously, up to one minute's worth.
+    Waiters are served in arrival order.
+    """
+
+    def __init__(self, rate_per_minute: float):
+        self.capacity = float(rate_per_minute)
+        self.rate = rate_per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float, deadline: float) -> float:
+        """
+        Take `amount` units, waiting for the refill if needed.
+
+        Returns:
+            Seconds waited
+
+        Raises:
+            LLMUnavailableError: If the units would not be available before `deadline`
+        """
+        amount = min(amount, self.capacity)
+        started = time.monotonic()
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return time.monotonic() - started
+                wait = (amount - self.tokens) / self.rate
+                if time.monotonic() + wait > deadline:
+                    raise LLMUnavailableError(
+                        "The TA is answering a lot of questions right now.",
+                        retry_after=wait
+                    )
+                await asyncio.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    Closed while calls succeed; open (failing fast) after `failures`
+    consecutive upstream failures; half-open after `cooldown` seconds,
+    when a single trial call decides whether it closes or opens again.
+    """
+
+    def __init__(self, failures: int, cooldown: float):
+        self.threshold = max(1, failures)
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial = False
+        self.trips = 0
+        self.rejected = 0
+
+    def check(self):
+        """
+        Raises:
+            LLMUnavailableError: If the circuit is open and still cooling down
+        """
+        if self.state == "open":
+            remaining = self.opened_at + self.cooldown - time.monotonic()
+            if remaining > 0:
+                self.rejected += 1
+                raise LLMUnavailableError("The AI service is unavailable right now.", retry_after=remaining)
+
+    def before(self):
+        """
+        Start an upstream attempt.
+
+        Raises:
+            LLMUnavailableError: If the call must not go upstream now
+        """
+        if self.state == "closed":
+            return
+        self.check()
+        self.state = "half_open"
+        if self.trial:
+            self.rejected += 1
+            raise LLMUnavailableError("The AI service is unavailable right now.", retry_after=self.cooldown)
+        self.trial = True
+
+    def success(self):
+        self.state = "closed"
+        self.failures = 0
+        self.trial = False
+
+    def failure(self):
+        self.failures += 1
+        self.trial = False
+        if self.state == "half_open" or self.failures >= self.threshold:
+            if self.state != "open":
+                self.trips += 1
+                print(f"⚡ LLM circuit open for {self.cooldown:g}s after {self.failures} failures")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        """End a trial call that was neither a success nor an upstream failure."""
+        self.trial = False
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "trips": self.trips,
+            "rejected": self.rejected,
+        }
+
+
+def is_outage(error: LLMError) -> bool:
+    """Whether a failed attempt says the upstream is down, as opposed to busy (429) or rejecting the request."""
+    if not error.retryable:
+        return False
+    return error.status is None or error.status == 408 or error.status >= 500
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """Full-jitter exponential backoff, or the server's Retry-After when it gave one."""
+    if retry_after is not None:
+        return min(retry_after, settings.llm_backoff_max)
+    return random.uniform(0, min(settings.llm_backoff_max, settings.llm_backoff_base * 2 ** attempt))
+
+
+class ResilientLLM:
+    """Completion calls through a provider with deadline, retries, rate limits and a circuit breaker."""
+
+    def __init__(self, provider: LLMProvider):
+        self.provider = provider
+        self.requests = TokenBucket(settings.llm_rate_limit_rpm) if settings.llm_rate_limit_rpm > 0 else None
+        self.tokens = TokenBucket(settings.llm_rate_limit_tpm) if settings.llm_rate_limit_tpm > 0 else None
+        self.breaker = CircuitBreaker(settings.llm_breaker_failures, settings.llm_breaker_cooldown)
+        self.calls = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.attempts = 0
+        self.retries = 0
+        self.throttled = 0
+        self.throttled_seconds = 0.0
+
+    async def _admit(self, messages: List[dict], max_tokens: int, deadline: float):
+        """Check the breaker, then wait for request and token quota."""
+        self.calls += 1
+        # Fail fast before queueing for quota that would be wasted
+        self.breaker.check()
+        waited = 0.0
+        if self.requests is not None:
+            waited += await self.requests.acquire(1, deadline)
+        if self.tokens is not None:
+            # Prompt estimate plus the most the answer may use
+            cost = sum(estimate_tokens(message["content"]) for message in messages) + max_tokens
+            waited += await self.tokens.acquire(cost, deadline)
+        if waited > 0.001:
+            self.throttled += 1
+            self.throttled_seconds += waited
+
+    def _retry_delay(self, error: LLMError, attempt: int, deadline: float) -> Optional[float]:
+        """Seconds to wait before the next attempt, or None to give up."""
+        if not error.retryable or attempt >= settings.llm_max_retries:
+            return None
+        delay = backoff_delay(attempt, error.retry_after)
+        if time.monotonic() + delay >= deadline:
+            return None
+        return delay
+
+    def _attempt_failed(self, error: LLMError):
+        if is_outage(error):
+            self.breaker.failure()
+        else:
+            # Rate limited, bad request, auth error: the upstream is up
+            self.breaker.release()
+
+    async def complete(self, messages: List[dict], max_tokens: int = 1024, temperature: float = 0.3, deadline: Optional[float] = None) -> str:
+        """
+        The full answer to `messages`, within `deadline` seconds
+        (default `settings.llm_deadline`).
+
+        Raises:
+            LLMUnavailableError: If the circuit is open or the rate limit allows no call in time
+            LLMError: If the last attempt failed
+        """
+        deadline = time.monotonic() + (deadline if deadline is not None else settings.llm_deadline)
+        await self._admit(messages, max_tokens, deadline)
+        attempt = 0
+        while True:
+            self.breaker.before()
+            self.attempts += 1
+            try:
+                answer = await asyncio.wait_for(
+                    self.provider.complete(messages, max_tokens, temperature),
+                    max(0.0, deadline - time.monotonic())
+                )
+            except (LLMError, asyncio.TimeoutError) as e:
+                error = e if isinstance(e, LLMError) else LLMError("LLM call exceeded its deadline", retryable=True)
+                self._attempt_failed(error)
+                delay = self._retry_delay(error, attempt, deadline)
+                if delay is None:
+                    self.failed += 1
+                    if error is e:
+                        raise
+                    raise error from e
+                attempt += 1
+                self.retries += 1
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                self.breaker.release()
+                raise
+            self.breaker.success()
+            self.succeeded += 1
+            return answer
+
+    async def stream(self, messages: List[dict], max_tokens: int = 1024, temperature: float = 0.3) -> AsyncIterator[str]:
+        """
+        The answer to `messages` as it is generated. An attempt that fails
+        after the first piece was yielded is not retried.
+
+        Raises:
+            LLMUnavailableError: If the circuit is open or the rate limit allows no call in time
+            LLMError: If the last attempt failed
+        """
+        deadline = time.monotonic() + settings.llm_deadline
+        await self._admit(messages, max_tokens, deadline)
+        attempt = 0
+        while True:
+            self.breaker.before()
+            self.attempts += 1
+            started = False
+            pieces = self.provider.stream(messages, max_tokens, temperature)
+            try:
+                while True:
+                    try:
+                        piece = await asyncio.wait_for(
+                            pieces.__anext__(),
+                            max(0.0, deadline - time.monotonic())
+                        )
+                    except StopAsyncIteration:
+                        break
+                    started = True
+                    yield piece
+            except (LLMError, asyncio.TimeoutError) as e:
+                error = e if isinstance(e, LLMError) else LLMError("LLM call exceeded its deadline", retryable=True)
+                self._attempt_failed(error)
+                delay = None if started else self._retry_delay(error, attempt, deadline)
+                if delay is None:
+                    self.failed += 1
+                    if error is e:
+                        raise
+                    raise error from e
+                attempt += 1
+                self.retries += 1
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # Includes the consumer closing the stream early
+                self.breaker.release()
+                raise
+            finally:
+                await pieces.aclose()
+            self.breaker.success()
+            self.succeeded += 1
+            return
+
+    async def close(self):
+        await self.provider.close()
+
+    def stats(self) -> dict:
+        return {
+            "provider": self.provider.name,
+            "calls": self.calls,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "attempts": self.attempts,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "throttled_seconds": round(self.throttled_seconds, 3),
+            "breaker": self.breaker.stats(),
+        }
+
+
+def create_provider() -> LLMProvider:
+    """
+    The provider selected by `settings.llm_provider`.
+
+    Raises:
+        ValueError: If the Groq provider is selected without an API key
+    """
+    if settings.llm_provider == "openai":
+        return OpenAICompatibleProvider(
+            settings.llm_base_url,
+            settings.llm_api_key,
+            settings.groq_model,
+            settings.llm_timeout,
+            settings.llm_max_connections
+        )
+    if not settings.groq_api_key:
+        raise ValueError("GROQ_API_KEY not set. Please create a .env file in the backend folder with your Groq API key.")
+    return GroqProvider(
+        settings.groq_api_key,
+        settings.groq_model,
+        settings.llm_timeout,
+        settings.llm_max_connections
+    )
+
+
+# Shared client: one connection pool, one rate limiter and one breaker per process
+llm: Optional[ResilientLLM] = None
+
+
+def get_llm() -> ResilientLLM:
+    """
+    Get the shared LLM client, creating it on first use.
+
+    Raises:
+        ValueError: If the provider is not configured
+    """
+    global llm
+    if llm is None:
+        llm = ResilientLLM(create_provider())
+    return llm
+
+
+async def close_llm():
+    """Close the shared client's connection pool (called on shutdown)."""
+    global llm
+    if llm is not None:
+        await llm.close()
+        llm = None
+
+
+def get_llm_stats() -> dict:
+    """LLM call statistics for the stats endpoint."""
+    if llm is None:
+        return {"provider": settings.llm_provider, "calls": 0}
+    return llm.stats()
@@ -0,0 +1,150 @@
+"""
+LLM Stub Server
+A local OpenAI-compatible chat completions endpoint for tests and load
+runs, so they neither spend the Groq quota nor depend on its latency.
+Answers are canned text streamed at a fixed rate; latency, rate-limit
+responses and server errors can be injected.
+
+Usage:
+    python -m app.ai_engine.llm.stub_server --port 9000 --latency 0.5 --error-rate 0.05
+
+and run the backend with LLM_PROVIDER=openai LLM_BASE_URL=http://127.0.0.1:9000/v1
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+# Behaviour, set from the command line
+config = {
+    "latency": 0.2,  # seconds before the first token
+    "tokens_per_second": 200.0,
+    "answer_tokens": 80,
+    "rate_limit_rate": 0.0,  # fraction of requests answered 429
+    "error_rate": 0.0,  # fraction of requests answered 500
+    "retry_after": 1,  # seconds, sent with 429s
+}
+
+counters = {"requests": 0, "streams": 0, "rate_limited": 0, "errors": 0}
+
+FILLER = (
+    "What do you expect this line to do, and what does it actually do? Try printing the "
+    "value just before the error and compare it with the loop bounds."
+).split()
+
+app = FastAPI(title="LLM Stub Server")
+
+
+def answer_words(messages: list) -> list:
+    """Canned answer echoing the start of the last message, `answer_tokens` words long."""
+    last = messages[-1]["content"] if messages else ""
+    words = ["Stub", "answer", "to:"] + last.split()[:8] + ["--"]
+    while len(words) < config["answer_tokens"]:
+        words.extend(FILLER)
+    return words[:config["answer_tokens"]]
+
+
+def injected_failure():
+    """A 429 or 500 response for this request, or None."""
+    roll = random.random()
+    if roll < config["rate_limit_rate"]:
+        counters["rate_limited"] += 1
+        return JSONResponse(
+            status_code=429,
+            content={"error": {"message": "Rate limit reached", "type": "rate_limit_exceeded"}},
+            headers={"Retry-After": str(config["retry_after"])}
+        )
+    if roll < config["rate_limit_rate"] + config["error_rate"]:
+        counters["errors"] += 1
+        return JSONResponse(
+            status_code=500,
+            content={"error": {"message": "Injected server error", "type": "server_error"}}
+        )
+    return None
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    counters["requests"] += 1
+    failure = injected_failure()
+    if failure is not None:
+        return failure
+
+    words = answer_words(body.get("messages", []))
+    model = body.get("model", "stub")
+    completion_id = f"chatcmpl-stub-{counters['requests']}"
+    await asyncio.sleep(config["latency"])
+
+    if not body.get("stream"):
+        await asyncio.sleep(len(words) / config["tokens_per_second"])
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": " ".join(words)},
+                "finish_reason": "stop",
+            }],
+            "usage": {"completion_tokens": len(words)},
+        }
+
+    counters["streams"] += 1
+
+    async def events():
+        for i, word in enumerate(words):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": word if i == 0 else f" {word}"}, "finish_reason": None}],
+            }
+            yield f"data: {json.dumps(chunk)}\n\n"
+            await asyncio.sleep(1 / config["tokens_per_second"])
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/v1/models")
+async def models():
+    return {"object": "list", "data": [{"id": "stub", "object": "model"}]}
+
+
+@app.get("/stats")
+async def stats():
+    return {**counters, "config": config}
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="OpenAI-compatible LLM stub server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=config["latency"], help="Seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=config["tokens_per_second"])
+    parser.add_argument("--answer-tokens", type=int, default=config["answer_tokens"])
+    parser.add_argument("--rate-limit-rate", type=float, default=config["rate_limit_rate"], help="Fraction of requests answered 429")
+    parser.add_argument("--error-rate", type=float, default=config["error_rate"], help="Fraction of requests answered 500")
+    parser.add_argument("--retry-after", type=int, default=config["retry_after"], help="Retry-After seconds sent with 429s")
+    args = parser.parse_args()
+    config.update(
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        answer_tokens=args.answer_tokens,
+        rate_limit_rate=args.rate_limit_rate,
+        error_rate=args.error_rate,
+        retry_after=args.retry_after,
+    )
+    print(f"🧪 LLM stub server on http://{args.host}:{args.port}/v1 ({config})")
+    uvicorn.run(app, host=args.host, port=args.port)
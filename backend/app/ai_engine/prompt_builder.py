@@ -0,0 +1,336 @@
+"""
+Prompt Builder
+Assembles the TA prompt within a token budget. The system prompt is read
+from disk once and again only when the file changes; retrieved chunks
+are de-duplicated and added in rank order until the budget is spent; the
+student's code is cut down to the lines around the traceback or the
+identifiers the question mentions; what running and checking the code
+showed is capped; earlier turns of the conversation come already
+bounded from the conversation memory.
+
+Token counts are estimated (no tokenizer for the hosted model is
+available locally) and recorded per section for every prompt.
+"""
+
+import re
+import threading
+from collections import deque
+from pathlib import Path
+from typing import List, Optional
+
+from app.core.config import settings
+
+
+# Words and single punctuation marks; a word costs about one token per 4 characters
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+# Traceback / question references to a line of the student's code
+LINE_REFERENCE = re.compile(r"\bline\s+(\d+)", re.IGNORECASE)
+
+# Identifiers in the question that may point at lines of code
+IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]{2,}")
+
+# Chunks sharing MIN..MAX characters at an edge are overlapping splits
+# (the ingest splitter overlaps by 100)
+MIN_OVERLAP = 40
+MAX_OVERLAP = 200
+
+# Smallest remainder of the budget worth filling with a partial chunk
+MIN_PARTIAL_TOKENS = 50
+
+# Code block language tag per sandbox language
+CODE_FENCES = {"python": "python", "python3": "python", "cpp": "cpp", "c": "c", "java": "java"}
+
+# Line comment start per sandbox language, for the omitted-lines marker
+LINE_COMMENTS = {"python": "#", "python3": "#", "cpp": "//", "c": "//", "java": "//"}
+
+# Prompts kept for the stats endpoint
+RECENT_PROMPTS = 20
+
+INSTRUCTIONS = (
+    "Please respond as a helpful teaching assistant. Use the Socratic method: guide the student "
+    "to discover the answer themselves through questions, hints, and explanations. Reference the "
+    "course materials when relevant."
+)
+
+NO_CONTEXT = "No relevant context found in knowledge base."
+
+FALLBACK_SYSTEM_PROMPT = "You are a helpful teaching assistant for a programming course. Guide students using the Socratic method - ask leading questions rather than giving direct answers."
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count of `text`."""
+    return sum((len(piece) + 3) // 4 for piece in TOKEN_PATTERN.findall(text))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """The longest prefix of `text` (cut at whitespace) within `max_tokens`."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    used = 0
+    end = 0
+    for match in re.finditer(r"\S+\s*", text):
+        used += estimate_tokens(match.group())
+        if used > max_tokens:
+            break
+        end = match.end()
+    return text[:end].rstrip() + " ..."
+
+
+class SystemPrompt:
+    """A prompt file cached in memory, re-read when its modification time changes."""
+
+    def __init__(self, path: Path, fallback: str):
+        self.path = path
+        self.fallback = fallback
+        self._state: Optional[tuple] = None  # (mtime, text)
+        self._lock = threading.Lock()
+
+    def get(self) -> str:
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return self.fallback
+        state = self._state
+        if state is None or state[0] != mtime:
+            with self._lock:
+                state = self._state
+                if state is None or state[0] != mtime:
+                    state = self._state = (mtime, self.path.read_text(encoding="utf-8"))
+        return state[1]
+
+
+def dedupe_chunks(chunks: List[dict]) -> List[dict]:
+    """
+    Drop chunks repeated or contained in a better-ranked one, and strip the
+    part a chunk shares with the previous split of the same file.
+
+    Args:
+        chunks: dicts with source and text, best first
+    """
+    kept: List[dict] = []
+    for chunk in chunks:
+        text = chunk["text"].strip()
+        normalized = " ".join(text.split())
+        duplicate = False
+        for other in kept:
+            other_normalized = " ".join(other["text"].split())
+            if normalized in other_normalized:
+                duplicate = True
+                break
+            if other["source"] != chunk["source"]:
+                continue
+            # Text splitter overlap: the end of one split starts the next
+            overlap = min(len(text), len(other["text"]), MAX_OVERLAP)
+            while overlap >= MIN_OVERLAP and not other["text"].endswith(text[:overlap]):
+                overlap -= 1
+            if overlap >= MIN_OVERLAP:
+                text = text[overlap:].lstrip()
+        if not duplicate and text:
+            kept.append({**chunk, "text": text})
+    return kept
+
+
+def focus_lines(lines: List[str], question: str) -> List[int]:
+    """Indexes of code lines the question points at, most relevant first."""
+    focus = []
+    for match in LINE_REFERENCE.finditer(question):
+        index = int(match.group(1)) - 1
+        if 0 <= index < len(lines) and index not in focus:
+            focus.append(index)
+
+    names = set(IDENTIFIER.findall(question))
+    if names:
+        hits = [
+            (sum(name in line for name in names), index)
+            for index, line in enumerate(lines)
+        ]
+        for count, index in sorted(hits, key=lambda hit: -hit[0])[:3]:
+            if count and index not in focus:
+                focus.append(index)
+    return focus
+
+
+def trim_code(code: str, question: str, max_tokens: int, language: str = "python") -> tuple:
+    """
+    Fit the student's code into `max_tokens`, keeping the lines around the
+    focus lines (or the top of the file) and marking what was left out
+    with a comment in the code's `language`.
+
+    Returns:
+        (code, trimmed)
+    """
+    if estimate_tokens(code) <= max_tokens:
+        return code, False
+
+    lines = code.splitlines()
+    costs = [estimate_tokens(line) + 1 for line in lines]
+    centers = focus_lines(lines, question) or [0]
+    keep = set()
+    used = 0
+    full = False
+    for radius in range(len(lines)):
+        for center in centers:
+            for index in {center - radius, center + radius}:
+                if 0 <= index < len(lines) and index not in keep:
+                    if used + costs[index] > max_tokens:
+                        full = True
+                        break
+                    keep.add(index)
+                    used += costs[index]
+            if full:
+                break
+        if full:
+            break
+
+    comment = LINE_COMMENTS.get(language.lower(), "#")
+    out = []
+    skipped_from = None
+    for index, line in enumerate(lines):
+        if index in keep:
+            if skipped_from is not None:
+                out.append(f"{comment} ... lines {skipped_from + 1}-{index} omitted ...")
+                skipped_from = None
+            out.append(line)
+        elif skipped_from is None:
+            skipped_from = index
+    if skipped_from is not None:
+        out.append(f"{comment} ... lines {skipped_from + 1}-{len(lines)} omitted ...")
+    return "\n".join(out), True
+
+
+class PromptStats:
+    """Token counts per section, summed over prompts, plus the most recent ones."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.prompts = 0
+        self.totals: dict = {}
+        self.code_trimmed = 0
+        self.chunks_dropped = 0
+        self.recent = deque(maxlen=RECENT_PROMPTS)
+
+    def record(self, report: dict):
+        with self._lock:
+            self.prompts += 1
+            for section, tokens in report["tokens"].items():
+                self.totals[section] = self.totals.get(section, 0) + tokens
+            self.code_trimmed += report["code_trimmed"]
+            self.chunks_dropped += report["chunks_dropped"]
+            self.recent.append(report)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "prompts": self.prompts,
+                "budget": settings.prompt_token_budget,
+                "mean_tokens": {
+                    section: round(total / self.prompts, 1)
+                    for section, total in self.totals.items()
+                },
+                "code_trimmed": self.code_trimmed,
+                "chunks_dropped": self.chunks_dropped,
+                "recent": list(self.recent),
+            }
+
+
+# Stats instance
+prompt_stats = PromptStats()
+
+
+def get_prompt_stats() -> dict:
+    """Prompt size statistics for the stats endpoint."""
+    return prompt_stats.stats()
+
+
+def build_prompt(
+    system_prompt: str,
+    chunks: List[dict],
+    question: str,
+    student_code: str,
+    evidence: str = "",
+    history: Optional[List[dict]] = None,
+    language: str = "python"
+) -> tuple:
+    """
+    Chat messages for one TA turn, within `settings.prompt_token_budget`.
+
+    The system prompt and instructions are always sent; the question, code
+    and evidence are capped; course material fills what is left, best
+    chunk first.
+
+    Args:
+        system_prompt: The TA system prompt
+        chunks: Retrieved chunks (dicts with source and text), best first
+        question: The student's question
+        student_code: The student's current code
+        evidence: Code run output and static check findings ("" for none)
+        history: Messages of the conversation so far, sent before the question
+        language: Language of the code, for its code block
+
+    Returns:
+        (messages, report) where report has the token count of each section
+    """
+    question = truncate_tokens(question, settings.prompt_question_max_tokens)
+    evidence = truncate_tokens(evidence, settings.prompt_evidence_max_tokens)
+    # Line numbers in a traceback point at the code worth keeping, too
+    traceback_lines = " ".join(match.group() for match in LINE_REFERENCE.finditer(evidence))
+    code, code_trimmed = trim_code(
+        student_code, f"{question}\n{traceback_lines}", settings.prompt_code_max_tokens, language
+    )
+
+    tokens = {
+        "system": estimate_tokens(system_prompt),
+        "instructions": estimate_tokens(INSTRUCTIONS),
+        "question": estimate_tokens(question),
+        "code": estimate_tokens(code),
+        "evidence": estimate_tokens(evidence),
+        "history": sum(estimate_tokens(message["content"]) for message in history or ()),
+    }
+    remaining = settings.prompt_token_budget - sum(tokens.values())
+
+    chunks = dedupe_chunks(chunks)
+    parts = []
+    for chunk in chunks:
+        part = f"[Source: {chunk['source']}]\n{chunk['text']}"
+        cost = estimate_tokens(part)
+        if cost > remaining:
+            if remaining >= MIN_PARTIAL_TOKENS:
+                part = truncate_tokens(part, remaining - 3)  # room for the " ..." marker
+                parts.append(part)
+                remaining -= estimate_tokens(part)
+            break
+        parts.append(part)
+        remaining -= cost
+    context = "\n\n---\n\n".join(parts) or NO_CONTEXT
+    evidence_section = f"\n## What Running the Code Shows\n{evidence}\n" if evidence else ""
+    fence = CODE_FENCES.get(language.lower(), "")
+    tokens["context"] = estimate_tokens(context)
+    tokens["total"] = sum(tokens.values())
+
+    messages = [
+        {"role": "system", "content": system_prompt},
+        *(history or ()),
+        {"role": "user", "content": f"""
+## Relevant Course Materials
+{context}
+
+## Student's Code
+```{fence}
+{code}
+```
+{evidence_section}
+## Student's Question
+{question}
+
+{INSTRUCTIONS}
+"""}
+    ]
+    report = {
+        "tokens": tokens,
+        "chunks_used": len(parts),
+        "chunks_dropped": len(chunks) - len(parts),
+        "code_trimmed": code_trimmed,
+    }
+    prompt_stats.record(report)
+    return messages, report
@@ -0,0 +1,198 @@
+"""
+Vector Backend Benchmark
+Compares the Chroma store with the flat memory-mapped index, plain and
+int8-quantized, on a synthetic collection the size of our knowledge
+base: time to open the store and answer the first query, top-k query
+latency, and the memory the opened store adds to the process. Then
+checks recall@k of the quantized index against the unquantized one for
+a few re-rank candidate counts.
+
+Each backend is measured in a fresh process, so none sees the others'
+imports or caches. Queries go by vector, so the embedding model is not
+part of the numbers.
+
+Run with:
+    python -m app.ai_engine.rag.benchmark [chunks] [queries]
+
+or check recall on a real flat collection (queries are its own chunk
+vectors with noise added):
+    python -m app.ai_engine.rag.benchmark --collection chroma_db/flat/<name>
+"""
+
+import argparse
+import multiprocessing
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from app.ai_engine.rag.flat_index import FlatCollection, FlatIndex, normalize, read_collection
+
+
+# all-MiniLM-L6-v2 embedding size
+DIMENSIONS = 384
+
+# Results per query, as in retrieval
+TOP_K = 3
+
+# Chunks per write while building the collections
+WRITE_BATCH = 1000
+
+# Synthetic chunks cluster around this many topics, like course material does
+TOPICS = 50
+
+# Recall is checked at these k, re-ranking this many int8 candidates
+# (k itself means no re-ranking beyond the approximate top k)
+RECALL_K = (TOP_K, 10)
+RERANK_CANDIDATES = (20, 50, 100)
+
+BACKENDS = ("chroma", "flat", "flat-int8")
+
+
+def rss_mb() -> float:
+    """Resident set size of this process in MB."""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def make_data(chunks: int, queries: int) -> tuple:
+    rng = np.random.default_rng(0)
+    topics = rng.standard_normal((TOPICS, DIMENSIONS))
+    vectors = normalize(topics[np.arange(chunks) % TOPICS] + 0.8 * rng.standard_normal((chunks, DIMENSIONS)))
+    probes = normalize(topics[rng.integers(0, TOPICS, queries)] + 0.8 * rng.standard_normal((queries, DIMENSIONS)))
+    texts = [f"chunk {i} " + "lorem ipsum " * 60 for i in range(chunks)]
+    metadatas = [{"source": f"concepts/topic_{i % TOPICS}.md", "section": f"Section {i}"} for i in range(chunks)]
+    return vectors, probes, texts, metadatas
+
+
+def build(backend: str, path: Path, vectors, texts: list, metadatas: list):
+    ids = [f"chunk-{i}" for i in range(len(texts))]
+    if backend.startswith("flat"):
+        collection = FlatCollection(path, quantize=backend == "flat-int8")
+    else:
+        import chromadb
+        collection = chromadb.PersistentClient(path=str(path)).get_or_create_collection("benchmark")
+    for start in range(0, len(ids), WRITE_BATCH):
+        end = start + WRITE_BATCH
+        collection.upsert(
+            ids=ids[start:end],
+            embeddings=vectors[start:end].tolist(),
+            documents=texts[start:end],
+            metadatas=metadatas[start:end]
+        )
+    if backend.startswith("flat"):
+        collection.persist()
+
+
+def measure(backend: str, path: str, probes, results):
+    """Child process: open the store, run the queries, report timings and memory."""
+    baseline = rss_mb()
+    start = time.perf_counter()
+    if backend.startswith("flat"):
+        store = FlatIndex(Path(path))
+    else:
+        from langchain_chroma import Chroma
+        store = Chroma(collection_name="benchmark", persist_directory=path)
+    store.similarity_search_by_vector(probes[0].tolist(), k=TOP_K)
+    open_ms = (time.perf_counter() - start) * 1000
+
+    latencies = []
+    for probe in probes:
+        start = time.perf_counter()
+        store.similarity_search_by_vector(probe.tolist(), k=TOP_K)
+        latencies.append((time.perf_counter() - start) * 1000)
+    results.put({"open_ms": open_ms, "latencies": latencies, "rss_mb": rss_mb() - baseline})
+
+
+def summarize(latencies: list) -> str:
+    ordered = sorted(latencies)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return (
+        f"mean {statistics.mean(ordered):6.2f} ms | "
+        f"p50 {statistics.median(ordered):6.2f} ms | "
+        f"p95 {p95:6.2f} ms"
+    )
+
+
+def recall_at_k(exact: FlatIndex, quantized: FlatIndex, probes, k: int) -> float:
+    """Fraction of the exact top-k results the quantized index also returns."""
+    found = 0
+    for probe in probes:
+        expected = {doc.id for doc in exact.similarity_search_by_vector(probe.tolist(), k=k)}
+        returned = {doc.id for doc in quantized.similarity_search_by_vector(probe.tolist(), k=k)}
+        found += len(expected & returned)
+    return found / (k * len(probes))
+
+
+def report_recall(exact_path: Path, quantized_path: Path, probes):
+    exact = FlatIndex(exact_path)
+    print("   recall@k of flat-int8 against flat")
+    for k in RECALL_K:
+        results = [f"no re-rank {recall_at_k(exact, FlatIndex(quantized_path, rerank_candidates=k), probes, k):.3f}"]
+        for candidates in RERANK_CANDIDATES:
+            quantized = FlatIndex(quantized_path, rerank_candidates=candidates)
+            results.append(f"re-rank {candidates} {recall_at_k(exact, quantized, probes, k):.3f}")
+        print(f"   k={k:<3} " + " | ".join(results))
+
+
+def check_collection(path: Path, queries: int):
+    """Recall of an int8 copy of a persisted flat collection against the collection itself."""
+    current = read_collection(path)
+    if current is None:
+        print(f"⚠️ No flat collection at {path}")
+        return
+    _, matrix, ids, documents, metadatas, _, _ = current
+    rng = np.random.default_rng(0)
+    picks = rng.integers(0, len(ids), queries)
+    probes = normalize(matrix[picks] + 0.05 * rng.standard_normal((queries, matrix.shape[1])))
+
+    with tempfile.TemporaryDirectory() as workdir:
+        exact = FlatCollection(Path(workdir) / "flat", quantize=False)
+        quantized = FlatCollection(Path(workdir) / "flat-int8", quantize=True)
+        for collection in (exact, quantized):
+            collection.upsert(ids, matrix, documents, metadatas)
+            collection.persist()
+        print(f"📊 {path}: {len(ids)} chunks x {matrix.shape[1]} dims, {queries} queries\n")
+        report_recall(exact.path, quantized.path, probes)
+
+
+def main(chunks: int = 5000, queries: int = 200):
+    vectors, probes, texts, metadatas = make_data(chunks, queries)
+    context = multiprocessing.get_context("spawn")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        print(f"📊 {chunks} chunks x {DIMENSIONS} dims, {queries} queries, top {TOP_K}\n")
+        for backend in BACKENDS:
+            path = Path(workdir) / backend
+            start = time.perf_counter()
+            build(backend, path, vectors, texts, metadatas)
+            build_s = time.perf_counter() - start
+
+            results = context.Queue()
+            process = context.Process(target=measure, args=(backend, str(path), probes, results))
+            process.start()
+            report = results.get()
+            process.join()
+
+            print(f"   {backend:<9} build {build_s:6.2f} s | open+first query {report['open_ms']:7.1f} ms | +{report['rss_mb']:.0f} MB RSS")
+            print(f"   {'':<9} query {summarize(report['latencies'])}")
+            print()
+
+        report_recall(Path(workdir) / "flat", Path(workdir) / "flat-int8", probes)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the vector backends")
+    parser.add_argument("chunks", type=int, nargs="?", default=5000)
+    parser.add_argument("queries", type=int, nargs="?", default=200)
+    parser.add_argument("--collection", help="Only check int8 recall on this persisted flat collection")
+    args = parser.parse_args()
+    if args.collection:
+        check_collection(Path(args.collection), args.queries)
+    else:
+        main(args.chunks, args.queries)
@@ -0,0 +1,354 @@
+"""
+Flat Vector Index
+Exact nearest-neighbour search over a contiguous float32 matrix of
+normalized embeddings. For a knowledge base of a few thousand chunks a
+single matrix-vector product is fast enough, and the index starts instantly
+and costs little memory: the matrix is a memory-mapped .npy and only
+document text and metadata live in a side JSON file.
+
+Selected with VECTOR_BACKEND=flat. Each collection is a directory:
+    <name>/vectors-<version>.npy   (n, dim) float32, rows L2-normalized
+    <name>/codes-<version>.npy     (n, dim) int8, with FLAT_QUANTIZATION=int8
+    <name>/scales-<version>.npy    (n,) float32 scale of each row of codes
+    <name>/meta.json               version, ids, documents, metadatas
+
+With int8 codes, searches scan the codes (a quarter of the bytes) for
+approximate scores and re-score only the best candidates against the
+float32 rows. Those rows are read from the file rather than through the
+memory map, so the float matrix never becomes part of the process's
+resident memory.
+"""
+
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Any, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from app.ai_engine.rag.lexical import matches
+
+
+META_FILE = "meta.json"
+
+# Rows of int8 codes widened to float32 at a time during a quantized scan
+# (small enough for the widened block to stay in CPU cache)
+SCAN_BLOCK = 256
+
+
+def normalize(vectors) -> np.ndarray:
+    """float32 copy of `vectors` with each row scaled to unit length."""
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def quantize(matrix) -> tuple:
+    """
+    Per-row symmetric int8 quantization.
+
+    Returns:
+        (codes, scales) with row i approximately codes[i] * scales[i]
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    scales = np.maximum(np.abs(matrix).max(axis=-1, initial=0.0), 1e-12) / 127.0
+    codes = np.clip(np.rint(matrix / scales[..., None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def approximate_scores(codes: np.ndarray, scales: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """Dot products of the dequantized rows with `query`, widening a block of codes at a time."""
+    scores = np.empty(len(codes), dtype=np.float32)
+    for start in range(0, len(codes), SCAN_BLOCK):
+        end = start + SCAN_BLOCK
+        scores[start:end] = codes[start:end].astype(np.float32) @ query
+    return scores * scales
+
+
+def read_rows(matrix: np.memmap, rows) -> np.ndarray:
+    """
+    Copy of `matrix[rows]` read with plain file reads, so the pages stay
+    in the page cache instead of being mapped into this process.
+    """
+    row_bytes = matrix.shape[1] * matrix.itemsize
+    out = np.empty((len(rows), matrix.shape[1]), dtype=matrix.dtype)
+    try:
+        with open(matrix.filename, "rb", buffering=0) as f:
+            for i, row in enumerate(rows):
+                f.seek(matrix.offset + int(row) * row_bytes)
+                out[i] = np.frombuffer(f.read(row_bytes), dtype=matrix.dtype)
+    except FileNotFoundError:
+        # Replaced by a newer version; the mapping is still valid
+        return np.asarray(matrix[rows])
+    return out
+
+
+def read_collection(path: Path) -> Optional[tuple]:
+    """
+    Open a persisted collection.
+
+    Returns:
+        (version, matrix, ids, documents, metadatas, codes, scales) with
+        the arrays memory-mapped read-only (codes and scales None when
+        the collection is not quantized), or None if nothing is
+        persisted yet
+    """
+    for _ in range(3):
+        try:
+            meta = json.loads((path / META_FILE).read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return None
+        try:
+            matrix = np.load(path / meta["vectors"], mmap_mode="r")
+            codes = scales = None
+            if meta.get("codes"):
+                codes = np.load(path / meta["codes"], mmap_mode="r")
+                scales = np.load(path / meta["scales"], mmap_mode="r")
+        except FileNotFoundError:
+            # A writer replaced the collection between the reads
+            continue
+        return meta["version"], matrix, meta["ids"], meta["documents"], meta["metadatas"], codes, scales
+    raise RuntimeError(f"Could not read flat index at {path}")
+
+
+def save_array(path: Path, array: np.ndarray):
+    """np.save to `path` through a temporary file and an atomic rename."""
+    with open(path.with_name(f"{path.name}.tmp"), "wb") as f:
+        np.save(f, array)
+    os.replace(path.with_name(f"{path.name}.tmp"), path)
+
+
+class FlatCollection:
+    """
+    Writer for one collection, with the subset of the Chroma collection
+    API ingestion uses (`upsert`, `delete`).
+
+    Changes are kept in memory on top of the memory-mapped rows and
+    written out by `persist`: new array files first, then the metadata
+    file that points at them, each with an atomic rename. Readers holding
+    the old mapping keep working. With `quantize`, int8 codes are written
+    next to the float32 rows (and added to a collection that lacks them,
+    or dropped when it is False); None keeps what is on disk.
+    """
+
+    def __init__(self, path: Path, quantize: Optional[bool] = None):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.quantize = bool(quantize)
+        self.rows: dict = {}  # id -> (vector, document, metadata)
+        self.version = 0
+        self.dirty = False
+        current = read_collection(self.path)
+        if current is not None:
+            self.version, matrix, ids, documents, metadatas, codes, _ = current
+            if quantize is None:
+                self.quantize = codes is not None
+            self.dirty = self.quantize != (codes is not None)
+            for row, chunk_id in enumerate(ids):
+                self.rows[chunk_id] = (matrix[row], documents[row], metadatas[row])
+
+    def upsert(self, ids: List[str], embeddings: list, documents: List[str], metadatas: List[dict]):
+        vectors = normalize(embeddings)
+        for chunk_id, vector, document, metadata in zip(ids, vectors, documents, metadatas):
+            self.rows[chunk_id] = (vector, document, metadata)
+        self.dirty = True
+
+    def delete(self, ids: Iterable[str]):
+        for chunk_id in ids:
+            if self.rows.pop(chunk_id, None) is not None:
+                self.dirty = True
+
+    def count(self) -> int:
+        return len(self.rows)
+
+    def persist(self):
+        """Write pending changes to disk."""
+        if not self.dirty and (self.path / META_FILE).exists():
+            return
+        previous = read_collection(self.path)
+        self.version += 1
+        vectors_name = f"vectors-{self.version}.npy"
+
+        ids = list(self.rows)
+        if ids:
+            matrix = np.stack([self.rows[chunk_id][0] for chunk_id in ids]).astype(np.float32, copy=False)
+        else:
+            matrix = np.zeros((0, 0), dtype=np.float32)
+        save_array(self.path / vectors_name, matrix)
+
+        codes_name = scales_name = None
+        if self.quantize:
+            codes_name = f"codes-{self.version}.npy"
+            scales_name = f"scales-{self.version}.npy"
+            codes, scales = quantize(matrix)
+            save_array(self.path / codes_name, codes)
+            save_array(self.path / scales_name, scales)
+
+        meta = {
+            "version": self.version,
+            "vectors": vectors_name,
+            "codes": codes_name,
+            "scales": scales_name,
+            "ids": ids,
+            "documents": [self.rows[chunk_id][1] for chunk_id in ids],
+            "metadatas": [self.rows[chunk_id][2] for chunk_id in ids],
+        }
+        tmp = self.path / f"{META_FILE}.tmp"
+        tmp.write_text(json.dumps(meta), encoding="utf-8")
+        os.replace(tmp, self.path / META_FILE)
+        self.dirty = False
+
+        # Re-point rows at the new file so the old one can be removed
+        mapped = np.load(self.path / vectors_name, mmap_mode="r")
+        for row, chunk_id in enumerate(ids):
+            vector, document, metadata = self.rows[chunk_id]
+            self.rows[chunk_id] = (mapped[row], document, metadata)
+        if previous is not None:
+            for prefix in ("vectors", "codes", "scales"):
+                (self.path / f"{prefix}-{previous[0]}.npy").unlink(missing_ok=True)
+
+
+class FlatIndex(VectorStore):
+    """
+    LangChain vector store over a flat collection.
+
+    Top-k is an exact dot product (cosine similarity, as rows and queries
+    are normalized) followed by `argpartition`. A metadata filter (e.g. one
+    lab) restricts the product to that partition's rows, which are
+    computed once per filter. Searches pick up changes written by another
+    process or a sync when the metadata file changes.
+
+    When the collection has int8 codes, the product runs over the codes
+    and the best `rerank_candidates` rows are re-scored exactly, so the
+    returned scores are still float32 cosine similarities.
+    """
+
+    def __init__(self, path: Path, embedding_function: Optional[Embeddings] = None, rerank_candidates: int = 50):
+        self.path = Path(path)
+        self._embedding_function = embedding_function
+        self.rerank_candidates = rerank_candidates
+        self._state: Optional[tuple] = None  # (meta mtime, version, matrix, ids, documents, metadatas, codes, scales, partitions)
+        self._lock = threading.Lock()
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self._embedding_function
+
+    def _current(self) -> Optional[tuple]:
+        """Loaded collection, reopened if it changed on disk."""
+        try:
+            mtime = (self.path / META_FILE).stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+        state = self._state
+        if state is None or state[0] != mtime:
+            with self._lock:
+                state = self._state
+                if state is None or state[0] != mtime:
+                    current = read_collection(self.path)
+                    if current is None:
+                        return None
+                    state = self._state = (mtime, *current, {})
+        return state
+
+    def __len__(self) -> int:
+        state = self._current()
+        return len(state[3]) if state else 0
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [f"{time.time_ns()}-{i}" for i in range(len(texts))]
+        collection = FlatCollection(self.path)
+        collection.upsert(ids, self._embedding_function.embed_documents(texts), texts, metadatas)
+        collection.persist()
+        return ids
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        collection = FlatCollection(self.path)
+        collection.delete(ids or [])
+        collection.persist()
+        return True
+
+    def similarity_search_by_vector_with_score(self, embedding: List[float], k: int = 4, filter: Optional[dict] = None) -> List[Tuple[Document, float]]:
+        """Top `k` chunks by cosine similarity, optionally only those whose metadata matches `filter`."""
+        state = self._current()
+        if state is None or not state[3]:
+            return []
+        _, _, matrix, ids, documents, metadatas, codes, scales, partitions = state
+        query = normalize(embedding)
+
+        if filter:
+            key = json.dumps(filter, sort_keys=True)
+            rows = partitions.get(key)
+            if rows is None:
+                rows = partitions[key] = np.flatnonzero(
+                    np.fromiter((matches(metadata, filter) for metadata in metadatas), dtype=bool, count=len(ids))
+                )
+            if not len(rows):
+                return []
+        else:
+            rows = None
+
+        if codes is not None:
+            # Approximate scan over the codes, then exact scores for the best candidates
+            if rows is not None:
+                approximate = approximate_scores(codes[rows], scales[rows], query)
+            else:
+                approximate = approximate_scores(codes, scales, query)
+            candidates = min(max(k, self.rerank_candidates), len(approximate))
+            positions = np.argpartition(-approximate, candidates - 1)[:candidates]
+            rows = rows[positions] if rows is not None else positions
+            scores = read_rows(matrix, rows) @ query
+        elif rows is not None:
+            scores = matrix[rows] @ query
+        else:
+            scores = matrix @ query
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        results = []
+        for position in top:
+            row = rows[position] if rows is not None else position
+            doc = Document(page_content=documents[row], metadata=metadatas[row], id=ids[row])
+            results.append((doc, float(scores[position])))
+        return results
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, filter: Optional[dict] = None, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k, filter)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: Optional[dict] = None, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(self._embedding_function.embed_query(query), k, filter)
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[dict] = None, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+    def _select_relevance_score_fn(self):
+        # Scores are already cosine similarities
+        return lambda score: score
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None, ids: Optional[List[str]] = None, path: Optional[Path] = None, **kwargs: Any) -> "FlatIndex":
+        if path is None:
+            raise ValueError("FlatIndex.from_texts needs a path")
+        index = cls(path, embedding)
+        index.add_texts(texts, metadatas, ids)
+        return index
+
+
+def list_collections(root: Path) -> List[str]:
+    root = Path(root)
+    if not root.exists():
+        return []
+    return sorted(entry.name for entry in root.iterdir() if entry.is_dir())
+
+
+def delete_collection(root: Path, name: str):
+    shutil.rmtree(Path(root) / name, ignore_errors=True)
@@ -0,0 +1,83 @@
+"""
+Hybrid Retrieval
+Combines BM25 keyword search with vector similarity. Both ranked lists
+are merged with reciprocal rank fusion, so a chunk that ranks well in
+either one surfaces without having to calibrate the two score scales.
+
+When the keyword match alone is decisive (a strong, clearly leading BM25
+hit), the lexical result is returned directly and the query is never
+embedded.
+"""
+
+import threading
+from typing import List, Optional
+
+from langchain_core.documents import Document
+
+from app.core.config import settings
+from app.ai_engine.rag.lexical import LexicalReader
+
+
+def fusion_key(doc: Document) -> tuple:
+    """Identity of a chunk across both retrievers (not every store returns ids)."""
+    return (doc.metadata.get("source", ""), doc.page_content)
+
+
+def reciprocal_rank_fusion(rankings: List[List[Document]], k: int, rrf_k: int) -> List[Document]:
+    """Top `k` documents by the sum of 1 / (rrf_k + rank) over the rankings."""
+    scores: dict = {}
+    docs: dict = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, 1):
+            key = fusion_key(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank)
+            docs.setdefault(key, doc)
+    top = sorted(scores, key=scores.get, reverse=True)[:k]
+    return [docs[key] for key in top]
+
+
+class HybridRetriever:
+    """
+    Vector store front end doing hybrid search in `similarity_search`,
+    so it can be used wherever the plain store was.
+    """
+
+    def __init__(self, vectorstore, lexical: LexicalReader):
+        self.vectorstore = vectorstore
+        self.lexical = lexical
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.fast_path = 0
+
+    def is_decisive(self, hits: list) -> bool:
+        """Whether the best keyword hit is strong and well ahead of the next one."""
+        if not hits or hits[0][2] < settings.lexical_fast_path_confidence:
+            return False
+        return len(hits) == 1 or hits[0][1] >= settings.lexical_fast_path_margin * hits[1][1]
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[dict] = None, **kwargs) -> List[Document]:
+        candidates = max(k, settings.hybrid_candidates)
+        hits = self.lexical.search(query, candidates, filter)
+
+        fast = self.is_decisive(hits)
+        with self._lock:
+            self.queries += 1
+            self.fast_path += fast
+        if fast:
+            return [doc for doc, _, _ in hits[:k]]
+
+        vector_docs = self.vectorstore.similarity_search(query, k=candidates, filter=filter, **kwargs)
+        return reciprocal_rank_fusion(
+            [vector_docs, [doc for doc, _, _ in hits]],
+            k,
+            settings.hybrid_rrf_k
+        )
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": True,
+                "queries": self.queries,
+                "fast_path": self.fast_path,
+                "fast_path_ratio": round(self.fast_path / self.queries, 3) if self.queries else 0.0,
+            }
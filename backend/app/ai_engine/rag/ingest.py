@@ -5,22 +5,87 @@ Run this script to initialize or update the knowledge base.
 
 Supports both .txt and .md (Markdown) files.
 Markdown files are split semantically by headers for better context preservation.
+
+Updates are incremental: a manifest of per-file content hashes and stable
+chunk IDs means only changed chunks are embedded and chunks of removed
+files are deleted.
+
+Ingestion streams: files are read and split one at a time, chunks are
+embedded in fixed-size batches and upserted as they are ready, so memory
+stays bounded however large the knowledge base grows. Parsing and
+embedding can run in worker processes.
+
+The index is stored in ChromaDB, or with VECTOR_BACKEND=flat in a
+memory-mapped NumPy matrix (see flat_index.py). A BM25 index of the same
+chunks is written alongside it for hybrid retrieval (see lexical.py).
+
+Chunks are tagged with their category (top-level folder) and, for
+assignments, their lab, so retrieval can be scoped to one lab plus the
+shared course material.
+
+Usage:
+    python -m app.ai_engine.rag.ingest            # apply changes
+    python -m app.ai_engine.rag.ingest --rebuild  # rebuild from scratch
+    python -m app.ai_engine.rag.ingest --watch    # keep applying changes
+    python -m app.ai_engine.rag.ingest --workers 4 --batch-size 128
 """
 
+import argparse
+import hashlib
+import json
+import multiprocessing
 import os
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 from pathlib import Path
-from langchain_community.document_loaders import DirectoryLoader, TextLoader
+from typing import Callable, Iterable, Iterator, Optional
+import chromadb
+from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_text_splitters import MarkdownHeaderTextSplitter
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_chroma import Chroma
 
 from app.core.config import settings
+from app.ai_engine.rag import flat_index
+from app.ai_engine.rag.lexical import LexicalWriter
 
 
 # Path to knowledge base relative to backend folder
 KNOWLEDGE_BASE_PATH = Path(__file__).parent.parent.parent.parent.parent / "knowledge_base"
 
+# Chroma's default collection; rebuilds go to "<name>_<timestamp>" collections
+DEFAULT_COLLECTION = "langchain"
+
+# File in the persist directory naming the collection being served
+ACTIVE_COLLECTION_FILE = "active_collection"
+
+# File hashes and chunk IDs of the active collection, for incremental updates
+MANIFEST_FILE = "ingest_manifest.json"
+
+# Bumped when chunk metadata or IDs change, so older stores are rebuilt
+MANIFEST_VERSION = 2
+
+# Knowledge base folders and the files ingested from them
+KNOWLEDGE_FOLDERS = ["assignments", "syllabus", "concepts", "style_guide"]
+FILE_PATTERNS = ["*.txt", "*.md"]
+
+# Lab ids ("lab1_loops", "Lab 1") and assignment files are matched on "lab<N>"
+LAB_PATTERN = re.compile(r"lab[\s_-]*(\d+)", re.IGNORECASE)
+
+# Lab tag of chunks every lab can see (concepts, style guide, syllabus)
+SHARED_LAB = ""
+
+# Seconds between progress lines while ingesting
+PROGRESS_INTERVAL = 5.0
+
+# Files are hashed in blocks of this size
+HASH_BLOCK_SIZE = 1024 * 1024
+
 # Headers to split markdown files on (preserves semantic context)
 MARKDOWN_HEADERS = [
     ("#", "topic"),
@@ -38,50 +103,53 @@ def get_embeddings():
     )
 
 
-def load_documents_from_folder(folder_path: Path, file_pattern: str = "**/*"):
-    """Load documents from a folder, supporting both .txt and .md files."""
-    documents = []
-    
-    if not folder_path.exists():
-        return documents
-    
-    # Load .txt files
-    txt_loader = DirectoryLoader(
-        str(folder_path),
-        glob=f"{file_pattern}.txt",
-        loader_cls=TextLoader,
-        loader_kwargs={"encoding": "utf-8"}
-    )
-    documents.extend(txt_loader.load())
-    
-    # Load .md files
-    md_loader = DirectoryLoader(
-        str(folder_path),
-        glob=f"{file_pattern}.md",
-        loader_cls=TextLoader,
-        loader_kwargs={"encoding": "utf-8"}
-    )
-    documents.extend(md_loader.load())
-    
-    return documents
+def get_active_collection() -> str:
+    """Name of the collection the knowledge base is currently served from."""
+    marker = Path(settings.chroma_persist_dir) / ACTIVE_COLLECTION_FILE
+    if marker.exists():
+        name = marker.read_text(encoding="utf-8").strip()
+        if name:
+            return name
+    return DEFAULT_COLLECTION
+
+
+def set_active_collection(name: str):
+    """Point readers at a new collection (atomic file replace)."""
+    marker = Path(settings.chroma_persist_dir) / ACTIVE_COLLECTION_FILE
+    tmp = marker.with_suffix(".tmp")
+    tmp.write_text(name, encoding="utf-8")
+    os.replace(tmp, marker)
+
 
+def flat_root() -> Path:
+    """Directory holding the flat index collections."""
+    return Path(settings.chroma_persist_dir) / "flat"
 
-def load_documents():
-    """Load all documents from the knowledge base."""
-    documents = []
+
+def lexical_path(collection_name: str) -> Path:
+    """BM25 index file of a collection."""
+    return Path(settings.chroma_persist_dir) / "lexical" / f"{collection_name}.json"
+
+
+def prune_collections(keep: set):
+    """Delete old rebuilds, keeping `keep` (the new and the previous collection)."""
+    lexical_dir = lexical_path(DEFAULT_COLLECTION).parent
+    if lexical_dir.exists():
+        for path in lexical_dir.glob("*.json"):
+            if path.stem not in keep:
+                path.unlink(missing_ok=True)
     
-    # Define all folders to load from
-    folders = ["assignments", "syllabus", "concepts", "style_guide"]
+    if settings.vector_backend == "flat":
+        for name in flat_index.list_collections(flat_root()):
+            if name not in keep:
+                flat_index.delete_collection(flat_root(), name)
+        return
     
-    for folder_name in folders:
-        folder_path = KNOWLEDGE_BASE_PATH / folder_name
-        docs = load_documents_from_folder(folder_path)
-        documents.extend(docs)
-        if docs:
-            print(f"  📂 {folder_name}/: {len(docs)} file(s)")
-    
-    print(f"📄 Loaded {len(documents)} total documents from knowledge base")
-    return documents
+    client = chromadb.PersistentClient(path=settings.chroma_persist_dir)
+    for collection in client.list_collections():
+        name = collection if isinstance(collection, str) else collection.name
+        if name not in keep:
+            client.delete_collection(name)
 
 
 def split_markdown_content(content: str):
@@ -97,7 +165,7 @@ def split_markdown_content(content: str):
     return header_splits
 
 
-def split_documents(documents):
+def split_documents(documents, verbose: bool = True):
     """Split documents into chunks for better retrieval.
     
     Markdown files are first split by headers for semantic chunking,
@@ -139,56 +207,534 @@ def split_documents(documents):
             chunks = text_splitter.split_documents([doc])
             all_chunks.extend(chunks)
     
-    print(f"📦 Split into {len(all_chunks)} chunks")
+    if verbose:
+        print(f"📦 Split into {len(all_chunks)} chunks")
     return all_chunks
 
 
-def build_knowledge_base():
+def relative_source(source_path: str) -> str:
+    """Source path relative to the knowledge base, the same on every machine."""
+    try:
+        return Path(source_path).resolve().relative_to(KNOWLEDGE_BASE_PATH.resolve()).as_posix()
+    except ValueError:
+        return Path(source_path).as_posix()
+
+
+def lab_key(name: str) -> str:
+    """Normalized lab of an assignment file name or a request's lab_id."""
+    match = LAB_PATTERN.search(name)
+    return f"lab{int(match.group(1))}" if match else name.strip().lower()
+
+
+def document_metadata(rel: str) -> dict:
+    """Category (top-level folder) and lab of a knowledge base file."""
+    category = rel.split("/", 1)[0]
+    lab = lab_key(Path(rel).stem) if category == "assignments" else SHARED_LAB
+    return {"category": category, "lab": lab}
+
+
+def lab_filter(lab_id: Optional[str]) -> Optional[dict]:
+    """Metadata filter for one lab's chunks plus the shared material (None: everything)."""
+    if not lab_id:
+        return None
+    return {"lab": {"$in": [lab_key(lab_id), SHARED_LAB]}}
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def file_hash(path: Path) -> str:
+    """Hash of a file's bytes, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def assign_chunk_ids(chunks) -> list:
+    """
+    Stable IDs derived from each chunk's file, header metadata and text.
+    
+    Unchanged chunks keep their ID across edits to other parts of the file,
+    so they are not embedded again. Repeated identical chunks in one file
+    are told apart by an occurrence counter.
+    """
+    ids = []
+    seen = {}
+    for chunk in chunks:
+        source = relative_source(chunk.metadata.get("source", ""))
+        headers = {k: v for k, v in chunk.metadata.items() if k != "source"}
+        digest = content_hash(
+            source + "\0" + json.dumps(headers, sort_keys=True) + "\0" + chunk.page_content
+        )
+        occurrence = seen.get(digest, 0)
+        seen[digest] = occurrence + 1
+        ids.append(content_hash(f"{digest}:{occurrence}")[:32])
+    return ids
+
+
+def discover_files() -> dict:
+    """All knowledge base files, keyed by path relative to the knowledge base."""
+    files = {}
+    for folder_name in KNOWLEDGE_FOLDERS:
+        folder_path = KNOWLEDGE_BASE_PATH / folder_name
+        if not folder_path.exists():
+            continue
+        for pattern in FILE_PATTERNS:
+            for path in sorted(folder_path.rglob(pattern)):
+                if path.is_file():
+                    files[relative_source(str(path))] = path
+    return files
+
+
+def get_collection(name: str):
+    """Open (or create) a collection of the configured backend for writing."""
+    if settings.vector_backend == "flat":
+        return flat_index.FlatCollection(flat_root() / name, quantize=settings.flat_quantization == "int8")
+    client = chromadb.PersistentClient(path=settings.chroma_persist_dir)
+    return client.get_or_create_collection(name)
+
+
+def finish_collection(collection):
+    """Flush writes; a flat collection is written out once, Chroma on every upsert."""
+    if isinstance(collection, flat_index.FlatCollection):
+        collection.persist()
+
+
+def store_exists() -> bool:
+    """Whether the active collection of the configured backend is on disk."""
+    if settings.vector_backend == "flat":
+        return (flat_root() / get_active_collection() / flat_index.META_FILE).exists()
+    return os.path.exists(settings.chroma_persist_dir)
+
+
+def parse_file(path: str) -> dict:
+    """
+    Read and split one knowledge base file.
+
+    Runs in ingestion worker processes, so it returns plain data.
+
+    Returns:
+        dict with source, hash, ids, texts and metadatas, or source and
+        error if the file could not be read
+    """
+    rel = relative_source(path)
+    try:
+        data = Path(path).read_bytes()
+        text = data.decode("utf-8").replace("\r\n", "\n").replace("\r", "\n")
+    except (OSError, UnicodeDecodeError) as e:
+        return {"source": rel, "error": str(e)}
+
+    metadata = {"source": path, **document_metadata(rel)}
+    chunks = split_documents([Document(page_content=text, metadata=metadata)], verbose=False)
+    return {
+        "source": rel,
+        "hash": hashlib.sha256(data).hexdigest(),
+        "ids": assign_chunk_ids(chunks),
+        "texts": [chunk.page_content for chunk in chunks],
+        "metadatas": [chunk.metadata for chunk in chunks],
+    }
+
+
+# Embedding model of an ingestion worker process
+worker_embeddings = None
+
+
+def init_worker():
+    """Load the embedding model once per ingestion worker process."""
+    global worker_embeddings
+    worker_embeddings = get_embeddings()
+
+
+def embed_batch(batch: list) -> list:
+    """Embed one batch of (id, text, metadata) chunks in an ingestion worker process."""
+    return worker_embeddings.embed_documents([text for _, text, _ in batch])
+
+
+def bounded_map(pool, fn: Callable, items: Iterable, window: int) -> Iterator[tuple]:
+    """
+    Yield (item, fn(item)) in order, with at most `window` calls in flight.
+
+    Runs in the calling process when `pool` is None. Unlike `pool.map`,
+    the input is consumed lazily, so a slow consumer holds back the
+    producer instead of letting results pile up.
+    """
+    if pool is None:
+        for item in items:
+            yield item, fn(item)
+        return
+
+    pending = deque()
+    for item in items:
+        pending.append((item, pool.submit(fn, item)))
+        if len(pending) >= window:
+            item, future = pending.popleft()
+            yield item, future.result()
+    while pending:
+        item, future = pending.popleft()
+        yield item, future.result()
+
+
+def batched(items: Iterable, size: int) -> Iterator[list]:
+    """Group an iterable into lists of `size` (the last may be shorter)."""
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class IngestProgress:
+    """Counters of a running ingestion, with throughput."""
+
+    def __init__(self, files_total: int):
+        self.files_total = files_total
+        self.files = 0
+        self.errors = 0
+        self.chunks = 0
+        self.chunks_skipped = 0  # unchanged, already in the store
+        self.chunks_embedded = 0
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+
+    def report(self) -> dict:
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        return {
+            "running": self.finished is None,
+            "files_total": self.files_total,
+            "files": self.files,
+            "errors": self.errors,
+            "chunks": self.chunks,
+            "chunks_skipped": self.chunks_skipped,
+            "chunks_embedded": self.chunks_embedded,
+            "seconds": round(elapsed, 3),
+            "docs_per_second": round(self.files / elapsed, 2) if elapsed else 0.0,
+            "chunks_per_second": round(self.chunks_embedded / elapsed, 2) if elapsed else 0.0,
+        }
+
+
+# Progress of the current (or last) ingestion in this process
+ingest_progress: Optional[IngestProgress] = None
+
+
+def get_ingest_stats() -> Optional[dict]:
+    """Progress and throughput of the current or last ingestion, if any."""
+    return ingest_progress.report() if ingest_progress else None
+
+
+def run_pipeline(
+    files: dict,
+    collection,
+    embeddings=None,
+    skip_ids: frozenset = frozenset(),
+    lexical: Optional[LexicalWriter] = None,
+    workers: Optional[int] = None,
+    batch_size: Optional[int] = None
+) -> dict:
+    """
+    Stream files through read -> split -> embed -> upsert.
+
+    With more than one worker, files are parsed and batches embedded in
+    worker processes that each load the default embedding model;
+    otherwise everything runs here with `embeddings`. At most two tasks
+    per worker are in flight at each stage, which bounds memory.
+
+    Args:
+        files: Relative path -> Path of the files to ingest
+        collection: Chroma collection to upsert into
+        embeddings: Model for in-process embedding
+        skip_ids: Chunk IDs already in the collection (not embedded again)
+        lexical: BM25 index to add the same chunks to
+        workers: Worker processes (default `settings.ingest_workers`)
+        batch_size: Chunks per embedding batch (default `settings.ingest_batch_size`)
+
+    Returns:
+        Manifest entries ({"hash", "chunks"}) of the files that were read
+    """
+    global ingest_progress
+    workers = workers or settings.ingest_workers
+    batch_size = batch_size or settings.ingest_batch_size
+    progress = ingest_progress = IngestProgress(len(files))
+    entries = {}
+
+    pool = None
+    if workers > 1:
+        pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker
+        )
+        embed = embed_batch
+    else:
+        embeddings = embeddings or get_embeddings()
+        embed = lambda batch: embeddings.embed_documents([text for _, text, _ in batch])
+
+    def chunk_stream():
+        paths = (str(path) for path in files.values())
+        for _, parsed in bounded_map(pool, parse_file, paths, 2 * workers):
+            progress.files += 1
+            if "error" in parsed:
+                progress.errors += 1
+                print(f"⚠️ Skipping {parsed['source']}: {parsed['error']}")
+                continue
+            entries[parsed["source"]] = {"hash": parsed["hash"], "chunks": parsed["ids"]}
+            progress.chunks += len(parsed["ids"])
+            for chunk in zip(parsed["ids"], parsed["texts"], parsed["metadatas"]):
+                if chunk[0] in skip_ids:
+                    progress.chunks_skipped += 1
+                else:
+                    yield chunk
+
+    try:
+        last_print = time.perf_counter()
+        for batch, vectors in bounded_map(pool, embed, batched(chunk_stream(), batch_size), 2 * workers):
+            collection.upsert(
+                ids=[chunk_id for chunk_id, _, _ in batch],
+                embeddings=vectors,
+                documents=[text for _, text, _ in batch],
+                metadatas=[metadata for _, _, metadata in batch]
+            )
+            if lexical is not None:
+                lexical.upsert(
+                    [chunk_id for chunk_id, _, _ in batch],
+                    [text for _, text, _ in batch],
+                    [metadata for _, _, metadata in batch]
+                )
+            progress.chunks_embedded += len(batch)
+            if time.perf_counter() - last_print >= PROGRESS_INTERVAL:
+                last_print = time.perf_counter()
+                report = progress.report()
+                print(
+                    f"  📈 {report['files']}/{report['files_total']} files, "
+                    f"{report['chunks_embedded']} chunks embedded "
+                    f"({report['docs_per_second']} docs/s, {report['chunks_per_second']} chunks/s)"
+                )
+    finally:
+        progress.finished = time.perf_counter()
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    return entries
+
+
+def load_manifest() -> Optional[dict]:
+    """The manifest of the active collection, or None if it has none."""
+    path = Path(settings.chroma_persist_dir) / MANIFEST_FILE
+    if not path.exists():
+        return None
+    try:
+        manifest = json.loads(path.read_text(encoding="utf-8"))
+    except ValueError:
+        return None
+    if manifest.get("version", 1) != MANIFEST_VERSION:
+        return None
+    if manifest.get("collection") != get_active_collection():
+        return None
+    if manifest.get("backend", "chroma") != settings.vector_backend:
+        return None
+    if not lexical_path(manifest["collection"]).exists():
+        return None
+    return manifest
+
+
+def save_manifest(manifest: dict):
+    """Write the manifest (atomic file replace)."""
+    path = Path(settings.chroma_persist_dir) / MANIFEST_FILE
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(manifest, indent=1), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def build_knowledge_base(embeddings=None, workers: Optional[int] = None, batch_size: Optional[int] = None):
     """
     Main function to build/rebuild the vector store.
     Call this when you add new lab instructions.
+    
+    The index is built into a fresh collection and only then made active,
+    so a running server keeps answering from the previous one until it
+    reloads. The collection before that is deleted.
+    
+    Returns:
+        Name of the new collection, or None if there were no documents
     """
     print("🔨 Building knowledge base...")
     
-    # Load and split documents
-    documents = load_documents()
-    
-    if not documents:
+    files = discover_files()
+    if not files:
         print("⚠️ No documents found in knowledge_base/")
         print(f"   Expected path: {KNOWLEDGE_BASE_PATH}")
         return None
+    print(f"📄 Found {len(files)} documents in knowledge base")
     
-    chunks = split_documents(documents)
+    # Stream everything into a new collection, then switch to it
+    previous = get_active_collection()
+    collection_name = f"{DEFAULT_COLLECTION}_{int(time.time() * 1000)}"
+    collection = get_collection(collection_name)
+    lexical = LexicalWriter(lexical_path(collection_name))
+    entries = run_pipeline(files, collection, embeddings, lexical=lexical, workers=workers, batch_size=batch_size)
+    finish_collection(collection)
+    lexical.save()
     
-    # Create embeddings and vector store
-    embeddings = get_embeddings()
+    # Record what was ingested so later runs only apply changes
+    set_active_collection(collection_name)
+    save_manifest({
+        "version": MANIFEST_VERSION,
+        "collection": collection_name,
+        "backend": settings.vector_backend,
+        "files": entries
+    })
+    prune_collections(keep={collection_name, previous})
     
-    # Create the vector store
-    vectorstore = Chroma.from_documents(
-        documents=chunks,
-        embedding=embeddings,
-        persist_directory=settings.chroma_persist_dir
-    )
+    print(f"📊 Ingestion: {get_ingest_stats()}")
+    print(f"✅ Knowledge base built and saved to {settings.chroma_persist_dir} ({collection_name})")
+    return collection_name
+
+
+def sync_knowledge_base(embeddings=None, workers: Optional[int] = None, batch_size: Optional[int] = None) -> Optional[dict]:
+    """
+    Apply knowledge base edits to the active collection in place.
+    
+    Only chunks whose ID is new are embedded; chunks that disappeared from
+    a changed file, and all chunks of removed files, are deleted.
+    
+    Returns:
+        dict with files_added, files_changed, files_removed, chunks_added,
+        chunks_removed, or None when there is no manifest to diff against
+        (the caller should rebuild instead)
+    """
+    manifest = load_manifest()
+    if manifest is None:
+        return None
+    
+    report = {"files_added": 0, "files_changed": 0, "files_removed": 0, "chunks_added": 0, "chunks_removed": 0}
+    known = manifest["files"]
+    current = discover_files()
+    stale_ids = []
+    
+    for rel in sorted(set(known) - set(current)):
+        stale_ids.extend(known.pop(rel)["chunks"])
+        report["files_removed"] += 1
     
-    print(f"✅ Knowledge base built and saved to {settings.chroma_persist_dir}")
-    return vectorstore
+    changed = {}
+    for rel, path in current.items():
+        try:
+            digest = file_hash(path)
+        except OSError as e:
+            print(f"⚠️ Skipping {rel}: {e}")
+            continue
+        if rel not in known or known[rel]["hash"] != digest:
+            changed[rel] = path
+    
+    collection = get_collection(manifest["collection"])
+    lexical = LexicalWriter(lexical_path(manifest["collection"]))
+    if changed:
+        old_ids = frozenset(chunk_id for rel in changed if rel in known for chunk_id in known[rel]["chunks"])
+        entries = run_pipeline(
+            changed, collection, embeddings,
+            skip_ids=old_ids, lexical=lexical, workers=workers, batch_size=batch_size
+        )
+        for rel, entry in entries.items():
+            previous = known.get(rel)
+            if previous is not None:
+                stale_ids.extend(set(previous["chunks"]) - set(entry["chunks"]))
+            known[rel] = entry
+            report["files_changed" if previous else "files_added"] += 1
+        report["chunks_added"] = ingest_progress.chunks_embedded
+    
+    if stale_ids:
+        collection.delete(ids=stale_ids)
+        lexical.delete(stale_ids)
+    finish_collection(collection)
+    report["chunks_removed"] = len(stale_ids)
+    if has_changes(report):
+        lexical.save()
+        save_manifest(manifest)
+    return report
+
+
+def has_changes(report: Optional[dict]) -> bool:
+    return report is None or any(report.values())
+
+
+def file_snapshot() -> dict:
+    """Modification time and size of every knowledge base file."""
+    snapshot = {}
+    for rel, path in discover_files().items():
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        snapshot[rel] = (stat.st_mtime_ns, stat.st_size)
+    return snapshot
+
+
+def watch_knowledge_base(on_change: Callable[[], None], interval: float, stop: threading.Event):
+    """Call `on_change` whenever a knowledge base file is added, edited or removed."""
+    last = file_snapshot()
+    while not stop.wait(interval):
+        current = file_snapshot()
+        if current != last:
+            last = current
+            try:
+                on_change()
+            except Exception as e:
+                print(f"⚠️ Knowledge base update failed: {e}")
 
 
-def get_vectorstore():
+def update_knowledge_base(embeddings=None, workers: Optional[int] = None, batch_size: Optional[int] = None):
+    """Apply changes to the persisted store, rebuilding if it has no manifest."""
+    report = None
+    if store_exists():
+        report = sync_knowledge_base(embeddings, workers, batch_size)
+    if report is None:
+        build_knowledge_base(embeddings, workers, batch_size)
+    else:
+        print(f"✅ Knowledge base updated: {report}")
+
+
+def get_vectorstore(embeddings=None):
     """Get existing vector store or create new one."""
-    embeddings = get_embeddings()
+    embeddings = embeddings or get_embeddings()
+    
+    # Build new knowledge base if there is no existing vector store
+    if not store_exists():
+        if build_knowledge_base(embeddings) is None:
+            return None
     
-    # Check if existing vector store exists
-    if os.path.exists(settings.chroma_persist_dir):
-        return Chroma(
-            persist_directory=settings.chroma_persist_dir,
-            embedding_function=embeddings
+    if settings.vector_backend == "flat":
+        return flat_index.FlatIndex(
+            flat_root() / get_active_collection(),
+            embeddings,
+            rerank_candidates=settings.flat_rerank_candidates
         )
-    else:
-        # Build new knowledge base
-        return build_knowledge_base()
+    return Chroma(
+        collection_name=get_active_collection(),
+        persist_directory=settings.chroma_persist_dir,
+        embedding_function=embeddings
+    )
 
 
 if __name__ == "__main__":
     # Run ingestion when script is called directly
-    build_knowledge_base()
+    parser = argparse.ArgumentParser(description="Ingest the knowledge base into ChromaDB")
+    parser.add_argument("--rebuild", action="store_true", help="rebuild from scratch")
+    parser.add_argument("--watch", action="store_true", help="keep applying changes")
+    parser.add_argument("--workers", type=int, default=settings.ingest_workers, help="parse/embed processes")
+    parser.add_argument("--batch-size", type=int, default=settings.ingest_batch_size, help="chunks per embedding batch")
+    args = parser.parse_args()
+    
+    # One model for all runs when embedding in this process
+    embeddings = get_embeddings() if args.workers <= 1 else None
+    if args.rebuild:
+        build_knowledge_base(embeddings, args.workers, args.batch_size)
+    else:
+        update_knowledge_base(embeddings, args.workers, args.batch_size)
+    if args.watch:
+        print(f"👀 Watching {KNOWLEDGE_BASE_PATH} for changes (Ctrl+C to stop)")
+        try:
+            watch_knowledge_base(
+                lambda: update_knowledge_base(embeddings, args.workers, args.batch_size),
+                settings.rag_watch_interval,
+                threading.Event()
+            )
+        except KeyboardInterrupt:
+            pass
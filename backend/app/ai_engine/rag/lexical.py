@@ -0,0 +1,204 @@
+"""
+Lexical Index
+BM25 over the knowledge base chunks, built at ingest time next to the
+vector index. Student questions are full of exact tokens (`IndexError`,
+`range(len(`, lab names) that embedding similarity tends to blur;
+keyword scoring catches them.
+
+The index is persisted as one JSON file per collection holding the
+inverted postings, so serving only has to read it, not re-tokenize.
+"""
+
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+from langchain_core.documents import Document
+
+
+# BM25 parameters (the usual defaults)
+K1 = 1.5
+B = 0.75
+
+# Identifiers and numbers; punctuation only separates them
+TOKEN_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d+")
+
+STOPWORDS = frozenset("""
+a an and are as at be but by can do does for from has have how i if in is it its me my no
+not of on or so that the their then there these this to was what when where which why will
+with you your
+""".split())
+
+
+def matches(metadata: dict, where: dict) -> bool:
+    """Whether metadata satisfies a Chroma-style filter of equality and `$in` conditions."""
+    for key, condition in where.items():
+        value = metadata.get(key)
+        if isinstance(condition, dict):
+            if "$in" in condition and value not in condition["$in"]:
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercased words and numbers, minus stopwords and single letters,
+    plus adjacent-word pairs so `range(len(x))` also matches "range len".
+    """
+    words = [
+        word for word in (match.lower() for match in TOKEN_PATTERN.findall(text))
+        if (len(word) > 1 or word.isdigit()) and word not in STOPWORDS
+    ]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class LexicalWriter:
+    """
+    Builds or updates the lexical index of one collection, with the same
+    `upsert` / `delete` calls ingestion makes on the vector collection.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.rows: dict = {}  # id -> (document, metadata, term counts)
+        index = LexicalIndex.load(self.path)
+        if index is not None:
+            counts = [Counter() for _ in index.ids]
+            for term, postings in index.postings.items():
+                for row, tf in postings:
+                    counts[row][term] = tf
+            for row, chunk_id in enumerate(index.ids):
+                self.rows[chunk_id] = (index.documents[row], index.metadatas[row], counts[row])
+
+    def upsert(self, ids: List[str], documents: List[str], metadatas: List[dict]):
+        for chunk_id, document, metadata in zip(ids, documents, metadatas):
+            self.rows[chunk_id] = (document, metadata, Counter(tokenize(document)))
+
+    def delete(self, ids: Iterable[str]):
+        for chunk_id in ids:
+            self.rows.pop(chunk_id, None)
+
+    def save(self):
+        """Write the inverted index (atomic file replace)."""
+        ids = list(self.rows)
+        postings: dict = {}
+        lengths = []
+        for row, chunk_id in enumerate(ids):
+            counts = self.rows[chunk_id][2]
+            lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                postings.setdefault(term, []).append([row, tf])
+
+        data = {
+            "ids": ids,
+            "documents": [self.rows[chunk_id][0] for chunk_id in ids],
+            "metadatas": [self.rows[chunk_id][1] for chunk_id in ids],
+            "lengths": lengths,
+            "postings": postings,
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(data, separators=(",", ":")), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+
+class LexicalIndex:
+    """A loaded, read-only BM25 index."""
+
+    def __init__(self, data: dict):
+        self.ids = data["ids"]
+        self.documents = data["documents"]
+        self.metadatas = data["metadatas"]
+        self.lengths = data["lengths"]
+        self.postings = data["postings"]
+        self.avg_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+        self._partitions: dict = {}  # filter -> rows it allows
+
+    @classmethod
+    def load(cls, path: Path) -> Optional["LexicalIndex"]:
+        try:
+            return cls(json.loads(Path(path).read_text(encoding="utf-8")))
+        except FileNotFoundError:
+            return None
+
+    def idf(self, term: str) -> float:
+        df = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self.ids) - df + 0.5) / (df + 0.5))
+
+    def partition(self, where: dict) -> frozenset:
+        """Rows matching a metadata filter, computed once per distinct filter."""
+        key = json.dumps(where, sort_keys=True)
+        rows = self._partitions.get(key)
+        if rows is None:
+            rows = self._partitions[key] = frozenset(
+                row for row, metadata in enumerate(self.metadatas) if matches(metadata, where)
+            )
+        return rows
+
+    def search(self, query: str, k: int = 4, filter: Optional[dict] = None) -> List[tuple]:
+        """
+        Top `k` chunks by BM25, only among those matching `filter` if given.
+
+        Returns:
+            list of (Document, score, confidence), where confidence is the
+            score as a fraction of the most any chunk could score for the
+            query's known terms (0..1)
+        """
+        terms = [term for term in set(tokenize(query)) if term in self.postings]
+        if not terms:
+            return []
+
+        allowed = self.partition(filter) if filter else None
+        scores: dict = {}
+        ceiling = 0.0
+        for term in terms:
+            idf = self.idf(term)
+            ceiling += idf * (K1 + 1)
+            for row, tf in self.postings[term]:
+                if allowed is not None and row not in allowed:
+                    continue
+                norm = K1 * (1 - B + B * self.lengths[row] / self.avg_length)
+                scores[row] = scores.get(row, 0.0) + idf * tf * (K1 + 1) / (tf + norm)
+
+        top = sorted(scores, key=scores.get, reverse=True)[:k]
+        return [
+            (
+                Document(page_content=self.documents[row], metadata=self.metadatas[row], id=self.ids[row]),
+                scores[row],
+                scores[row] / ceiling
+            )
+            for row in top
+        ]
+
+
+class LexicalReader:
+    """Serves a persisted lexical index, reloading it when the file changes."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._state: Optional[tuple] = None  # (mtime, index)
+        self._lock = threading.Lock()
+
+    def current(self) -> Optional[LexicalIndex]:
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+        state = self._state
+        if state is None or state[0] != mtime:
+            with self._lock:
+                state = self._state
+                if state is None or state[0] != mtime:
+                    state = self._state = (mtime, LexicalIndex.load(self.path))
+        return state[1]
+
+    def search(self, query: str, k: int = 4, filter: Optional[dict] = None) -> List[tuple]:
+        index = self.current()
+        return index.search(query, k, filter) if index is not None else []
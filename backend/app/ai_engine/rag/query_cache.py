@@ -0,0 +1,162 @@
+"""
+Query Embedding Cache
+LRU cache of query vectors in front of the embedding model. During a lab
+many students send near-identical questions, and the same student often
+re-asks with the same code, so most retrievals can skip the encode.
+
+Keys are a hash of the query with whitespace normalized; entries expire
+after a TTL and the cache stays under a byte budget.
+"""
+
+import hashlib
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from app.core.config import settings
+
+
+def normalize_query(text: str) -> str:
+    """Collapse runs of whitespace so formatting-only differences share an entry."""
+    return " ".join(text.split())
+
+
+class QueryEmbeddingCache:
+    """Thread-safe LRU of query vectors with expiry and a byte budget."""
+
+    def __init__(self, max_bytes: int, ttl: int):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, vector, encode_seconds)
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.encode_seconds = 0.0  # spent on misses
+        self.saved_seconds = 0.0  # encode time hits did not have to spend
+
+    @staticmethod
+    def make_key(normalized: str) -> str:
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _size(vector: array) -> int:
+        # Vector payload plus a rough allowance for the key and bookkeeping
+        return vector.itemsize * len(vector) + 200
+
+    def get(self, key: str) -> Optional[List[float]]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= now:
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.saved_seconds += entry[2]
+            return entry[1].tolist()
+
+    def put(self, key: str, vector: List[float], encode_seconds: float):
+        packed = array("f", vector)
+        size = self._size(packed)
+        with self._lock:
+            self.encode_seconds += encode_seconds
+            if size > self.max_bytes:
+                return
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl, packed, encode_seconds)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+
+    def _drop(self, key: str):
+        _, vector, _ = self._entries.pop(key)
+        self._bytes -= self._size(vector)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "enabled": True,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+                "encode_seconds": round(self.encode_seconds, 3),
+                "saved_seconds": round(self.saved_seconds, 3),
+            }
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that answers `embed_query` from the cache.
+
+    Document embedding (ingestion) goes straight to the wrapped model.
+    """
+
+    def __init__(self, embeddings: Embeddings, cache: QueryEmbeddingCache):
+        self.embeddings = embeddings
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        normalized = normalize_query(text)
+        key = self.cache.make_key(normalized)
+        vector = self.cache.get(key)
+        if vector is not None:
+            return vector
+
+        start = time.perf_counter()
+        vector = self.embeddings.embed_query(normalized)
+        self.cache.put(key, vector, time.perf_counter() - start)
+        return vector
+
+
+# Cache instance
+query_cache: Optional[QueryEmbeddingCache] = None
+
+
+def get_query_cache() -> Optional[QueryEmbeddingCache]:
+    """Get or create the query embedding cache, or None when it is disabled."""
+    global query_cache
+    if not settings.query_cache_enabled:
+        return None
+    if query_cache is None:
+        query_cache = QueryEmbeddingCache(
+            max_bytes=settings.query_cache_max_bytes,
+            ttl=settings.query_cache_ttl
+        )
+    return query_cache
+
+
+def with_query_cache(embeddings: Embeddings) -> Embeddings:
+    """Wrap an embedding model with the query cache when it is enabled."""
+    cache = get_query_cache()
+    if cache is None:
+        return embeddings
+    return CachedQueryEmbeddings(embeddings, cache)
+
+
+def get_query_cache_stats() -> dict:
+    """Query embedding cache statistics for the stats endpoint."""
+    if query_cache is None:
+        return {"enabled": settings.query_cache_enabled}
+    return query_cache.stats()
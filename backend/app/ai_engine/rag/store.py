@@ -0,0 +1,231 @@
+"""
+Knowledge Base Service
+Process-wide embedding model and vector store, loaded once (at startup by
+default, otherwise in the background on first use) and warmed up with a
+test encode and search before the app reports ready.
+
+A reload builds or reopens the index next to the one being served and
+swaps it in with a single reference assignment, so requests never see a
+half-built store.
+
+Edits to the knowledge base files can be applied in place with `sync`
+(only changed chunks are re-embedded), optionally from a file watcher.
+
+Retrieval goes through `retriever`: hybrid BM25 + vector search by
+default, or the plain vector store with HYBRID_RETRIEVAL=false.
+"""
+
+import threading
+import time
+from typing import Optional
+
+from app.core.config import settings
+from app.ai_engine.rag.ingest import (
+    build_knowledge_base,
+    get_embeddings,
+    get_ingest_stats,
+    get_active_collection,
+    get_vectorstore,
+    has_changes,
+    lexical_path,
+    sync_knowledge_base,
+    watch_knowledge_base,
+)
+from app.ai_engine.rag.hybrid import HybridRetriever
+from app.ai_engine.rag.lexical import LexicalReader
+from app.ai_engine.rag.query_cache import with_query_cache
+
+
+# Query used to warm up the model and the index
+WARMUP_QUERY = "How do I fix an infinite while loop?"
+
+
+def warmup(embeddings, vectorstore, retriever):
+    """Run one encode and one search so the first student request is not the slow one."""
+    embeddings.embed_query(WARMUP_QUERY)
+    vectorstore.similarity_search(WARMUP_QUERY, k=1)
+    if retriever is not vectorstore:
+        retriever.similarity_search(WARMUP_QUERY, k=1)
+
+
+def make_retriever(vectorstore):
+    """Hybrid retriever over the active collection, or the store itself when disabled."""
+    if not settings.hybrid_retrieval:
+        return vectorstore
+    return HybridRetriever(vectorstore, LexicalReader(lexical_path(get_active_collection())))
+
+
+class KnowledgeBase:
+    """
+    Shared embeddings, vectorstore and retriever.
+
+    Readers take them without locking; `load` is serialized and replaces
+    all three in one assignment once the new store is warm.
+    """
+
+    def __init__(self):
+        self._state: Optional[tuple] = None  # (embeddings, vectorstore, retriever)
+        self._load_lock = threading.RLock()
+        self.status = "not_loaded"  # not_loaded | loading | ready | error
+        self.error: Optional[str] = None
+        self.loaded_at: Optional[float] = None
+        self.load_seconds: Optional[float] = None
+        self.loads = 0
+        self.syncs = 0
+        self.last_sync: Optional[dict] = None
+        self._watcher: Optional[threading.Thread] = None
+        self._watch_stop = threading.Event()
+        self._loader: Optional[threading.Thread] = None
+        self._loader_lock = threading.Lock()
+
+    @property
+    def embeddings(self):
+        state = self._state
+        return state[0] if state else None
+
+    @property
+    def vectorstore(self):
+        state = self._state
+        return state[1] if state else None
+
+    @property
+    def retriever(self):
+        state = self._state
+        return state[2] if state else None
+
+    def load(self, rebuild: bool = False) -> bool:
+        """
+        Open (or with `rebuild`, re-ingest) the index, warm it up, and swap it in.
+
+        The embedding model is loaded on the first call and reused after;
+        query encodes go through the query embedding cache.
+        On failure the previous store, if any, keeps serving.
+
+        Returns:
+            True if the new store is now being served
+        """
+        with self._load_lock:
+            if self._state is None:
+                self.status = "loading"
+            start = time.perf_counter()
+            try:
+                embeddings = self.embeddings or with_query_cache(get_embeddings())
+                if rebuild and build_knowledge_base(embeddings) is None:
+                    raise RuntimeError("knowledge base is empty")
+                vectorstore = get_vectorstore(embeddings)
+                if vectorstore is None:
+                    raise RuntimeError("knowledge base is empty")
+                retriever = make_retriever(vectorstore)
+                warmup(embeddings, vectorstore, retriever)
+            except Exception as e:
+                self.error = str(e)
+                if self._state is None:
+                    self.status = "error"
+                print(f"⚠️ Could not load knowledge base: {e}")
+                return False
+
+            self._state = (embeddings, vectorstore, retriever)
+            self.status = "ready"
+            self.error = None
+            self.loaded_at = time.time()
+            self.load_seconds = time.perf_counter() - start
+            self.loads += 1
+            print(f"✅ Knowledge base ready ({self.load_seconds:.1f}s incl. warmup)")
+            return True
+
+    def load_in_background(self):
+        """Start the first load on a thread, unless a load already started; never blocks."""
+        # Not `_load_lock`: a reload may hold that for as long as a load takes
+        with self._loader_lock:
+            if self._loader is not None or self.status != "not_loaded":
+                return
+            self.status = "loading"
+            self._loader = threading.Thread(target=self.load, name="knowledge-base-load", daemon=True)
+            self._loader.start()
+        print("📚 Loading knowledge base in the background...")
+
+    def sync(self) -> bool:
+        """
+        Apply knowledge base file edits to the store being served.
+
+        Unchanged chunks are left alone; new and edited ones are embedded
+        and removed ones deleted. Falls back to a full rebuild when the
+        store has no ingest manifest. `loaded_at` moves forward whenever
+        the content changed, which invalidates cached answers.
+
+        Returns:
+            True if the store is up to date with the files
+        """
+        with self._load_lock:
+            if self.vectorstore is None:
+                return self.load(rebuild=True)
+            try:
+                report = sync_knowledge_base(self.embeddings)
+            except Exception as e:
+                self.error = str(e)
+                print(f"⚠️ Could not sync knowledge base: {e}")
+                return False
+            if report is None:
+                return self.load(rebuild=True)
+
+            self.syncs += 1
+            self.last_sync = report
+            self.error = None
+            if has_changes(report):
+                self.loaded_at = time.time()
+                print(f"🔄 Knowledge base synced: {report}")
+            return True
+
+    def start_watcher(self, interval: float):
+        """Sync in a background thread whenever knowledge base files change."""
+        if self._watcher is not None:
+            return
+        self._watch_stop.clear()
+        self._watcher = threading.Thread(
+            target=watch_knowledge_base,
+            args=(self.sync, interval, self._watch_stop),
+            name="knowledge-base-watcher",
+            daemon=True
+        )
+        self._watcher.start()
+
+    def stop_watcher(self):
+        if self._watcher is None:
+            return
+        self._watch_stop.set()
+        self._watcher.join()
+        self._watcher = None
+
+    def stats(self) -> dict:
+        return {
+            "status": self.status,
+            "error": self.error,
+            "loaded_at": self.loaded_at,
+            "load_seconds": round(self.load_seconds, 3) if self.load_seconds is not None else None,
+            "loads": self.loads,
+            "syncs": self.syncs,
+            "last_sync": self.last_sync,
+            "watching": self._watcher is not None,
+            "ingest": get_ingest_stats(),
+            "retrieval": self.retriever.stats() if isinstance(self.retriever, HybridRetriever) else {"enabled": False},
+        }
+
+
+# Knowledge base instance
+knowledge_base = KnowledgeBase()
+
+
+def get_knowledge_base() -> KnowledgeBase:
+    """
+    Get the shared knowledge base. If startup did not load it, the first
+    use starts the load in the background; until it is ready, retrieval
+    finds nothing and the answer cache is skipped.
+    """
+    if not settings.rag_preload:
+        knowledge_base.load_in_background()
+    return knowledge_base
+
+
+def is_ready() -> bool:
+    """Readiness: the knowledge base is warm, or it is loaded lazily."""
+    return knowledge_base.status == "ready" or not settings.rag_preload
@@ -0,0 +1,140 @@
+"""
+Single-Flight Coalescing
+When many students send the same question at once (e.g. right after an
+instructor announces the bonus part), only the first request runs
+retrieval and the completion; the others attach to it and receive the
+same events, streamed as they are produced.
+
+Requests match on the normalized question, the code fingerprint, the
+lab and the language. A flight is forgotten as soon as it finishes, so later repeats go
+to the answer cache instead.
+"""
+
+import asyncio
+import hashlib
+from typing import AsyncIterator, Callable, Optional
+
+from app.ai_engine.answer_cache import code_fingerprint
+from app.core.config import settings
+
+
+def flight_key(question: str, student_code: str, lab_id: Optional[str], language: str = "python") -> str:
+    """Key shared by requests that would get the same answer."""
+    normalized = " ".join(question.lower().split())
+    # The fingerprint ignores comments only where that cannot change the program
+    raw = "\0".join((normalized, code_fingerprint(student_code, language), lab_id or "", language.lower()))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class Flight:
+    """One in-flight computation: the events produced so far, replayable by late joiners."""
+
+    def __init__(self):
+        self.events: list = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._update = asyncio.Event()
+
+    def publish(self, event: dict):
+        self.events.append(event)
+        self._wake()
+
+    def finish(self, error: Optional[BaseException] = None):
+        self.done = True
+        self.error = error
+        self._wake()
+
+    def _wake(self):
+        update, self._update = self._update, asyncio.Event()
+        update.set()
+
+    async def follow(self) -> AsyncIterator[dict]:
+        """All events from the first one, waiting for new ones until the flight ends."""
+        index = 0
+        while True:
+            update = self._update
+            while index < len(self.events):
+                yield self.events[index]
+                index += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await update.wait()
+
+
+class SingleFlight:
+    """Flights by key, for one event loop."""
+
+    def __init__(self):
+        self._flights: dict = {}
+        self.leaders = 0
+        self.followers = 0
+        self.max_subscribers = 0
+
+    def join(self, key: str, start: Callable[[], AsyncIterator[dict]]) -> tuple:
+        """
+        Attach to the flight for `key`, starting it with `start()` if there is none.
+
+        Returns:
+            (flight, leader) where leader is True for the request that started it
+        """
+        flight = self._flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = self._flights[key] = Flight()
+            # Runs to completion even if every subscriber goes away
+            flight.task = asyncio.create_task(self._run(key, flight, start()))
+            self.leaders += 1
+        else:
+            self.followers += 1
+        flight.subscribers += 1
+        self.max_subscribers = max(self.max_subscribers, flight.subscribers)
+        return flight, leader
+
+    async def _run(self, key: str, flight: Flight, source: AsyncIterator[dict]):
+        try:
+            async for event in source:
+                flight.publish(event)
+        except BaseException as e:
+            flight.finish(e)
+            if not isinstance(e, Exception):
+                raise
+        else:
+            flight.finish()
+        finally:
+            self._flights.pop(key, None)
+
+    def stats(self) -> dict:
+        total = self.leaders + self.followers
+        return {
+            "enabled": True,
+            "in_flight": len(self._flights),
+            "flights": self.leaders,
+            "coalesced": self.followers,
+            "coalesced_ratio": round(self.followers / total, 3) if total else 0.0,
+            "max_subscribers": self.max_subscribers,
+        }
+
+
+# Single-flight instance
+single_flight: Optional[SingleFlight] = None
+
+
+def get_single_flight() -> Optional[SingleFlight]:
+    """Get or create the single-flight layer, or None when it is disabled."""
+    global single_flight
+    if not settings.single_flight_enabled:
+        return None
+    if single_flight is None:
+        single_flight = SingleFlight()
+    return single_flight
+
+
+def get_single_flight_stats() -> dict:
+    """Coalescing statistics for the stats endpoint."""
+    if single_flight is None:
+        return {"enabled": settings.single_flight_enabled}
+    return single_flight.stats()
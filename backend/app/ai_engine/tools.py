@@ -4,20 +4,27 @@ Tools that the AI agent can use to gather information about student code.
 These enable the AI to "see" what's happening with the code.
 """
 
+import ast
 from typing import Optional
 from app.grader.runner import run_code_in_sandbox
+from app.grader.executor import get_ta_executor
 
 
 async def analyze_code_output(code: str, language: str = "python") -> dict:
     """
     Run the student's code and return the output.
     This lets the AI see what errors or output the code produces.
+    Runs on the TA's own admission budget, never in place of graded work.
+    
+    Raises:
+        SandboxBusyError: if the TA's sandbox queue is full (nothing ran,
+            so there is nothing to tell the AI about the code)
     """
-    result = await run_code_in_sandbox(code, language)
+    result = await run_code_in_sandbox(code, language, executor=get_ta_executor())
     return {
         "success": result["success"],
         "output": result["output"][:1000],  # Limit output size
-        "error": result.get("error", "")[:500],
+        "error": result.get("error", "")[-500:],  # Keep the end: the exception line
         "timed_out": result.get("timed_out", False)
     }
 
@@ -73,3 +80,25 @@ def check_for_infinite_loop_patterns(code: str) -> list:
             warnings.append(f"Line {i}: Found a while loop - verify the loop condition will eventually become False")
     
     return warnings
+
+
+def check_syntax(code: str) -> list:
+    """
+    Parse Python code without running it.
+    Returns a list with the syntax error, if any.
+    """
+    try:
+        ast.parse(code)
+    except SyntaxError as e:
+        return [f"Line {e.lineno}: SyntaxError: {e.msg}"]
+    return []
+
+
+def static_analysis(code: str, language: str = "python") -> list:
+    """
+    Run the static checks that apply to the language.
+    Returns a list of findings.
+    """
+    if language.lower() not in ("python", "python3"):
+        return []
+    return check_syntax(code) + find_undefined_variables(code) + check_for_infinite_loop_patterns(code)
@@ -3,12 +3,23 @@ Chat Endpoints
 WebSocket and REST endpoints for AI TA chat.
 """
 
+from contextlib import aclosing
 from pathlib import Path
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, HTTPException
+import asyncio
+from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect, HTTPException
 from pydantic import BaseModel
 from typing import Optional, List
 
-from app.ai_engine.agents.ta_agent import get_ta_response, get_vectorstore
+from app.ai_engine.agents.ta_agent import coalesced_ta_response, conversation_ta_stream, get_vectorstore
+from app.ai_engine.conversation import Conversation, get_conversation_stats
+from app.ai_engine.rag.store import knowledge_base
+from app.ai_engine.rag.query_cache import get_query_cache_stats
+from app.ai_engine.answer_cache import get_answer_cache_stats
+from app.ai_engine.prompt_builder import get_prompt_stats
+from app.ai_engine.single_flight import get_single_flight_stats
+from app.ai_engine.llm.resilience import get_llm_stats
+from app.ai_engine.evidence import get_evidence_stats
+from app.api.deps import require_auth
 
 
 router = APIRouter()
@@ -21,6 +32,7 @@ class ChatRequest(BaseModel):
     message: str
     code: str
     lab_id: Optional[str] = None
+    language: str = "python"  # of the code, which the TA runs in the sandbox
 
 
 class SourceInfo(BaseModel):
@@ -32,6 +44,8 @@ class SourceInfo(BaseModel):
 class ChatResponse(BaseModel):
     response: str
     sources: List[SourceInfo] = []
+    cached: bool = False  # served from the semantic answer cache
+    coalesced: bool = False  # shared with an identical request already in flight
 
 
 class KnowledgeFileResponse(BaseModel):
@@ -44,14 +58,18 @@ class KnowledgeFileResponse(BaseModel):
 async def ask_ta(request: ChatRequest):
     """
     Ask the AI TA a question about your code.
-    Uses RAG to retrieve relevant context from lab materials.
+    Uses RAG to retrieve relevant context from lab materials while the
+    code is run in the sandbox and checked, so the TA sees real errors.
+    Identical questions arriving together share one answer.
     """
     try:
         vectorstore = get_vectorstore()
-        response = await get_ta_response(
+        response = await coalesced_ta_response(
             vectorstore=vectorstore,
             question=request.message,
-            student_code=request.code
+            student_code=request.code,
+            lab_id=request.lab_id,
+            language=request.language
         )
         
         # Convert sources to SourceInfo objects
@@ -66,7 +84,9 @@ async def ask_ta(request: ChatRequest):
         
         return ChatResponse(
             response=response["answer"],
-            sources=sources
+            sources=sources,
+            cached=response.get("cached", False),
+            coalesced=response.get("coalesced", False)
         )
     
     except Exception as e:
@@ -123,17 +143,66 @@ async def list_knowledge_files():
     return {"files": files}
 
 
+@router.post("/knowledge/reload")
+async def reload_knowledge_base(rebuild: bool = False, user: dict = Depends(require_auth)):
+    """
+    Reload the knowledge base without restarting.
+    With `rebuild`, the documents are re-ingested first. The new index is
+    warmed up and swapped in atomically; the old one serves until then.
+    """
+    loaded = await asyncio.to_thread(knowledge_base.load, rebuild)
+    if not loaded:
+        raise HTTPException(status_code=500, detail=f"Reload failed: {knowledge_base.error}")
+    return knowledge_base.stats()
+
+
+@router.post("/knowledge/sync")
+async def sync_knowledge_base(user: dict = Depends(require_auth)):
+    """
+    Apply edits to the knowledge base files without a rebuild.
+    Only new and changed chunks are embedded; removed ones are deleted.
+    """
+    synced = await asyncio.to_thread(knowledge_base.sync)
+    if not synced:
+        raise HTTPException(status_code=500, detail=f"Sync failed: {knowledge_base.error}")
+    return knowledge_base.stats()
+
+
+@router.get("/stats")
+async def chat_stats():
+    """
+    RAG runtime statistics.
+    Reports knowledge base load state, query embedding cache hit rate and
+    encode time saved, semantic answer cache hits, prompt token counts,
+    how many requests were coalesced with an identical one in flight,
+    evidence tool latencies and timeouts, conversation memory summaries,
+    and LLM retries, rate-limit waits and circuit breaker state.
+    """
+    return {
+        "knowledge_base": knowledge_base.stats(),
+        "query_cache": get_query_cache_stats(),
+        "answer_cache": get_answer_cache_stats(),
+        "prompt": get_prompt_stats(),
+        "single_flight": get_single_flight_stats(),
+        "evidence": get_evidence_stats(),
+        "conversation": get_conversation_stats(),
+        "llm": get_llm_stats()
+    }
+
+
 @router.websocket("/ws")
 async def websocket_chat(websocket: WebSocket):
     """
     WebSocket endpoint for real-time chat with the TA.
-    Enables streaming responses.
+    Streams the answer as {"type": "token"} deltas while it is generated,
+    then sends {"type": "message"} with the full answer and its sources.
+    The connection remembers the conversation, so follow-up questions
+    are answered in context.
     """
     await websocket.accept()
+    conversation = Conversation()
     
     try:
-        vectorstore = get_vectorstore()
-        
         while True:
             # Receive message from client
             data = await websocket.receive_json()
@@ -145,19 +214,21 @@ async def websocket_chat(websocket: WebSocket):
             await websocket.send_json({"type": "typing", "status": True})
             
             try:
-                # Get TA response
-                response = await get_ta_response(
-                    vectorstore=vectorstore,
+                # Forward tokens as they arrive, then the final message
+                events = conversation_ta_stream(
+                    vectorstore=get_vectorstore(),
                     question=message,
-                    student_code=code
+                    student_code=code,
+                    conversation=conversation,
+                    lab_id=data.get("lab_id"),
+                    language=data.get("language", "python")
                 )
-                
-                # Send response
-                await websocket.send_json({
-                    "type": "message",
-                    "response": response["answer"],
-                    "sources": response.get("sources", [])
-                })
+                async with aclosing(events):
+                    async for event in events:
+                        await websocket.send_json(event)
+            
+            except WebSocketDisconnect:
+                raise
             
             except Exception as e:
                 await websocket.send_json({
@@ -165,10 +236,12 @@ async def websocket_chat(websocket: WebSocket):
                     "message": f"Error: {str(e)}"
                 })
             
-            finally:
-                # Clear typing indicator
-                await websocket.send_json({"type": "typing", "status": False})
+            # Clear typing indicator
+            await websocket.send_json({"type": "typing", "status": False})
     
     except WebSocketDisconnect:
         print("Client disconnected from chat")
+    
+    finally:
+        conversation.close()
 
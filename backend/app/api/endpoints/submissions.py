@@ -3,20 +3,71 @@ Submission Endpoints
 Handle code submission and execution in the sandbox.
 """
 
-from fastapi import APIRouter, HTTPException
+import asyncio
+import time
+from contextlib import aclosing
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from typing import Optional
 
+from app.core.config import settings
 from app.grader.runner import run_code_in_sandbox
+from app.grader.grading import grade_code
+from app.grader.pool import get_pool_stats
+from app.grader.executor import SandboxBusyError, get_admission_stats
+from app.grader.compile_cache import get_compile_cache_stats
+from app.grader.result_cache import get_result_cache_stats
+from app.grader.streaming import stream_code_in_sandbox
+from app.grader.metrics import get_run_metrics
+from app.grader.job_queue import get_job_queue, get_job_queue_stats
 
 
 router = APIRouter()
 
+# Long-polling limits for /jobs/{job_id}
+MAX_JOB_WAIT = 30  # seconds
+JOB_POLL_INTERVAL = 0.1  # seconds
+
+
+def sandbox_busy(e: SandboxBusyError) -> HTTPException:
+    """Turn a full admission queue into a 429 the frontend can retry on."""
+    return HTTPException(
+        status_code=429,
+        detail={
+            "message": str(e),
+            "queue_length": e.queue_length,
+            "retry_after": e.retry_after
+        },
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+
+async def enqueue_job(kind: str, payload: dict) -> JSONResponse:
+    """Hand a run to the worker processes and answer 202 with the job ID."""
+    queue = get_job_queue()
+    pending = await asyncio.to_thread(queue.pending)
+    if pending >= settings.job_queue_max_pending:
+        raise sandbox_busy(SandboxBusyError(pending, settings.sandbox_timeout))
+    
+    job_id = await asyncio.to_thread(queue.enqueue, kind, payload)
+    return JSONResponse(
+        status_code=202,
+        content={
+            "job_id": job_id,
+            "status": "queued",
+            "poll": f"/api/submissions/jobs/{job_id}"
+        }
+    )
+
 
 class SubmissionRequest(BaseModel):
     code: str
     language: str = "python"
     lab_id: Optional[str] = None
+    stdin: Optional[str] = None
+    no_cache: bool = False  # skip the result cache (randomness, time, etc.)
+    stop_on_failure: bool = False  # /submit: skip remaining tests after a failure
 
 
 class SubmissionResponse(BaseModel):
@@ -24,27 +75,53 @@ class SubmissionResponse(BaseModel):
     output: str
     error: Optional[str] = None
     execution_time: Optional[float] = None
+    cpu_user: Optional[float] = None
+    cpu_system: Optional[float] = None
+    peak_memory: Optional[int] = None  # bytes
+    oom_killed: bool = False
+    cached: bool = False
 
 
 @router.post("/run", response_model=SubmissionResponse)
 async def run_code(request: SubmissionRequest):
     """
     Execute code in a secure sandbox environment.
-    Returns stdout/stderr and execution status.
+    Returns stdout/stderr and execution status, or a job ID to poll when
+    the job queue is enabled.
     """
+    if settings.job_queue_enabled:
+        return await enqueue_job("run", {
+            "code": request.code,
+            "language": request.language,
+            "stdin": request.stdin,
+            "use_cache": not request.no_cache,
+            "lab_id": request.lab_id
+        })
+    
     try:
         result = await run_code_in_sandbox(
             code=request.code,
-            language=request.language
+            language=request.language,
+            stdin=request.stdin,
+            use_cache=not request.no_cache,
+            lab_id=request.lab_id
         )
         
         return SubmissionResponse(
             success=result["success"],
             output=result["output"],
             error=result.get("error"),
-            execution_time=result.get("execution_time")
+            execution_time=result.get("execution_time"),
+            cpu_user=result.get("cpu_user"),
+            cpu_system=result.get("cpu_system"),
+            peak_memory=result.get("peak_memory"),
+            oom_killed=result.get("oom_killed", False),
+            cached=result.get("cached", False)
         )
     
+    except SandboxBusyError as e:
+        raise sandbox_busy(e)
+    
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -56,21 +133,110 @@ async def run_code(request: SubmissionRequest):
 async def submit_code(request: SubmissionRequest):
     """
     Submit code for grading.
-    Runs tests and returns results.
+    Runs the lab's test suite in one sandbox launch and returns a verdict
+    and timing per test case, or a job ID to poll when the job queue is
+    enabled.
     """
-    # Run the code first
-    result = await run_code_in_sandbox(
-        code=request.code,
-        language=request.language
-    )
+    payload = {
+        "code": request.code,
+        "language": request.language,
+        "lab_id": request.lab_id,
+        "stdin": request.stdin,
+        "use_cache": not request.no_cache,
+        "stop_on_failure": request.stop_on_failure
+    }
+    if settings.job_queue_enabled:
+        return await enqueue_job("submit", payload)
     
-    # TODO: Add test case execution and grading logic
+    try:
+        report = await grade_code(**payload)
+    except SandboxBusyError as e:
+        raise sandbox_busy(e)
+    except ValueError as e:
+        raise HTTPException(status_code=500, detail=f"Invalid test suite: {str(e)}")
     
+    return {"submission_id": "demo-submission-001", **report}
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = 0):
+    """
+    Status of a queued run or submission.
+    Pass `wait` (seconds) to long-poll until the job finishes; `result`
+    holds the same body /run or /submit would have returned.
+    """
+    if not settings.job_queue_enabled:
+        raise HTTPException(status_code=404, detail="Job queue is not enabled")
+    
+    queue = get_job_queue()
+    deadline = time.monotonic() + min(max(wait, 0), MAX_JOB_WAIT)
+    while True:
+        job = await asyncio.to_thread(queue.get, job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+        if job["status"] in ("done", "failed") or time.monotonic() >= deadline:
+            return job
+        await asyncio.sleep(JOB_POLL_INTERVAL)
+
+
+@router.websocket("/ws")
+async def websocket_run(websocket: WebSocket):
+    """
+    WebSocket endpoint for streaming runs.
+    Send {"code", "language", "stdin"}; stdout/stderr chunks are forwarded
+    as the program produces them, followed by an exit message.
+    """
+    await websocket.accept()
+    
+    try:
+        while True:
+            data = await websocket.receive_json()
+            
+            try:
+                events = stream_code_in_sandbox(
+                    code=data.get("code", ""),
+                    language=data.get("language", "python"),
+                    stdin=data.get("stdin"),
+                    lab_id=data.get("lab_id")
+                )
+                async with aclosing(events):
+                    async for event in events:
+                        await websocket.send_json(event)
+            
+            except SandboxBusyError as e:
+                await websocket.send_json({
+                    "type": "busy",
+                    "message": str(e),
+                    "queue_length": e.queue_length,
+                    "retry_after": e.retry_after
+                })
+            
+            except WebSocketDisconnect:
+                raise
+            
+            except Exception as e:
+                await websocket.send_json({
+                    "type": "error",
+                    "message": f"Execution error: {str(e)}"
+                })
+    
+    except WebSocketDisconnect:
+        print("Client disconnected from run stream")
+
+
+@router.get("/stats")
+async def sandbox_stats():
+    """
+    Sandbox runtime statistics.
+    Reports warm container pool occupancy, hit/miss counts per image,
+    admission queue depth, compile/result cache usage, job queue depth,
+    and resource usage histograms per language and per lab.
+    """
     return {
-        "submission_id": "demo-submission-001",
-        "status": "completed",
-        "execution_result": result,
-        "tests_passed": 0,
-        "tests_total": 0,
-        "feedback": "Submission received. Test grading not yet implemented."
+        "pool": get_pool_stats(),
+        "admission": get_admission_stats(),
+        "compile_cache": get_compile_cache_stats(),
+        "result_cache": get_result_cache_stats(),
+        "jobs": get_job_queue_stats(),
+        "usage": get_run_metrics()
     }
@@ -15,6 +15,30 @@ class Settings(BaseSettings):
     
     # ChromaDB
     chroma_persist_dir: str = "./chroma_db"
+    vector_backend: str = "chroma"  # chroma | flat (memory-mapped NumPy matrix, exact search)
+    flat_quantization: str = "none"  # none | int8 (flat backend: scan int8 codes, re-rank candidates exactly)
+    flat_rerank_candidates: int = 50  # rows re-scored with float32 after an int8 scan
+    hybrid_retrieval: bool = True  # fuse BM25 keyword search with vector search
+    hybrid_candidates: int = 20  # results taken from each retriever before fusion
+    hybrid_rrf_k: int = 60  # reciprocal rank fusion constant
+    lexical_fast_path_confidence: float = 0.5  # BM25 match strength (0-1) that skips the vector search...
+    lexical_fast_path_margin: float = 2.0  # ...when the best hit also scores this many times the next
+    rag_preload: bool = True  # load and warm the embedding model and index at startup
+    rag_watch: bool = False  # apply knowledge base file edits while running
+    rag_watch_interval: float = 2.0  # seconds between checks for edits
+    ingest_workers: int = 1  # processes that parse and embed during ingestion (1 = in-process)
+    ingest_batch_size: int = 64  # chunks per embedding batch
+    
+    # Query Embedding Cache (vectors for repeated retrieval queries)
+    query_cache_enabled: bool = True
+    query_cache_max_bytes: int = 16 * 1024 * 1024
+    query_cache_ttl: int = 3600  # seconds
+    
+    # Semantic Answer Cache (reuse TA answers for similar questions per lab)
+    answer_cache_enabled: bool = True
+    answer_cache_threshold: float = 0.92  # cosine similarity needed for a hit
+    answer_cache_max_bytes: int = 16 * 1024 * 1024
+    answer_cache_ttl: int = 6 * 3600  # seconds
     
     # Security
     secret_key: str = "your-secret-key-change-in-production"
@@ -24,9 +48,84 @@ class Settings(BaseSettings):
     # Groq Model
     groq_model: str = "llama-3.3-70b-versatile"
     
+    # LLM Provider
+    llm_provider: str = "groq"  # groq | openai (any OpenAI-compatible server, e.g. app.ai_engine.llm.stub_server)
+    llm_base_url: str = "http://127.0.0.1:9000/v1"  # for llm_provider = "openai"
+    llm_api_key: str = ""  # for llm_provider = "openai"
+    llm_timeout: float = 30.0  # seconds per attempt
+    llm_deadline: float = 60.0  # seconds per call, including rate-limit waits, retries and backoff
+    llm_max_connections: int = 20  # shared HTTP connection pool size
+    llm_max_retries: int = 3  # extra attempts after a 429, 5xx, timeout or connection error
+    llm_backoff_base: float = 0.5  # seconds; doubled per retry, with full jitter
+    llm_backoff_max: float = 8.0
+    llm_rate_limit_rpm: int = 30  # requests per minute allowed by the API plan (per process; 0 = no limit)
+    llm_rate_limit_tpm: int = 12000  # tokens per minute allowed by the API plan (per process; 0 = no limit)
+    llm_breaker_failures: int = 5  # consecutive upstream failures that open the circuit
+    llm_breaker_cooldown: float = 30.0  # seconds calls fail fast before a trial call is let through
+    
+    # TA Prompt
+    prompt_token_budget: int = 3000  # estimated input tokens per TA request
+    prompt_code_max_tokens: int = 1200  # student code beyond this is trimmed around the relevant lines
+    prompt_question_max_tokens: int = 400
+    prompt_evidence_max_tokens: int = 400  # code run output and static check findings
+    single_flight_enabled: bool = True  # identical concurrent TA questions share one completion
+    
+    # TA Tools (gathered concurrently with retrieval before the completion)
+    ta_tools_enabled: bool = False  # run the student's code and static checks for each question
+    ta_gather_budget: float = 4.0  # seconds the completion waits for evidence at most
+    ta_retrieval_timeout: float = 4.0
+    ta_run_timeout: float = 3.0  # a slower run is left out of the prompt
+    ta_analysis_timeout: float = 0.5
+    ta_run_max_concurrency: int = 2  # chat code runs at once, admitted apart from /run and /submit
+    ta_run_queue_size: int = 4  # chat code runs allowed to wait (beyond that the run is skipped)
+    
+    # Conversation Memory (per chat WebSocket connection)
+    conversation_turns: int = 3  # most recent turns sent verbatim
+    conversation_turn_max_tokens: int = 300  # each remembered answer is cut to this
+    conversation_summary_max_tokens: int = 250  # older turns are folded into a summary of at most this
+    conversation_summary_llm: bool = True  # write the summary with the LLM (else a digest of the questions)
+    conversation_summary_deadline: float = 10.0  # seconds before falling back to the digest
+    
     # Docker Sandbox Settings
     sandbox_timeout: int = 5  # seconds
     sandbox_memory_limit: str = "128m"
+    sandbox_compile_timeout: int = 30  # seconds, for C/C++/Java builds
+    sandbox_backend: str = "auto"  # auto | docker | subprocess | forkserver
+    sandbox_stream_max_bytes: int = 1024 * 1024  # output cap for streamed runs
+    sandbox_output_max_bytes: int = 64 * 1024  # captured output kept per stream (head + tail)
+    
+    # Python Forkserver (sandbox_backend = "forkserver")
+    forkserver_preload: str = "math,random,collections,itertools,functools,json,re,numpy"
+    forkserver_socket: str = ""  # defaults to a per-process path in the temp dir
+    
+    # Warm Container Pool
+    sandbox_pool_enabled: bool = True
+    sandbox_pool_size: int = 2  # warm containers kept per image
+    sandbox_pool_max_uses: int = 20  # runs before a container is recycled
+    sandbox_pool_idle_timeout: int = 300  # seconds before idle containers are evicted
+    sandbox_user: str = "65534:65534"  # uid:gid programs run as in pooled containers (nobody)
+    
+    # Sandbox Admission
+    sandbox_max_concurrency: int = 8  # runs executing at once
+    sandbox_queue_size: int = 200  # runs allowed to wait for a slot
+    
+    # Compile Cache (C, C++, Java build artifacts)
+    compile_cache_enabled: bool = True
+    compile_cache_dir: str = "./compile_cache"
+    compile_cache_max_bytes: int = 256 * 1024 * 1024
+    
+    # Result Cache (opt-in memoization of deterministic runs)
+    result_cache_enabled: bool = False
+    result_cache_ttl: int = 600  # seconds
+    result_cache_max_bytes: int = 32 * 1024 * 1024
+    
+    # Job Queue (runs handed to `python -m app.grader.worker` processes)
+    job_queue_enabled: bool = False
+    job_queue_path: str = "./job_queue.db"
+    job_queue_max_pending: int = 1000  # queued jobs before /run and /submit answer 429
+    job_worker_concurrency: int = 4  # jobs each worker process runs at once
+    job_lease_timeout: int = 60  # seconds before a silent worker's job is retried
+    job_result_ttl: int = 3600  # seconds finished jobs are kept for polling
     
     class Config:
         env_file = ".env"
@@ -0,0 +1,71 @@
+"""
+Sandbox Backend Benchmark
+Compares the per-run subprocess spawn of the fallback path with the
+preforked Python forkserver on a few typical lab programs.
+
+Run with:
+    python -m app.grader.benchmark [runs]
+"""
+
+import statistics
+import sys
+import time
+
+from app.core.config import settings
+from app.grader.runner import run_code_fallback_sync
+from app.grader.forkserver import run_code_forkserver, shutdown_forkserver
+
+
+PROGRAMS = {
+    "hello": 'print("Hello, lab!")',
+    "loop": "total = 0\nfor i in range(100000):\n    total += i\nprint(total)",
+    "numpy": "import numpy as np\nprint(np.arange(10).sum())",
+}
+
+
+def time_backend(run, code: str, runs: int) -> list:
+    """Wall-clock latency in milliseconds of `runs` calls to `run(code)`."""
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = run(code)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if not result["success"]:
+            print(f"   ⚠️ run failed: {result['error'][:200]}")
+    return latencies
+
+
+def summarize(latencies: list) -> str:
+    ordered = sorted(latencies)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return (
+        f"mean {statistics.mean(ordered):7.1f} ms | "
+        f"p50 {statistics.median(ordered):7.1f} ms | "
+        f"p95 {p95:7.1f} ms"
+    )
+
+
+def main(runs: int = 20):
+    timeout = settings.sandbox_timeout
+    backends = {
+        "spawn": lambda code: run_code_fallback_sync(code, "python", timeout),
+        "forkserver": lambda code: run_code_forkserver(code, timeout),
+    }
+
+    # First forkserver call pays for server startup and preloading
+    start = time.perf_counter()
+    run_code_forkserver("pass", timeout)
+    print(f"🚀 Forkserver started in {(time.perf_counter() - start) * 1000:.0f} ms\n")
+
+    try:
+        for name, code in PROGRAMS.items():
+            print(f"📊 {name} ({runs} runs)")
+            for backend, run in backends.items():
+                print(f"   {backend:<11} {summarize(time_backend(run, code, runs))}")
+            print()
+    finally:
+        shutdown_forkserver()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
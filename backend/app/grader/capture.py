@@ -0,0 +1,70 @@
+"""
+Output Capture
+Bounded-memory capture of program output. The first and last bytes are
+kept and everything in between is dropped and counted, so a program that
+prints without end costs the backend a fixed amount of memory.
+"""
+
+from typing import Iterable, Optional
+
+from app.core.config import settings
+
+
+class OutputCapture:
+    """
+    Head + tail byte buffer with a fixed cap.
+
+    Half of `max_bytes` holds the start of the output, the other half a
+    sliding window over the end. The tail may grow to twice its share
+    before it is trimmed, which keeps many small writes cheap.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None):
+        max_bytes = max_bytes or settings.sandbox_output_max_bytes
+        self.head_limit = max_bytes // 2
+        self.tail_limit = max_bytes - self.head_limit
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total_bytes = 0
+
+    def write(self, data) -> bool:
+        """Append output (bytes or str). Returns True so it can serve as an on_output callback."""
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self.total_bytes += len(data)
+
+        room = self.head_limit - len(self.head)
+        if room > 0:
+            self.head += data[:room]
+            data = data[room:]
+        if data:
+            self.tail += data
+            if len(self.tail) > 2 * self.tail_limit:
+                del self.tail[:len(self.tail) - self.tail_limit]
+        return True
+
+    @property
+    def dropped_bytes(self) -> int:
+        kept = len(self.head) + min(len(self.tail), self.tail_limit)
+        return self.total_bytes - kept
+
+    @property
+    def truncated(self) -> bool:
+        return self.dropped_bytes > 0
+
+    def getvalue(self) -> str:
+        """The captured text, with a marker where output was dropped."""
+        tail = self.tail[-self.tail_limit:] if self.tail_limit else b""
+        text = self.head.decode("utf-8", errors="replace")
+        if self.truncated:
+            text += f"\n... [truncated {self.dropped_bytes} bytes] ...\n"
+        return text + bytes(tail).decode("utf-8", errors="replace")
+
+
+def capture_stream(chunks: Iterable[bytes], max_bytes: Optional[int] = None) -> str:
+    """Drain an iterator of output chunks (e.g. a docker log stream) into a bounded capture."""
+    capture = OutputCapture(max_bytes)
+    for chunk in chunks:
+        if chunk:
+            capture.write(chunk)
+    return capture.getvalue()
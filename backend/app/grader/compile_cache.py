@@ -0,0 +1,170 @@
+"""
+Compile Cache
+Content-addressed, size-bounded LRU cache of compiled C, C++ and Java
+artifacts on local disk.
+
+Entries are keyed by a hash of (source, language, compiler image, compile
+command), so pressing Run again on unchanged code skips the compiler
+entirely and goes straight to execution.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from app.core.config import settings
+
+
+# filename -> (content, file mode)
+Artifacts = Dict[str, Tuple[bytes, int]]
+
+MANIFEST_FILE = "manifest.json"
+
+
+class CompileCache:
+    """
+    LRU cache of build artifacts stored as one directory per key.
+
+    Recency is tracked in memory and mirrored to directory mtimes, so the
+    LRU order survives restarts.
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, int]" = OrderedDict()  # key -> size in bytes
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def _load(self):
+        """Index entries left on disk by a previous process, oldest first."""
+        found = []
+        for entry in self.root.iterdir():
+            manifest = entry / MANIFEST_FILE
+            if not manifest.is_file():
+                # Half-written entry from a crash
+                shutil.rmtree(entry, ignore_errors=True)
+                continue
+            size = sum(
+                f.stat().st_size for f in entry.iterdir()
+                if f.is_file() and f.name != MANIFEST_FILE
+            )
+            found.append((entry.stat().st_mtime, entry.name, size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+        self._evict()
+
+    @staticmethod
+    def make_key(source: str, language: str, image: str, compile_cmd: str) -> str:
+        """Hash everything that can change the compiled output."""
+        digest = hashlib.sha256()
+        for part in (language, image, compile_cmd, source):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Artifacts]:
+        """Return cached artifacts for `key`, or None on a miss."""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+        entry = self.root / key
+        try:
+            manifest = json.loads((entry / MANIFEST_FILE).read_text(encoding="utf-8"))
+            artifacts = {
+                name: ((entry / name).read_bytes(), mode)
+                for name, mode in manifest["files"].items()
+            }
+            os.utime(entry)
+            return artifacts
+        except (OSError, ValueError, KeyError):
+            # Entry vanished or got corrupted - treat as a miss
+            with self._lock:
+                self._entries.pop(key, None)
+                self.hits -= 1
+                self.misses += 1
+            shutil.rmtree(entry, ignore_errors=True)
+            return None
+
+    def put(self, key: str, artifacts: Artifacts):
+        """Store artifacts for `key`, evicting least recently used entries."""
+        if not artifacts:
+            return
+        size = sum(len(content) for content, _ in artifacts.values())
+        if size > self.max_bytes:
+            return
+
+        # Write into a temp dir first so readers never see partial entries
+        staging = Path(tempfile.mkdtemp(dir=self.root, prefix=".tmp-"))
+        try:
+            for name, (content, mode) in artifacts.items():
+                (staging / name).write_bytes(content)
+            manifest = {"files": {name: mode for name, (_, mode) in artifacts.items()}}
+            (staging / MANIFEST_FILE).write_text(json.dumps(manifest), encoding="utf-8")
+            staging.rename(self.root / key)
+        except OSError:
+            # Another run stored the same key first
+            shutil.rmtree(staging, ignore_errors=True)
+            return
+
+        with self._lock:
+            self._entries[key] = size
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def _evict(self):
+        while self._entries and sum(self._entries.values()) > self.max_bytes:
+            key, _ = self._entries.popitem(last=False)
+            shutil.rmtree(self.root / key, ignore_errors=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "enabled": True,
+                "entries": len(self._entries),
+                "bytes": sum(self._entries.values()),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+            }
+
+
+# Cache instance
+compile_cache: Optional[CompileCache] = None
+_compile_cache_lock = threading.Lock()
+
+
+def get_compile_cache() -> Optional[CompileCache]:
+    """Get or create the compile cache, or None when it is disabled."""
+    global compile_cache
+    if not settings.compile_cache_enabled:
+        return None
+    with _compile_cache_lock:
+        if compile_cache is None:
+            compile_cache = CompileCache(
+                root=settings.compile_cache_dir,
+                max_bytes=settings.compile_cache_max_bytes
+            )
+    return compile_cache
+
+
+def get_compile_cache_stats() -> dict:
+    """Compile cache statistics for the stats endpoint."""
+    if compile_cache is None:
+        return {"enabled": settings.compile_cache_enabled}
+    return compile_cache.stats()
@@ -0,0 +1,179 @@
+"""
+Sandbox Executor
+Runs blocking sandbox work (docker SDK calls, subprocesses) on a dedicated
+thread pool so it never stalls the event loop, behind a FIFO admission queue
+with a global concurrency cap.
+
+When every slot is busy and the queue is full, new work is rejected with
+SandboxBusyError instead of piling up, which the API turns into a 429.
+
+Code runs the TA makes while answering chat questions go through a second,
+smaller executor, so chat traffic can never take slots from graded work.
+"""
+
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from app.core.config import settings
+
+
+class SandboxBusyError(Exception):
+    """Raised when the admission queue is full."""
+
+    def __init__(self, queue_length: int, retry_after: int):
+        self.queue_length = queue_length
+        self.retry_after = retry_after
+        super().__init__(
+            f"Sandbox is busy ({queue_length} runs waiting). Try again in {retry_after}s."
+        )
+
+
+class SandboxExecutor:
+    """
+    Bounded-concurrency executor for sandbox runs.
+
+    At most `sandbox_max_concurrency` runs execute at once; up to
+    `sandbox_queue_size` more wait in arrival order for a free slot.
+    """
+
+    def __init__(self, max_concurrency: int, max_waiting: int):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_waiting = max(0, max_waiting)
+        self._pool = ThreadPoolExecutor(
+            max_workers=self.max_concurrency,
+            thread_name_prefix="sandbox"
+        )
+        self._running = 0
+        self._waiters = deque()
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+
+    def queue_length(self) -> int:
+        return sum(1 for waiter in self._waiters if not waiter.done())
+
+    async def _acquire(self):
+        if self._running < self.max_concurrency and not self._waiters:
+            self._running += 1
+            self.admitted += 1
+            return
+
+        waiting = self.queue_length()
+        if waiting >= self.max_waiting:
+            self.rejected += 1
+            # Rough guess: each queued batch takes about one timeout to drain
+            batches = waiting // self.max_concurrency + 1
+            raise SandboxBusyError(waiting, batches * settings.sandbox_timeout)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.queued += 1
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed to us just as we were cancelled
+                self._release()
+            else:
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+            raise
+        self.admitted += 1
+
+    def _release(self):
+        # Hand the slot straight to the oldest live waiter (FIFO)
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._running -= 1
+
+    async def submit(self, func: Callable, *args):
+        """
+        Run `func(*args)` on the sandbox thread pool once admitted.
+
+        Raises:
+            SandboxBusyError: if the admission queue is full
+        """
+        await self._acquire()
+        try:
+            run = asyncio.get_running_loop().run_in_executor(self._pool, func, *args)
+        except BaseException:
+            self._release()
+            raise
+        # The slot is held until the thread is done, even if the caller is
+        # cancelled (client gone) while the run is still executing
+        run.add_done_callback(self._run_finished)
+        return await asyncio.shield(run)
+
+    def _run_finished(self, run: asyncio.Future):
+        if not run.cancelled():
+            run.exception()  # retrieved, so an abandoned run's error is not logged as unhandled
+        self._release()
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_waiting,
+            "running": self._running,
+            "waiting": self.queue_length(),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+# Executor instance
+sandbox_executor: Optional[SandboxExecutor] = None
+
+
+def get_sandbox_executor() -> SandboxExecutor:
+    """Get or create the shared sandbox executor."""
+    global sandbox_executor
+    if sandbox_executor is None:
+        sandbox_executor = SandboxExecutor(
+            max_concurrency=settings.sandbox_max_concurrency,
+            max_waiting=settings.sandbox_queue_size
+        )
+    return sandbox_executor
+
+
+# Executor for the TA's own code runs (chat questions)
+ta_executor: Optional[SandboxExecutor] = None
+
+
+def get_ta_executor() -> SandboxExecutor:
+    """Get or create the executor for code runs made by the TA."""
+    global ta_executor
+    if ta_executor is None:
+        ta_executor = SandboxExecutor(
+            max_concurrency=settings.ta_run_max_concurrency,
+            max_waiting=settings.ta_run_queue_size
+        )
+    return ta_executor
+
+
+def get_admission_stats() -> dict:
+    """Admission queue statistics for the stats endpoint."""
+    stats = get_sandbox_executor().stats()
+    stats["ta_runs"] = ta_executor.stats() if ta_executor is not None else None
+    return stats
+
+
+def shutdown_sandbox_executor():
+    """Stop the sandbox thread pools on application shutdown."""
+    global sandbox_executor, ta_executor
+    if sandbox_executor is not None:
+        sandbox_executor.shutdown()
+        sandbox_executor = None
+    if ta_executor is not None:
+        ta_executor.shutdown()
+        ta_executor = None
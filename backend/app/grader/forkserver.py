@@ -0,0 +1,486 @@
+"""
+Python Forkserver
+Fast subprocess backend for Python runs: a long-lived parent interpreter
+with common lab modules preimported forks a fresh child per submission,
+so a run no longer pays for interpreter startup and `import numpy`.
+
+Each request is handled by a forked supervisor that forks the actual worker,
+applies rlimits (CPU, address space, open files) in the worker, enforces the
+wall-clock timeout, and reports output plus rusage back over a Unix socket.
+
+⚠️ Like the plain subprocess fallback, this is not an isolation boundary -
+only use it in development or on trusted machines.
+
+Run the server by hand with:
+    python -m app.grader.forkserver <socket_path> [module,module,...]
+"""
+
+import codecs
+import json
+import linecache
+import os
+import selectors
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from typing import Callable, Optional
+
+# Unix only - the forkserver backend is unavailable without it
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from app.core.config import settings
+from app.grader.capture import OutputCapture
+
+
+TIMEOUT_MESSAGE = "⏰ Execution timed out. Your code may have an infinite loop."
+
+
+def parse_memory_limit(limit: str) -> int:
+    """Convert a docker-style memory limit ("128m", "1g") to bytes."""
+    units = {"k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}
+    limit = limit.strip().lower()
+    if limit and limit[-1] in units:
+        return int(float(limit[:-1]) * units[limit[-1]])
+    return int(limit)
+
+
+# Server side (runs in the preloaded parent interpreter)
+
+def _virtual_memory_bytes() -> int:
+    """Current virtual size of this process (what RLIMIT_AS counts)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+def _run_worker(conn: socket.socket, stdin_fd: int, stdout_fd: int, stderr_fd: int, memory_fd: int, request: dict):
+    """
+    Body of the forked worker: apply limits, then run the student's code.
+
+    An uncaught MemoryError is reported on `memory_fd` rather than through
+    the exit status or stderr, which the student's code also controls.
+    """
+    conn.close()  # the student's code must not be able to forge a response
+    code = request["code"]
+    os.setsid()  # own process group so the supervisor can kill everything
+    os.dup2(stdin_fd, 0)
+    os.dup2(stdout_fd, 1)
+    os.dup2(stderr_fd, 2)
+
+    # SIGXCPU at the soft limit; SIGKILL a second later if that is ignored
+    cpu = int(request["timeout"]) + 1
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 1))
+    # The preloaded interpreter already maps a lot of address space, so the
+    # budget is granted on top of what the fork inherited.
+    address_space = _virtual_memory_bytes() + int(request["memory_limit"])
+    resource.setrlimit(resource.RLIMIT_AS, (address_space, address_space))
+    resource.setrlimit(resource.RLIMIT_NOFILE, (64, 64))
+
+    sys.stdin = open(0, "r", encoding="utf-8", closefd=False)
+    # Line buffering lets streamed runs show output as it is printed
+    buffering = 1 if request.get("line_buffered") else -1
+    sys.stdout = open(1, "w", encoding="utf-8", closefd=False, buffering=buffering)
+    sys.stderr = open(2, "w", encoding="utf-8", closefd=False, buffering=buffering)
+    sys.argv = ["main.py"]
+    # Tracebacks should show the student's lines, not a main.py on disk
+    linecache.cache["main.py"] = (len(code), None, code.splitlines(True), "main.py")
+
+    exit_code = 0
+    try:
+        exec(compile(code, "main.py", "exec"), {"__name__": "__main__"})
+    except SystemExit as e:
+        if isinstance(e.code, int):
+            exit_code = e.code
+        elif e.code is not None:
+            print(e.code, file=sys.stderr)
+            exit_code = 1
+    except MemoryError as e:
+        # RLIMIT_AS refused an allocation
+        os.write(memory_fd, b"1")
+        exit_code = 1
+        try:
+            traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+        except BaseException:
+            # Formatting the traceback can need the memory that ran out
+            os.write(2, b"MemoryError\n")
+    except BaseException as e:
+        # Drop this frame so the traceback starts at the student's code
+        traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+        exit_code = 1
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        except Exception:
+            pass
+    os._exit(exit_code)
+
+
+def _supervise(conn: socket.socket):
+    """Handle one request: fork the worker, collect output, enforce the timeout."""
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    request = json.loads(conn.makefile("rb").readline())
+    timeout = float(request["timeout"])
+
+    stdin_file = tempfile.TemporaryFile()
+    stdin_file.write((request.get("stdin") or "").encode("utf-8"))
+    stdin_file.seek(0)
+    stdout_r, stdout_w = os.pipe()
+    stderr_r, stderr_w = os.pipe()
+    memory_r, memory_w = os.pipe()
+
+    start_time = time.time()
+    pid = os.fork()
+    if pid == 0:
+        os.close(stdout_r)
+        os.close(stderr_r)
+        os.close(memory_r)
+        _run_worker(conn, stdin_file.fileno(), stdout_w, stderr_w, memory_w, request)
+    os.close(stdout_w)
+    os.close(stderr_w)
+    os.close(memory_w)
+
+    # Output is forwarded as JSON lines while the program runs
+    names = {stdout_r: "stdout", stderr_r: "stderr"}
+    decoders = {fd: codecs.getincrementaldecoder("utf-8")(errors="replace") for fd in names}
+    client_gone = False
+
+    def forward(fd: int, data: bytes, final: bool = False):
+        nonlocal client_gone
+        text = decoders[fd].decode(data, final=final)
+        if text and not client_gone:
+            try:
+                _send(conn, {"type": names[fd], "data": text})
+            except OSError:
+                client_gone = True
+
+    selector = selectors.DefaultSelector()
+    for fd in names:
+        selector.register(fd, selectors.EVENT_READ)
+
+    # A pidfd becomes readable when the worker exits, so we can sleep in
+    # select() instead of polling waitpid; fall back to polling without it.
+    try:
+        exit_fd = os.pidfd_open(pid)
+        selector.register(exit_fd, selectors.EVENT_READ)
+    except (AttributeError, OSError):
+        exit_fd = None
+
+    deadline = start_time + timeout
+    timed_out = False
+    done, status, usage = 0, None, None
+    while not client_gone:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            timed_out = True
+            break
+
+        exited = exit_fd is None
+        poll = remaining if exit_fd is not None else min(remaining, 0.01)
+        for key, _ in selector.select(timeout=poll):
+            if key.fd == exit_fd:
+                exited = True
+                continue
+            data = os.read(key.fd, 65536)
+            if data:
+                forward(key.fd, data)
+            else:
+                selector.unregister(key.fd)
+
+        if exited:
+            done, status, usage = os.wait4(pid, os.WNOHANG)
+        if done:
+            # Pick up whatever is still buffered in the pipes
+            for fd in names:
+                os.set_blocking(fd, False)
+                try:
+                    while True:
+                        data = os.read(fd, 65536)
+                        if not data:
+                            break
+                        forward(fd, data)
+                except BlockingIOError:
+                    pass
+                forward(fd, b"", final=True)
+            break
+
+    execution_time = time.time() - start_time
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+    if not done:
+        _, status, usage = os.wait4(pid, 0)
+
+    # RLIMIT_AS makes allocations fail instead of summoning the OOM killer;
+    # the worker flags an uncaught MemoryError (a leftover child of the
+    # program may still hold the pipe, so never block on it)
+    os.set_blocking(memory_r, False)
+    try:
+        memory_error = os.read(memory_r, 1) == b"1"
+    except BlockingIOError:
+        memory_error = False
+    os.close(memory_r)
+
+    if client_gone:
+        return
+    returncode = os.waitstatus_to_exitcode(status)
+    killed_by = -returncode if os.WIFSIGNALED(status) else None
+    cpu_time = usage.ru_utime + usage.ru_stime if usage else 0.0
+    # RLIMIT_CPU ends the worker with SIGXCPU, or SIGKILL at the hard limit
+    cpu_limited = not timed_out and (
+        killed_by == signal.SIGXCPU
+        or (killed_by == signal.SIGKILL and cpu_time >= int(timeout) + 1)
+    )
+    _send(conn, {
+        "type": "exit",
+        "returncode": returncode,
+        "execution_time": execution_time,
+        "timed_out": timed_out or cpu_limited,
+        "oom_killed": memory_error and returncode != 0 and not cpu_limited,
+        "cpu_user": usage.ru_utime if usage else None,
+        "cpu_system": usage.ru_stime if usage else None,
+        # Includes the pages shared with the preloaded parent
+        "peak_memory": usage.ru_maxrss * 1024 if usage else None,
+        "signal": killed_by,
+    })
+
+
+def _send(conn: socket.socket, event: dict):
+    conn.sendall(json.dumps(event).encode("utf-8") + b"\n")
+
+
+def serve(socket_path: str, preload: list):
+    """Preimport `preload`, then fork a supervisor per connection forever."""
+    # Fork-unsafe thread pools (OpenBLAS, OpenMP) must stay single-threaded
+    os.environ.setdefault("OPENBLAS_NUM_THREADS", "1")
+    os.environ.setdefault("OMP_NUM_THREADS", "1")
+
+    for module in preload:
+        try:
+            __import__(module)
+        except Exception as e:
+            print(f"⚠️ forkserver could not preload {module}: {e}", file=sys.stderr)
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    os.chmod(socket_path, 0o600)
+    server.listen(128)
+
+    # Let the client know we are ready to accept work
+    print("ready", flush=True)
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)  # auto-reap supervisors
+
+    while True:
+        conn, _ = server.accept()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        if os.fork() == 0:
+            server.close()
+            try:
+                _supervise(conn)
+            except BaseException:
+                traceback.print_exc()
+            finally:
+                os._exit(0)
+        conn.close()
+
+
+# Client side (runs in the API process)
+
+class ForkServerClient:
+    """Starts the forkserver on demand and sends it run requests."""
+
+    def __init__(self, socket_path: str, preload: list):
+        self.socket_path = socket_path
+        self.preload = preload
+        self._process: Optional[subprocess.Popen] = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._process is not None and self._process.poll() is None:
+                return
+            backend_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+            self._process = subprocess.Popen(
+                [sys.executable, "-m", "app.grader.forkserver",
+                 self.socket_path, ",".join(self.preload)],
+                cwd=backend_dir,
+                stdout=subprocess.PIPE,
+                text=True
+            )
+            if self._process.stdout.readline().strip() != "ready":
+                self._process.kill()
+                self._process = None
+                raise RuntimeError("forkserver failed to start")
+
+    def run(
+        self,
+        code: str,
+        timeout: int,
+        memory_limit: int,
+        stdin: Optional[str] = None,
+        on_output: Optional[Callable[[str, str], bool]] = None
+    ) -> dict:
+        """
+        Run Python code in a forked child.
+
+        Output chunks are collected into bounded head + tail captures for
+        "stdout"/"stderr" in the returned exit event, or handed to
+        `on_output(stream, text)` as they arrive when a callback is given.
+        Returning False from the callback stops the run; the returned event
+        then has "stopped" set.
+        """
+        self._ensure_started()
+        request = {
+            "code": code,
+            "stdin": stdin,
+            "timeout": timeout,
+            "memory_limit": memory_limit,
+            "line_buffered": on_output is not None,
+        }
+        output = {"stdout": OutputCapture(), "stderr": OutputCapture()}
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+            conn.connect(self.socket_path)
+            # Supervisor enforces the timeout; this only guards against a wedged server
+            conn.settimeout(timeout + 10)
+            conn.sendall(json.dumps(request).encode("utf-8") + b"\n")
+            conn.shutdown(socket.SHUT_WR)
+            for line in conn.makefile("rb"):
+                event = json.loads(line)
+                if event["type"] == "exit":
+                    event["stdout"] = output["stdout"].getvalue()
+                    event["stderr"] = output["stderr"].getvalue()
+                    return event
+                if on_output is None:
+                    output[event["type"]].write(event["data"])
+                elif on_output(event["type"], event["data"]) is False:
+                    # Closing the socket makes the supervisor kill the worker
+                    return {"type": "exit", "stopped": True, "stdout": "", "stderr": ""}
+        raise RuntimeError("forkserver closed the connection without a result")
+
+    def shutdown(self):
+        with self._lock:
+            if self._process is not None:
+                self._process.kill()
+                self._process.wait()
+                self._process = None
+        try:
+            os.unlink(self.socket_path)
+        except OSError:
+            pass
+
+
+# Client instance (server is spawned on first use)
+forkserver_client: Optional[ForkServerClient] = None
+_forkserver_lock = threading.Lock()
+
+
+def get_forkserver_client() -> ForkServerClient:
+    """Get or create the forkserver client."""
+    global forkserver_client
+    with _forkserver_lock:
+        if forkserver_client is None:
+            socket_path = settings.forkserver_socket or os.path.join(
+                tempfile.gettempdir(), f"autonomous-ta-forkserver-{os.getpid()}.sock"
+            )
+            preload = [m.strip() for m in settings.forkserver_preload.split(",") if m.strip()]
+            forkserver_client = ForkServerClient(socket_path, preload)
+    return forkserver_client
+
+
+def run_code_forkserver(
+    code: str,
+    timeout: int,
+    stdin: Optional[str] = None,
+    on_output: Optional[Callable[[str, str], bool]] = None
+) -> dict:
+    """
+    Execute Python code through the forkserver.
+
+    With `on_output`, stdout/stderr are streamed to the callback instead of
+    being returned in the result.
+
+    Returns:
+        dict with success, output, error, execution_time, timed_out, and
+        resource usage (cpu_user, cpu_system, peak_memory, oom_killed)
+    """
+    try:
+        response = get_forkserver_client().run(
+            code,
+            timeout=timeout,
+            memory_limit=parse_memory_limit(settings.sandbox_memory_limit),
+            stdin=stdin,
+            on_output=on_output
+        )
+    except Exception as e:
+        return {
+            "success": False,
+            "output": "",
+            "error": f"Forkserver error: {e}",
+            "execution_time": None,
+            "timed_out": False
+        }
+
+    if response.get("stopped"):
+        return {
+            "success": False,
+            "output": "",
+            "error": "",
+            "execution_time": None,
+            "timed_out": False
+        }
+
+    usage = {
+        "cpu_user": response.get("cpu_user"),
+        "cpu_system": response.get("cpu_system"),
+        "peak_memory": response.get("peak_memory"),
+        "oom_killed": response.get("oom_killed", False),
+    }
+
+    if response["timed_out"]:
+        return {
+            "success": False,
+            "output": "",
+            "error": TIMEOUT_MESSAGE,
+            "execution_time": timeout,
+            "timed_out": True,
+            **usage
+        }
+
+    return {
+        "success": response["returncode"] == 0,
+        "output": response["stdout"],
+        "error": response["stderr"],
+        "execution_time": response["execution_time"],
+        "timed_out": False,
+        **usage
+    }
+
+
+def shutdown_forkserver():
+    """Stop the forkserver on application shutdown."""
+    global forkserver_client
+    if forkserver_client is not None:
+        forkserver_client.shutdown()
+        forkserver_client = None
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python -m app.grader.forkserver <socket_path> [module,module,...]")
+        sys.exit(1)
+    modules = sys.argv[2].split(",") if len(sys.argv) > 2 and sys.argv[2] else []
+    serve(sys.argv[1], modules)
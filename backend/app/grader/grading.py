@@ -0,0 +1,407 @@
+"""
+Test Suite Grading
+Grades a submission against its lab's test suite in a single sandbox
+launch: the harness (sandbox/worker/run_code.py in suite mode) is placed
+next to the code and runs the program once per test case.
+
+Suites live in sandbox/suites/<lab_id>.json.
+"""
+
+import importlib.util
+import json
+import re
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+from app.core.config import settings
+from app.grader.executor import get_sandbox_executor
+from app.grader.metrics import record_run
+from app.grader.pool import get_warm_pool
+from app.grader.runner import (
+    get_docker_client,
+    prepare_docker_run,
+    run_code_in_sandbox,
+    run_code_sync,
+    run_in_new_container,
+    run_in_warm_container,
+)
+
+
+# Path to the sandbox folder (harness and test suites)
+SANDBOX_PATH = Path(__file__).parent.parent.parent.parent / "sandbox"
+SUITES_DIR = SANDBOX_PATH / "suites"
+HARNESS_PATH = SANDBOX_PATH / "worker" / "run_code.py"
+
+# Harness and suite are written next to the code; the harness deletes the
+# suite (it holds the hidden cases' expected output) before the program runs
+HARNESS_FILE = ".harness.py"
+SUITE_FILE = ".suite.json"
+
+# The harness runs as root so it can run the program as the sandbox user
+HARNESS_USER = "root"
+
+# Seconds on top of the per-case timeouts for interpreter start-up and reporting
+HARNESS_OVERHEAD = 5
+
+# Characters of output/error kept per case
+MAX_CASE_OUTPUT = 1000
+
+# Room left in the output capture next to the report (e.g. interpreter warnings)
+REPORT_MARGIN = 1024
+
+# Printed instead of a report by images without python3
+HARNESS_UNAVAILABLE = "harness-unavailable"
+HARNESS_COMMAND = (
+    f"if command -v python3 >/dev/null 2>&1; "
+    f"then python3 /code/{HARNESS_FILE} --suite /code/{SUITE_FILE}; "
+    f"else echo {HARNESS_UNAVAILABLE}; fi"
+)
+
+LAB_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+# Harness module, loaded once for its comparison rules
+harness = None
+
+
+def get_harness():
+    """Import the sandbox harness so the backend compares output the same way."""
+    global harness
+    if harness is None:
+        spec = importlib.util.spec_from_file_location("sandbox_harness", HARNESS_PATH)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        harness = module
+    return harness
+
+
+def load_test_suite(lab_id: Optional[str]) -> Optional[dict]:
+    """
+    Load the test suite for a lab.
+
+    A suite is {"timeout", "comparison", "tolerance", "tests": [...]} where
+    each test has "input", "expected" and optionally "name", "timeout",
+    "comparison", "tolerance" and "hidden".
+
+    Returns:
+        The suite dict, or None if the lab has no suite
+
+    Raises:
+        ValueError: if the suite file is malformed
+    """
+    if not lab_id or not LAB_ID_PATTERN.match(lab_id):
+        return None
+
+    path = SUITES_DIR / f"{lab_id}.json"
+    if not path.exists():
+        return None
+
+    suite = json.loads(path.read_text(encoding="utf-8"))
+    tests = suite.get("tests")
+    if not isinstance(tests, list) or not tests:
+        raise ValueError(f"Test suite '{lab_id}' has no tests")
+
+    modes = get_harness().COMPARISON_MODES
+    for index, case in enumerate(tests):
+        case.setdefault("name", f"Test {index + 1}")
+        if "expected" not in case:
+            raise ValueError(f"Test '{case['name']}' in suite '{lab_id}' has no expected output")
+        mode = case.get("comparison", suite.get("comparison", "strip"))
+        if mode not in modes:
+            raise ValueError(f"Test '{case['name']}' in suite '{lab_id}' has unknown comparison '{mode}'")
+
+    return suite
+
+
+async def grade_code(
+    code: str,
+    language: str = "python",
+    lab_id: Optional[str] = None,
+    stdin: Optional[str] = None,
+    use_cache: bool = True,
+    stop_on_failure: bool = False
+) -> dict:
+    """
+    Grade a submission and build the /submit report.
+    Labs without a test suite just run the code once.
+
+    Returns:
+        dict with status, execution_result, tests_passed, tests_total,
+        tests_run, test_results and feedback
+
+    Raises:
+        SandboxBusyError: if the admission queue is full
+        ValueError: if the lab's suite file is malformed
+    """
+    suite = load_test_suite(lab_id)
+
+    if suite is None:
+        result = await run_code_in_sandbox(
+            code=code,
+            language=language,
+            stdin=stdin,
+            use_cache=use_cache,
+            lab_id=lab_id
+        )
+        return {
+            "status": "completed",
+            "execution_result": result,
+            "tests_passed": 0,
+            "tests_total": 0,
+            "tests_run": 0,
+            "test_results": [],
+            "feedback": "Submission received. This lab has no test suite yet."
+        }
+
+    report = await grade_submission(code, language, suite, stop_on_failure, lab_id)
+
+    if report["error"]:
+        feedback = report["error"]
+    else:
+        feedback = f"{report['tests_passed']}/{report['tests_total']} tests passed."
+        if report["stopped_early"]:
+            feedback += " Stopped at the first failing test."
+
+    return {
+        "status": "completed",
+        "execution_result": {
+            key: report[key]
+            for key in ("success", "error", "execution_time", "timed_out",
+                        "cpu_user", "cpu_system", "peak_memory", "oom_killed")
+        },
+        "tests_passed": report["tests_passed"],
+        "tests_total": report["tests_total"],
+        "tests_run": report["tests_run"],
+        "test_results": report["cases"],
+        "feedback": feedback
+    }
+
+
+async def grade_submission(
+    code: str,
+    language: str,
+    suite: dict,
+    stop_on_failure: bool = False,
+    lab_id: Optional[str] = None
+) -> dict:
+    """
+    Run a submission against every case of a test suite.
+
+    Args:
+        code: The code to grade
+        language: Programming language (python, cpp, c, java)
+        suite: Suite from load_test_suite
+        stop_on_failure: Skip the remaining cases after the first failure
+        lab_id: Lab the run belongs to, for per-lab usage metrics
+
+    Returns:
+        dict with success (all cases passed), error, tests_total, tests_run,
+        tests_passed, stopped_early, cases (name, verdict, passed,
+        execution_time, output, error), execution_time, timed_out, and
+        resource usage of the sandbox launch
+
+    Raises:
+        SandboxBusyError: if the admission queue is full
+    """
+    report = await get_sandbox_executor().submit(grade_sync, code, language, suite, stop_on_failure)
+    record_run(language, lab_id, report)
+    return report
+
+
+def grade_sync(code: str, language: str, suite: dict, stop_on_failure: bool) -> dict:
+    """Blocking implementation of grade_submission."""
+    language = language.lower()
+    backend = settings.sandbox_backend
+    payload = {
+        "tests": suite["tests"],
+        "timeout": suite.get("timeout", settings.sandbox_timeout),
+        "comparison": suite.get("comparison", "strip"),
+        "tolerance": suite.get("tolerance", 1e-6),
+        "max_output": MAX_CASE_OUTPUT,
+        "max_capture": settings.sandbox_output_max_bytes,
+        # The report comes back through the same capture and must fit whole
+        "max_report": settings.sandbox_output_max_bytes - REPORT_MARGIN,
+        "stop_on_failure": stop_on_failure
+    }
+    budget = HARNESS_OVERHEAD + sum(
+        case.get("timeout", payload["timeout"]) for case in suite["tests"]
+    )
+
+    if backend == "forkserver" and language in ("python", "python3"):
+        return grade_locally(code, language, suite, payload, budget)
+
+    docker_client = get_docker_client() if backend != "subprocess" else None
+    if docker_client is None:
+        return grade_locally(code, language, suite, payload, budget)
+
+    pool = get_warm_pool(docker_client)
+    image, files, run_cmd, failure = prepare_docker_run(docker_client, pool, code, language)
+    if failure is not None:
+        return grading_failure(suite, failure)
+
+    payload["command"] = ["sh", "-c", run_cmd]
+    payload["user"] = settings.sandbox_user
+    files[HARNESS_FILE] = (HARNESS_PATH.read_bytes(), 0o644)
+    files[SUITE_FILE] = (json.dumps(payload).encode("utf-8"), 0o600)
+
+    if pool is not None:
+        run = run_in_warm_container(pool, files, image, HARNESS_COMMAND, budget, user=HARNESS_USER)
+    else:
+        run = run_in_new_container(docker_client, files, image, HARNESS_COMMAND, budget, user=HARNESS_USER)
+
+    if run.get("output", "").strip() == HARNESS_UNAVAILABLE:
+        return grade_per_case(code, language, suite, payload)
+    return finish_report(suite, run)
+
+
+def grade_locally(code: str, language: str, suite: dict, payload: dict, budget: int) -> dict:
+    """
+    Run the harness as a local process when Docker is not available.
+    ⚠️ Less secure - only use in development!
+    """
+    if language not in ["python", "python3"]:
+        return grading_failure(suite, {
+            "error": f"Fallback mode only supports Python. Docker required for {language}.",
+            "execution_time": None
+        })
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        code_file = Path(tmpdir) / "main.py"
+        code_file.write_text(code, encoding="utf-8")
+        suite_file = Path(tmpdir) / SUITE_FILE
+        suite_file.write_text(
+            json.dumps({**payload, "command": ["python", str(code_file)]}),
+            encoding="utf-8"
+        )
+
+        start_time = time.time()
+        try:
+            process = subprocess.run(
+                ["python", str(HARNESS_PATH), "--suite", str(suite_file)],
+                cwd=tmpdir,
+                capture_output=True,
+                text=True,
+                timeout=budget
+            )
+        except subprocess.TimeoutExpired:
+            return grading_failure(suite, {
+                "error": "⏰ Grading timed out.",
+                "execution_time": budget,
+                "timed_out": True
+            })
+
+    return finish_report(suite, {
+        "success": process.returncode == 0,
+        "output": process.stdout,
+        "error": process.stderr,
+        "execution_time": time.time() - start_time,
+        "timed_out": False
+    })
+
+
+def grade_per_case(code: str, language: str, suite: dict, payload: dict) -> dict:
+    """
+    Grade with one sandbox run per case, for images that cannot run the harness.
+    Compile artifacts are cached, so only the first run pays for the build.
+    """
+    compare_output = get_harness().compare_output
+    cases = []
+    execution_time = 0.0
+
+    for case in suite["tests"]:
+        run = run_code_sync(code, language, case.get("timeout", payload["timeout"]), case.get("input", ""))
+        if run.get("execution_time") is None:
+            # Nothing ran (compile or docker failure)
+            return grading_failure(suite, run)
+        execution_time += run["execution_time"]
+
+        if run["timed_out"]:
+            verdict = "timeout"
+        elif not run["success"]:
+            verdict = "runtime_error"
+        elif compare_output(
+            run["output"],
+            case["expected"],
+            case.get("comparison", payload["comparison"]),
+            case.get("tolerance", payload["tolerance"])
+        ):
+            verdict = "passed"
+        else:
+            verdict = "wrong_answer"
+
+        cases.append({
+            "name": case["name"],
+            "verdict": verdict,
+            "passed": verdict == "passed",
+            "execution_time": run["execution_time"],
+            "output": run["output"][:MAX_CASE_OUTPUT],
+            "error": run["error"][:MAX_CASE_OUTPUT]
+        })
+        if verdict != "passed" and payload["stop_on_failure"]:
+            break
+
+    return finish_report(suite, {
+        "success": True,
+        "output": json.dumps({"cases": cases}),
+        "error": "",
+        "execution_time": execution_time,
+        "timed_out": False
+    })
+
+
+def finish_report(suite: dict, run: dict) -> dict:
+    """Turn the harness output into the grading result, hiding hidden cases."""
+    try:
+        report = json.loads(run.get("output", "").strip().splitlines()[-1])
+        cases = report["cases"]
+    except (IndexError, KeyError, TypeError, ValueError):
+        # The harness never got to report: launch failure, timeout or crash
+        return grading_failure(suite, {**run, "error": run.get("error") or run.get("output", "")})
+
+    for case, test in zip(cases, suite["tests"]):
+        if test.get("hidden"):
+            case["hidden"] = True
+            case["output"] = ""
+            case["error"] = ""
+        else:
+            case["input"] = test.get("input", "")
+            case["expected"] = test["expected"]
+
+    passed = sum(case["passed"] for case in cases)
+    return {
+        "success": passed == len(suite["tests"]),
+        "error": "",
+        "tests_total": len(suite["tests"]),
+        "tests_run": len(cases),
+        "tests_passed": passed,
+        "stopped_early": len(cases) < len(suite["tests"]),
+        "cases": cases,
+        "execution_time": run.get("execution_time"),
+        "timed_out": False,
+        "cpu_user": run.get("cpu_user"),
+        "cpu_system": run.get("cpu_system"),
+        "peak_memory": run.get("peak_memory"),
+        "oom_killed": run.get("oom_killed", False)
+    }
+
+
+def grading_failure(suite: dict, run: dict) -> dict:
+    """Grading result when no case could be judged (e.g. compilation failed)."""
+    return {
+        "success": False,
+        "error": run.get("error", ""),
+        "tests_total": len(suite["tests"]),
+        "tests_run": 0,
+        "tests_passed": 0,
+        "stopped_early": False,
+        "cases": [],
+        "execution_time": run.get("execution_time"),
+        "timed_out": run.get("timed_out", False),
+        "cpu_user": run.get("cpu_user"),
+        "cpu_system": run.get("cpu_system"),
+        "peak_memory": run.get("peak_memory"),
+        "oom_killed": run.get("oom_killed", False)
+    }
@@ -0,0 +1,213 @@
+"""
+Job Queue
+Durable SQLite-backed queue of sandbox jobs, shared by the API process
+(which enqueues /run and /submit requests) and the standalone worker
+processes in app.grader.worker (which execute them).
+
+A claimed job carries a lease that its worker keeps renewing; if the
+worker dies, the lease runs out and another worker picks the job up.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Optional
+
+from app.core.config import settings
+
+
+# Jobs abandoned this many times are failed instead of retried
+MAX_ATTEMPTS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    worker TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    lease_expires REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+"""
+
+
+class JobQueue:
+    """
+    SQLite job table with claim/complete semantics.
+
+    Each thread gets its own connection; writes that must be atomic across
+    processes (claiming) run inside BEGIN IMMEDIATE.
+    """
+
+    def __init__(self, path: str, lease_timeout: int):
+        self.path = path
+        self.lease_timeout = lease_timeout
+        self._local = threading.local()
+        self._connect().executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, kind: str, payload: dict) -> str:
+        """Add a job and return its ID."""
+        job_id = uuid.uuid4().hex
+        self._connect().execute(
+            "INSERT INTO jobs (id, kind, payload, status, created_at) VALUES (?, ?, ?, 'queued', ?)",
+            (job_id, kind, json.dumps(payload), time.time())
+        )
+        return job_id
+
+    def claim(self, worker: str) -> Optional[dict]:
+        """
+        Take the oldest queued job, or one whose worker's lease ran out.
+
+        Returns:
+            dict with id, kind, payload, attempts, or None if nothing is waiting
+        """
+        conn = self._connect()
+        while True:
+            now = time.time()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT id, kind, payload, attempts FROM jobs "
+                    "WHERE status = 'queued' OR (status = 'running' AND lease_expires < ?) "
+                    "ORDER BY created_at LIMIT 1",
+                    (now,)
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+
+                if row["attempts"] >= MAX_ATTEMPTS:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                        ("Job was abandoned by its worker too many times.", now, row["id"])
+                    )
+                    conn.execute("COMMIT")
+                    continue
+
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', worker = ?, started_at = ?, "
+                    "lease_expires = ?, attempts = attempts + 1 WHERE id = ?",
+                    (worker, now, now + self.lease_timeout, row["id"])
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+            return {
+                "id": row["id"],
+                "kind": row["kind"],
+                "payload": json.loads(row["payload"]),
+                "attempts": row["attempts"] + 1
+            }
+
+    def renew(self, job_id: str, worker: str) -> bool:
+        """Extend a running job's lease; False if the job is no longer ours."""
+        cursor = self._connect().execute(
+            "UPDATE jobs SET lease_expires = ? WHERE id = ? AND worker = ? AND status = 'running'",
+            (time.time() + self.lease_timeout, job_id, worker)
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, job_id: str, worker: str, result: dict):
+        """Store a job's result."""
+        self._finish(job_id, worker, "done", json.dumps(result), None)
+
+    def fail(self, job_id: str, worker: str, error: str):
+        """Mark a job as failed with an error message."""
+        self._finish(job_id, worker, "failed", None, error)
+
+    def release(self, job_id: str, worker: str):
+        """Put a claimed job back in the queue without counting the attempt."""
+        self._connect().execute(
+            "UPDATE jobs SET status = 'queued', worker = NULL, lease_expires = NULL, "
+            "attempts = attempts - 1 WHERE id = ? AND worker = ? AND status = 'running'",
+            (job_id, worker)
+        )
+
+    def _finish(self, job_id: str, worker: str, status: str, result: Optional[str], error: Optional[str]):
+        # A worker that lost its lease must not overwrite the new owner's outcome
+        self._connect().execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, lease_expires = NULL "
+            "WHERE id = ? AND worker = ? AND status = 'running'",
+            (status, result, error, time.time(), job_id, worker)
+        )
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """Job status and, once finished, its result or error."""
+        row = self._connect().execute(
+            "SELECT id, kind, status, result, error, attempts, created_at, started_at, finished_at "
+            "FROM jobs WHERE id = ?",
+            (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def pending(self) -> int:
+        """Number of jobs waiting for a worker."""
+        return self._connect().execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = 'queued'"
+        ).fetchone()[0]
+
+    def purge(self, older_than: float) -> int:
+        """Delete finished jobs older than `older_than` seconds."""
+        cursor = self._connect().execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+            (time.time() - older_than,)
+        )
+        return cursor.rowcount
+
+    def stats(self) -> dict:
+        counts = dict(self._connect().execute(
+            "SELECT status, COUNT(*) FROM jobs GROUP BY status"
+        ).fetchall())
+        return {
+            "enabled": True,
+            "queued": counts.get("queued", 0),
+            "running": counts.get("running", 0),
+            "done": counts.get("done", 0),
+            "failed": counts.get("failed", 0),
+        }
+
+
+# Queue instance
+job_queue: Optional[JobQueue] = None
+job_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """Get or create the job queue."""
+    global job_queue
+    with job_queue_lock:
+        if job_queue is None:
+            job_queue = JobQueue(settings.job_queue_path, settings.job_lease_timeout)
+        return job_queue
+
+
+def get_job_queue_stats() -> dict:
+    """Job queue statistics for the stats endpoint."""
+    if not settings.job_queue_enabled:
+        return {"enabled": False}
+    return get_job_queue().stats()
@@ -0,0 +1,187 @@
+"""
+Run Metrics
+Per-run resource accounting (wall time, CPU time, peak memory, OOM kills)
+and aggregate histograms per language and per lab.
+
+Docker runs are measured from the container's cgroup; subprocess runs
+from the child's rusage.
+"""
+
+import bisect
+import threading
+from typing import Dict, Optional
+
+
+# cgroup v2 files first, then the v1 equivalents for older hosts
+CGROUP_FILES = [
+    "/sys/fs/cgroup/cpu.stat",
+    "/sys/fs/cgroup/memory.peak",
+    "/sys/fs/cgroup/memory.events",
+    "/sys/fs/cgroup/cpuacct/cpuacct.stat",
+    "/sys/fs/cgroup/memory/memory.max_usage_in_bytes",
+    "/sys/fs/cgroup/memory/memory.oom_control",
+]
+
+# Prints "path:line" for every line of every cgroup file that exists
+CGROUP_USAGE_SCRIPT = "grep -H . " + " ".join(CGROUP_FILES) + " 2>/dev/null; true"
+CGROUP_USAGE_COMMAND = ["sh", "-c", CGROUP_USAGE_SCRIPT]
+
+# cgroup v1 reports CPU in USER_HZ ticks
+CLOCK_TICKS = 100
+
+# Histogram bucket upper bounds
+WALL_TIME_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30]  # seconds
+CPU_TIME_BUCKETS = [0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10]  # seconds
+MEMORY_BUCKETS = [mb * 1024 * 1024 for mb in (8, 16, 32, 64, 128, 256, 512, 1024)]  # bytes
+
+
+def parse_cgroup_usage(text: str) -> dict:
+    """
+    Parse CGROUP_USAGE_COMMAND output.
+
+    Returns:
+        dict with cpu_user, cpu_system (seconds), peak_memory (bytes) and
+        oom_kills; keys are missing when the host does not expose them
+    """
+    usage = {}
+    for line in text.splitlines():
+        path, _, content = line.partition(":")
+        name = path.rsplit("/", 1)[-1]
+        key, _, value = content.partition(" ")
+        try:
+            if name == "cpu.stat" and key in ("user_usec", "system_usec"):
+                usage["cpu_" + key[:-5]] = int(value) / 1_000_000
+            elif name == "cpuacct.stat" and key in ("user", "system"):
+                usage["cpu_" + key] = int(value) / CLOCK_TICKS
+            elif name in ("memory.peak", "memory.max_usage_in_bytes"):
+                usage["peak_memory"] = int(content)
+            elif name in ("memory.events", "memory.oom_control") and key == "oom_kill":
+                usage["oom_kills"] = int(value)
+        except ValueError:
+            continue
+    return usage
+
+
+def usage_fields(before: Optional[dict], after: dict) -> dict:
+    """
+    Turn two cgroup snapshots into the per-run result fields.
+
+    CPU and OOM counters are cumulative, so the run's share is the delta.
+    The cgroup's memory high-water mark cannot be reset from inside a
+    container, so for reused containers peak_memory is the peak since the
+    container started - an upper bound for the run.
+    """
+    before = before or {}
+    fields = {
+        "cpu_user": None,
+        "cpu_system": None,
+        "peak_memory": after.get("peak_memory"),
+        "oom_killed": after.get("oom_kills", 0) > before.get("oom_kills", 0),
+    }
+    for key in ("cpu_user", "cpu_system"):
+        if key in after:
+            fields[key] = max(0.0, after[key] - before.get(key, 0.0))
+    return fields
+
+
+def rusage_fields(usage) -> dict:
+    """Per-run result fields from a `resource.struct_rusage` (ru_maxrss is KiB on Linux)."""
+    if usage is None:
+        return {"cpu_user": None, "cpu_system": None, "peak_memory": None, "oom_killed": False}
+    return {
+        "cpu_user": usage.ru_utime,
+        "cpu_system": usage.ru_stime,
+        "peak_memory": usage.ru_maxrss * 1024,
+        "oom_killed": False,
+    }
+
+
+class Histogram:
+    """Fixed-bucket histogram with count and sum."""
+
+    def __init__(self, bounds: list):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def to_dict(self) -> dict:
+        labels = [f"<={bound:g}" for bound in self.bounds] + [f">{self.bounds[-1]:g}"]
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count, 4) if self.count else 0.0,
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+class UsageHistograms:
+    """Wall time, CPU time and peak memory histograms for one group of runs."""
+
+    def __init__(self):
+        self.runs = 0
+        self.timeouts = 0
+        self.oom_kills = 0
+        self.wall_time = Histogram(WALL_TIME_BUCKETS)
+        self.cpu_time = Histogram(CPU_TIME_BUCKETS)
+        self.peak_memory = Histogram(MEMORY_BUCKETS)
+
+    def observe(self, result: dict):
+        self.runs += 1
+        self.timeouts += bool(result.get("timed_out"))
+        self.oom_kills += bool(result.get("oom_killed"))
+        if result.get("execution_time") is not None:
+            self.wall_time.observe(result["execution_time"])
+        if result.get("cpu_user") is not None:
+            self.cpu_time.observe(result["cpu_user"] + (result.get("cpu_system") or 0.0))
+        if result.get("peak_memory") is not None:
+            self.peak_memory.observe(result["peak_memory"])
+
+    def to_dict(self) -> dict:
+        return {
+            "runs": self.runs,
+            "timeouts": self.timeouts,
+            "oom_kills": self.oom_kills,
+            "wall_time_seconds": self.wall_time.to_dict(),
+            "cpu_time_seconds": self.cpu_time.to_dict(),
+            "peak_memory_bytes": self.peak_memory.to_dict(),
+        }
+
+
+class RunMetrics:
+    """Aggregate usage per language and per lab_id."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.by_language: Dict[str, UsageHistograms] = {}
+        self.by_lab: Dict[str, UsageHistograms] = {}
+
+    def record(self, language: str, lab_id: Optional[str], result: dict):
+        with self._lock:
+            self.by_language.setdefault(language, UsageHistograms()).observe(result)
+            self.by_lab.setdefault(lab_id or "none", UsageHistograms()).observe(result)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "by_language": {k: v.to_dict() for k, v in self.by_language.items()},
+                "by_lab": {k: v.to_dict() for k, v in self.by_lab.items()},
+            }
+
+
+# Metrics instance
+run_metrics = RunMetrics()
+
+
+def record_run(language: str, lab_id: Optional[str], result: dict):
+    """Add a finished run to the aggregate histograms."""
+    run_metrics.record(language.lower(), lab_id, result)
+
+
+def get_run_metrics() -> dict:
+    """Usage histograms for the stats endpoint."""
+    return run_metrics.to_dict()
@@ -0,0 +1,370 @@
+"""
+Warm Container Pool
+Keeps pre-started, network-disabled sandbox containers per image so a run
+only pays for an exec instead of a full container create/start/teardown.
+
+Containers are checked out for a single run, then reset and returned to the
+pool in the background, or recycled once they hit the configured reuse limit.
+Because a container outlives the run, it is locked down so nothing can carry
+over to the next student: the root filesystem is read-only, programs run as
+an unprivileged user, and the only writable places are /code (a volume of
+the container's own) and a tmpfs /tmp, both wiped on reset.
+"""
+
+import io
+import tarfile
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from app.core.config import settings
+from app.grader.metrics import CGROUP_USAGE_COMMAND, parse_cgroup_usage
+
+
+# Label used to find (and clean up) containers owned by the pool
+POOL_LABEL = "autonomous-ta.pool"
+
+# Keeps the container alive until we exec into it
+IDLE_COMMAND = ["sleep", "infinity"]
+
+# Writable scratch space; the root filesystem is mounted read-only
+TMPFS = {"/tmp": "rw,noexec,nosuid,size=64m"}
+
+# Wipes everything a previous run may have left behind (run as root, since
+# the program may have made its files unwritable) and hands /code back to
+# the sandbox user
+RESET_COMMAND = "find /code /tmp -mindepth 1 -delete && chown {user} /code && chmod 755 /code"
+
+
+def sandbox_owner() -> tuple:
+    """(uid, gid) from settings.sandbox_user ("uid:gid")."""
+    uid, _, gid = settings.sandbox_user.partition(":")
+    return int(uid), int(gid or uid)
+
+
+class PooledContainer:
+    """A running pool container plus its reuse bookkeeping."""
+
+    def __init__(self, container, image: str):
+        self.container = container
+        self.image = image
+        self.uses = 0
+        self.last_used = time.monotonic()
+        # cgroup counters at checkout, so runs can be measured as deltas
+        self.usage_baseline = None
+
+    def put_file(self, filename: str, content: str):
+        """Copy a single source file into /code inside the container."""
+        self.put_files({filename: (content.encode("utf-8"), 0o644)})
+
+    def put_files(self, files: dict):
+        """Copy files ({name: (bytes, mode)}) into /code, owned by the sandbox user."""
+        uid, gid = sandbox_owner()
+        archive = io.BytesIO()
+        with tarfile.open(fileobj=archive, mode="w") as tar:
+            for name, (data, mode) in files.items():
+                info = tarfile.TarInfo(name=name)
+                info.size = len(data)
+                info.mode = mode
+                info.uid = uid
+                info.gid = gid
+                info.mtime = int(time.time())
+                tar.addfile(info, io.BytesIO(data))
+        self.container.put_archive("/code", archive.getvalue())
+
+    def get_files(self, exclude: tuple = ()) -> dict:
+        """Read every regular file in /code back out as {name: (bytes, mode)}."""
+        stream, _ = self.container.get_archive("/code")
+        archive = io.BytesIO(b"".join(stream))
+        files = {}
+        with tarfile.open(fileobj=archive, mode="r") as tar:
+            for member in tar.getmembers():
+                name = member.name.split("/", 1)[-1]
+                if not member.isfile() or "/" in name or name in exclude:
+                    continue
+                files[name] = (tar.extractfile(member).read(), member.mode)
+        return files
+
+
+class ImagePool:
+    """Idle containers and hit/miss counters for one sandbox image."""
+
+    def __init__(self, image: str):
+        self.image = image
+        self.idle = deque()
+        self.dirty = deque()
+        self.starting = 0
+        self.last_demand = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.created = 0
+        self.recycled = 0
+        self.evicted = 0
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "idle": len(self.idle),
+            "resetting": len(self.dirty),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+            "created": self.created,
+            "recycled": self.recycled,
+            "evicted": self.evicted,
+        }
+
+
+class WarmContainerPool:
+    """
+    Per-image pool of pre-started sandbox containers.
+
+    A background maintenance thread resets returned containers, refills each
+    pool up to `sandbox_pool_size` while it sees demand, and evicts containers
+    that have sat idle longer than `sandbox_pool_idle_timeout`.
+    """
+
+    def __init__(self, docker_client):
+        self.client = docker_client
+        self.size = settings.sandbox_pool_size
+        self.max_uses = settings.sandbox_pool_max_uses
+        self.idle_timeout = settings.sandbox_pool_idle_timeout
+        self._pools: Dict[str, ImagePool] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(
+            target=self._maintenance_loop,
+            name="sandbox-pool",
+            daemon=True
+        )
+        self._thread.start()
+
+    def _pool(self, image: str) -> ImagePool:
+        pool = self._pools.get(image)
+        if pool is None:
+            pool = self._pools[image] = ImagePool(image)
+        return pool
+
+    def _start_container(self, image: str) -> PooledContainer:
+        from docker.types import Mount
+
+        container = self.client.containers.run(
+            image=image,
+            command=IDLE_COMMAND,
+            user=settings.sandbox_user,  # never root, whatever the image says
+            read_only=True,
+            tmpfs=TMPFS,
+            # Anonymous volume: writable, allows exec (compiled programs) and
+            # is removed together with the container
+            mounts=[Mount(target="/code", source=None, type="volume")],
+            mem_limit=settings.sandbox_memory_limit,
+            network_disabled=True,  # No network access
+            labels={POOL_LABEL: image},
+            detach=True
+        )
+        pooled = PooledContainer(container, image)
+        try:
+            exit_code, output = container.exec_run(
+                ["sh", "-c", RESET_COMMAND.format(user=settings.sandbox_user)],
+                user="root"
+            )
+            if exit_code != 0:
+                raise RuntimeError(output.decode("utf-8", errors="replace").strip())
+        except Exception:
+            self._discard(pooled)
+            raise
+        return pooled
+
+    def _discard(self, pooled: PooledContainer):
+        try:
+            pooled.container.remove(force=True, v=True)
+        except Exception:
+            pass
+
+    def acquire(self, image: str) -> PooledContainer:
+        """
+        Check out a container for `image`.
+
+        Returns a warm container when one is idle (hit), otherwise starts one
+        on the request path (miss) and asks the maintenance thread to refill.
+        """
+        with self._lock:
+            pool = self._pool(image)
+            pool.last_demand = time.monotonic()
+            pooled = pool.idle.popleft() if pool.idle else None
+            if pooled is not None:
+                pool.hits += 1
+            else:
+                pool.misses += 1
+        self._wakeup.set()
+
+        if pooled is None:
+            pooled = self._start_container(image)
+            with self._lock:
+                pool.created += 1
+        return pooled
+
+    def release(self, pooled: PooledContainer, reusable: bool = True):
+        """
+        Return a container after a run.
+
+        Containers that timed out, broke, or reached `sandbox_pool_max_uses`
+        are removed; the rest are reset in the background before reuse.
+        """
+        pooled.uses += 1
+        pooled.last_used = time.monotonic()
+
+        with self._lock:
+            pool = self._pool(pooled.image)
+            if reusable and pooled.uses < self.max_uses and not self._closed:
+                pool.dirty.append(pooled)
+                pooled = None
+            else:
+                pool.recycled += 1
+        if pooled is not None:
+            self._discard(pooled)
+        self._wakeup.set()
+
+    def _reset(self, pooled: PooledContainer) -> bool:
+        """Wipe /code and make sure nothing from the last run is still alive."""
+        try:
+            exit_code, _ = pooled.container.exec_run(
+                ["sh", "-c", RESET_COMMAND.format(user=settings.sandbox_user)],
+                user="root"
+            )
+            if exit_code != 0:
+                return False
+            pooled.container.reload()
+            if pooled.container.status != "running":
+                return False
+            # Only the idle `sleep` should be left; anything else is a leftover
+            # background process from the student's program.
+            processes = pooled.container.top().get("Processes") or []
+            if len(processes) > 1:
+                return False
+            _, output = pooled.container.exec_run(CGROUP_USAGE_COMMAND)
+            pooled.usage_baseline = parse_cgroup_usage(output.decode("utf-8", errors="replace"))
+            return True
+        except Exception:
+            return False
+
+    def _maintenance_loop(self):
+        while not self._closed:
+            self._wakeup.wait(timeout=1.0)
+            self._wakeup.clear()
+            try:
+                self._maintain()
+            except Exception as e:
+                print(f"⚠️ Sandbox pool maintenance failed: {e}")
+
+    def _maintain(self):
+        now = time.monotonic()
+
+        with self._lock:
+            pools = list(self._pools.values())
+
+        for pool in pools:
+            # Reset containers returned by finished runs
+            while True:
+                with self._lock:
+                    pooled = pool.dirty.popleft() if pool.dirty else None
+                if pooled is None:
+                    break
+                if self._reset(pooled):
+                    with self._lock:
+                        if len(pool.idle) < self.size and not self._closed:
+                            pool.idle.append(pooled)
+                            pooled = None
+                if pooled is not None:
+                    with self._lock:
+                        pool.recycled += 1
+                    self._discard(pooled)
+
+            # Evict containers nobody has needed for a while
+            expired = []
+            with self._lock:
+                for pooled in list(pool.idle):
+                    if now - pooled.last_used > self.idle_timeout:
+                        pool.idle.remove(pooled)
+                        pool.evicted += 1
+                        expired.append(pooled)
+            for pooled in expired:
+                self._discard(pooled)
+
+            # Refill only while the image is in use
+            with self._lock:
+                active = now - pool.last_demand <= self.idle_timeout
+                missing = self.size - len(pool.idle) - len(pool.dirty) - pool.starting
+                if not active or self._closed or missing <= 0:
+                    continue
+                pool.starting += missing
+
+            for _ in range(missing):
+                try:
+                    pooled = self._start_container(pool.image)
+                except Exception as e:
+                    print(f"⚠️ Could not start warm container for {pool.image}: {e}")
+                    pooled = None
+                with self._lock:
+                    pool.starting -= 1
+                    if pooled is not None:
+                        pool.created += 1
+                        pool.idle.append(pooled)
+
+    def stats(self) -> dict:
+        """Hit/miss and occupancy counters per image."""
+        with self._lock:
+            return {
+                "enabled": True,
+                "size": self.size,
+                "max_uses": self.max_uses,
+                "idle_timeout": self.idle_timeout,
+                "images": {image: pool.stats() for image, pool in self._pools.items()},
+            }
+
+    def shutdown(self):
+        """Stop maintenance and remove every container the pool owns."""
+        with self._lock:
+            self._closed = True
+            leftovers = []
+            for pool in self._pools.values():
+                leftovers.extend(pool.idle)
+                leftovers.extend(pool.dirty)
+                pool.idle.clear()
+                pool.dirty.clear()
+        self._wakeup.set()
+        for pooled in leftovers:
+            self._discard(pooled)
+
+
+# Pool instance (created on first docker run)
+warm_pool: Optional[WarmContainerPool] = None
+_warm_pool_lock = threading.Lock()
+
+
+def get_warm_pool(docker_client) -> Optional[WarmContainerPool]:
+    """Get or create the warm container pool, or None when pooling is disabled."""
+    global warm_pool
+    if not settings.sandbox_pool_enabled or docker_client is None:
+        return None
+    with _warm_pool_lock:
+        if warm_pool is None:
+            warm_pool = WarmContainerPool(docker_client)
+    return warm_pool
+
+
+def get_pool_stats() -> dict:
+    """Pool statistics for the stats endpoint."""
+    if warm_pool is None:
+        return {"enabled": settings.sandbox_pool_enabled, "images": {}}
+    return warm_pool.stats()
+
+
+def shutdown_warm_pool():
+    """Remove pooled containers on application shutdown."""
+    global warm_pool
+    if warm_pool is not None:
+        warm_pool.shutdown()
+        warm_pool = None
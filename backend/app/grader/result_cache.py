@@ -0,0 +1,135 @@
+"""
+Result Cache
+Opt-in memoization of sandbox run results for deterministic programs.
+
+Results are keyed by a hash of everything that can change what a run
+prints (code, language, stdin, image, timeout, memory limit) and kept in
+an in-memory LRU with a TTL and a byte budget.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from app.core.config import settings
+
+
+class ResultCache:
+    """In-memory LRU of run result dicts with per-entry expiry."""
+
+    def __init__(self, max_bytes: int, ttl: int):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, size, result)
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(
+        code: str,
+        language: str,
+        stdin: str,
+        image: str,
+        timeout: int,
+        memory_limit: str
+    ) -> str:
+        """Hash everything that can change the outcome of a run."""
+        digest = hashlib.sha256()
+        for part in (language, image, str(timeout), memory_limit, stdin, code):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    @staticmethod
+    def _size(result: dict) -> int:
+        # Output and error dominate; count a small fixed overhead for the rest
+        return 256 + sum(
+            len(value.encode("utf-8"))
+            for value in (result.get("output"), result.get("error"))
+            if isinstance(value, str)
+        )
+
+    def get(self, key: str) -> Optional[dict]:
+        """Return a copy of the cached result, or None on a miss."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= now:
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(entry[2])
+
+    def put(self, key: str, result: dict):
+        """Store a result, evicting least recently used entries to fit."""
+        size = self._size(result)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl, size, dict(result))
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+
+    def _drop(self, key: str):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "enabled": True,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+            }
+
+
+def is_cacheable(result: dict) -> bool:
+    """
+    Only memoize runs that actually executed to completion.
+
+    Timeouts depend on host load, and results without a measured
+    execution time are docker or compile-stage failures.
+    """
+    return not result.get("timed_out") and result.get("execution_time") is not None
+
+
+# Cache instance
+result_cache: Optional[ResultCache] = None
+
+
+def get_result_cache() -> Optional[ResultCache]:
+    """Get or create the result cache, or None when it is disabled."""
+    global result_cache
+    if not settings.result_cache_enabled:
+        return None
+    if result_cache is None:
+        result_cache = ResultCache(
+            max_bytes=settings.result_cache_max_bytes,
+            ttl=settings.result_cache_ttl
+        )
+    return result_cache
+
+
+def get_result_cache_stats() -> dict:
+    """Result cache statistics for the stats endpoint."""
+    if result_cache is None:
+        return {"enabled": settings.result_cache_enabled}
+    return result_cache.stats()
@@ -7,6 +7,10 @@ Provides timeout protection and resource limits.
 import asyncio
 import tempfile
 import os
+import selectors
+import signal
+import subprocess
+import time
 from pathlib import Path
 from typing import Optional
 
@@ -20,6 +24,20 @@ except ImportError:
     docker = None
 
 from app.core.config import settings
+from app.grader.pool import get_warm_pool
+from app.grader.executor import SandboxExecutor, get_sandbox_executor
+from app.grader.compile_cache import get_compile_cache
+from app.grader.result_cache import get_result_cache, is_cacheable
+from app.grader.forkserver import run_code_forkserver
+from app.grader.capture import OutputCapture, capture_stream
+from app.grader.metrics import (
+    CGROUP_USAGE_COMMAND,
+    CGROUP_USAGE_SCRIPT,
+    parse_cgroup_usage,
+    record_run,
+    rusage_fields,
+    usage_fields,
+)
 
 
 # Docker client
@@ -58,6 +76,26 @@ RUN_COMMANDS = {
     "java": "cd /code && javac Main.java && java Main"
 }
 
+# Compile stage for compiled languages (cached by source hash)
+COMPILE_COMMANDS = {
+    "cpp": "g++ /code/main.cpp -o /code/main",
+    "c": "gcc /code/main.c -o /code/main",
+    "java": "cd /code && javac Main.java"
+}
+
+# Run stage once the compile artifacts are in /code
+EXECUTE_COMMANDS = {
+    "cpp": "/code/main",
+    "c": "/code/main",
+    "java": "cd /code && java Main"
+}
+
+# Standard input for the program is written next to the code
+STDIN_FILE = ".stdin"
+
+# cgroup counters written by cold containers before they exit
+USAGE_FILE = ".usage"
+
 # File extensions for different languages
 FILE_EXTENSIONS = {
     "python": "py",
@@ -71,70 +109,337 @@ FILE_EXTENSIONS = {
 async def run_code_in_sandbox(
     code: str,
     language: str = "python",
-    timeout: Optional[int] = None
+    timeout: Optional[int] = None,
+    stdin: Optional[str] = None,
+    use_cache: bool = True,
+    lab_id: Optional[str] = None,
+    executor: Optional[SandboxExecutor] = None
 ) -> dict:
     """
     Execute code in an isolated Docker container.
     
+    The blocking work runs on the sandbox executor's thread pool, so the
+    event loop stays free while the program runs. When the result cache is
+    enabled, identical runs are answered from memory without using a slot.
+    
     Args:
         code: The code to execute
         language: Programming language (python, cpp, c, java)
         timeout: Execution timeout in seconds (default from settings)
+        stdin: Text fed to the program's standard input
+        use_cache: Set to False for programs that use randomness or time
+        lab_id: Lab the run belongs to, for per-lab usage metrics
+        executor: Admission to run under (default: the shared sandbox executor)
     
     Returns:
-        dict with success, output, error, execution_time, timed_out
+        dict with success, output, error, execution_time, timed_out, cached,
+        and resource usage (cpu_user, cpu_system, peak_memory, oom_killed)
+    
+    Raises:
+        SandboxBusyError: if the admission queue is full
     """
-    docker_client = get_docker_client()
+    cache = get_result_cache() if use_cache else None
+    if cache is not None:
+        cache_key = cache.make_key(
+            code,
+            language.lower(),
+            stdin or "",
+            LANGUAGE_IMAGES.get(language.lower(), "python:3.11-slim"),
+            timeout or settings.sandbox_timeout,
+            settings.sandbox_memory_limit
+        )
+        cached = cache.get(cache_key)
+        if cached is not None:
+            cached["cached"] = True
+            return cached
     
-    # Fallback to subprocess if Docker is not available
-    if docker_client is None:
-        return await run_code_fallback(code, language, timeout)
+    executor = executor or get_sandbox_executor()
+    result = await executor.submit(run_code_sync, code, language, timeout, stdin)
+    record_run(language, lab_id, result)
     
+    if cache is not None and is_cacheable(result):
+        cache.put(cache_key, result)
+    result["cached"] = False
+    return result
+
+
+def run_code_sync(
+    code: str,
+    language: str = "python",
+    timeout: Optional[int] = None,
+    stdin: Optional[str] = None
+) -> dict:
+    """Blocking implementation of run_code_in_sandbox."""
     timeout = timeout or settings.sandbox_timeout
     language = language.lower()
+    backend = settings.sandbox_backend
+    
+    # Preforked interpreter for Python; other languages still need Docker
+    if backend == "forkserver" and language in ("python", "python3"):
+        return run_code_forkserver(code, timeout, stdin)
+    
+    docker_client = get_docker_client() if backend != "subprocess" else None
+    
+    # Fallback to subprocess if Docker is not available
+    if docker_client is None:
+        return run_code_fallback_sync(code, language, timeout, stdin)
     
+    pool = get_warm_pool(docker_client)
+    image, files, run_cmd, failure = prepare_docker_run(
+        docker_client, pool, code, language, stdin
+    )
+    if failure is not None:
+        return failure
+    
+    # Prefer a pre-started container from the warm pool
+    if pool is not None:
+        return run_in_warm_container(pool, files, image, run_cmd, timeout)
+    return run_in_new_container(docker_client, files, image, run_cmd, timeout)
+
+
+def prepare_docker_run(
+    docker_client,
+    pool,
+    code: str,
+    language: str,
+    stdin: Optional[str] = None
+) -> tuple:
+    """
+    Work out the image, the files to place in /code, and the command to run.
+    
+    For compiled languages this runs (or skips, on a cache hit) the compile
+    stage, so the returned command only executes the program.
+    
+    Returns:
+        (image, files, run_cmd, failure) where failure is a result dict if
+        the run cannot go ahead (e.g. compilation failed), otherwise None
+    """
     # Get configuration for the language
     image = LANGUAGE_IMAGES.get(language, "python:3.11-slim")
     run_cmd = RUN_COMMANDS.get(language, "python /code/main.py")
     file_ext = FILE_EXTENSIONS.get(language, "py")
     
+    filename = "Main.java" if language == "java" else f"main.{file_ext}"
+    files = {filename: (code.encode("utf-8"), 0o644)}
+    
+    # Compiled languages: build once per unique source, then only execute
+    compile_cmd = COMPILE_COMMANDS.get(language)
+    cache = get_compile_cache() if compile_cmd else None
+    if cache is not None:
+        cache_key = cache.make_key(code, language, image, compile_cmd)
+        artifacts = cache.get(cache_key)
+        if artifacts is None:
+            artifacts, failure = compile_code(
+                docker_client, pool, image, compile_cmd, filename, code
+            )
+            if failure is not None:
+                return image, files, run_cmd, failure
+            cache.put(cache_key, artifacts)
+        files.update(artifacts)
+        run_cmd = EXECUTE_COMMANDS[language]
+    
+    # Feed stdin from a file next to the code
+    if stdin is not None:
+        files[STDIN_FILE] = (stdin.encode("utf-8"), 0o644)
+        run_cmd = f"({run_cmd}) < /code/{STDIN_FILE}"
+    
+    return image, files, run_cmd, None
+
+
+def docker_error(e: Exception, image: str) -> dict:
+    """Result dict for docker failures that happen before the code runs."""
+    if isinstance(e, ImageNotFound):
+        error = f"Docker image not found: {image}. Run `docker pull {image}` first."
+    else:
+        error = f"Docker API error: {e}"
+    return {
+        "success": False,
+        "output": "",
+        "error": error,
+        "execution_time": None,
+        "timed_out": False
+    }
+
+
+def read_container_usage(pooled) -> dict:
+    """CPU, peak memory and OOM kills of the last run in a pooled container."""
+    try:
+        _, output = pooled.container.exec_run(CGROUP_USAGE_COMMAND)
+        after = parse_cgroup_usage((output or b"").decode("utf-8", errors="replace"))
+    except APIError:
+        after = {}
+    return usage_fields(pooled.usage_baseline, after)
+
+
+def exec_captured(container, command: list, user: str = "") -> tuple:
+    """
+    Run an exec in a container, streaming its merged stdout/stderr into a
+    bounded capture instead of buffering all of it.
+    
+    Returns:
+        (exit_code, output)
+    """
+    api = container.client.api
+    exec_id = api.exec_create(container.id, command, workdir="/code", user=user)["Id"]
+    output = capture_stream(api.exec_start(exec_id, stream=True))
+    return api.exec_inspect(exec_id).get("ExitCode"), output
+
+
+def write_files(directory: str, files: dict):
+    """Write {name: (bytes, mode)} into a directory."""
+    for name, (data, mode) in files.items():
+        path = Path(directory) / name
+        path.write_bytes(data)
+        os.chmod(path, mode)
+
+
+def compile_code(
+    docker_client,
+    pool,
+    image: str,
+    compile_cmd: str,
+    filename: str,
+    code: str
+) -> tuple:
+    """
+    Run the compile stage on its own and collect the build artifacts.
+    
+    Returns:
+        (artifacts, None) on success, where artifacts maps file name to
+        (bytes, mode), or (None, result dict) when compilation fails
+    """
+    timeout = settings.sandbox_compile_timeout
+    artifacts = None
+    
+    try:
+        if pool is not None:
+            pooled = pool.acquire(image)
+            reusable = False
+            try:
+                pooled.put_file(filename, code)
+                exit_code, logs = exec_captured(
+                    pooled.container,
+                    ["timeout", "-k", "1", str(timeout), "sh", "-c", compile_cmd]
+                )
+                if exit_code == 0:
+                    artifacts = pooled.get_files(exclude=(filename,))
+                reusable = exit_code not in (124, 137)
+            finally:
+                pool.release(pooled, reusable=reusable)
+        else:
+            with tempfile.TemporaryDirectory() as tmpdir:
+                write_files(tmpdir, {filename: (code.encode("utf-8"), 0o644)})
+                container = docker_client.containers.run(
+                    image=image,
+                    command=["sh", "-c", compile_cmd],
+                    volumes={tmpdir: {"bind": "/code", "mode": "rw"}},
+                    mem_limit=settings.sandbox_memory_limit,
+                    network_disabled=True,  # No network access
+                    detach=True
+                )
+                try:
+                    exit_code = container.wait(timeout=timeout)["StatusCode"]
+                    logs = capture_stream(container.logs(stream=True, follow=False))
+                except Exception:
+                    exit_code, logs = 124, ""
+                finally:
+                    try:
+                        container.remove(force=True)
+                    except Exception:
+                        pass
+                if exit_code == 0:
+                    artifacts = {
+                        path.name: (path.read_bytes(), path.stat().st_mode & 0o777)
+                        for path in Path(tmpdir).iterdir()
+                        if path.is_file() and path.name != filename
+                    }
+    except APIError as e:
+        return None, docker_error(e, image)
+    
+    if exit_code in (124, 137):
+        return None, {
+            "success": False,
+            "output": "",
+            "error": "⏰ Compilation timed out.",
+            "execution_time": None,
+            "timed_out": True
+        }
+    
+    if exit_code != 0:
+        logs = logs or ""
+        return None, {
+            "success": False,
+            "output": logs,
+            "error": logs,
+            "execution_time": None,
+            "timed_out": False
+        }
+    
+    return artifacts, None
+
+
+def run_in_new_container(
+    docker_client,
+    files: dict,
+    image: str,
+    run_cmd: str,
+    timeout: int,
+    user: Optional[str] = None
+) -> dict:
+    """
+    Execute code in a freshly created container that is removed afterwards.
+    
+    `user` overrides the image's user, e.g. "root" for the grading harness,
+    which runs the program itself as the unprivileged sandbox user.
+    """
     # Create temporary directory with the code
     with tempfile.TemporaryDirectory() as tmpdir:
-        # Write code to file
-        filename = "Main.java" if language == "java" else f"main.{file_ext}"
-        code_file = Path(tmpdir) / filename
-        code_file.write_text(code, encoding="utf-8")
+        # Write code (and any prebuilt artifacts) to the directory, readable
+        # by a program running as an unprivileged user
+        write_files(tmpdir, files)
+        os.chmod(tmpdir, 0o755)
         
         try:
-            # Run container
+            # Run container; the wrapper leaves the cgroup counters in /code
+            # because the cgroup is gone once the container exits
             container = docker_client.containers.run(
                 image=image,
-                command=f"sh -c '{run_cmd}'",
+                command=f"sh -c '{run_cmd}; rc=$?; {CGROUP_USAGE_SCRIPT} > /code/{USAGE_FILE}; exit $rc'",
+                user=user,
                 volumes={tmpdir: {"bind": "/code", "mode": "rw"}},
                 mem_limit=settings.sandbox_memory_limit,
                 network_disabled=True,  # No network access
-                remove=True,
                 detach=True
             )
+            start_time = time.time()
             
             # Wait for completion with timeout
             try:
                 result = container.wait(timeout=timeout)
-                logs = container.logs().decode("utf-8")
+                execution_time = time.time() - start_time
+                # Streamed into a bounded buffer so huge outputs cannot exhaust memory
+                logs = capture_stream(container.logs(stream=True, follow=False))
+                container.reload()
+                
+                usage_file = Path(tmpdir) / USAGE_FILE
+                usage = usage_fields(None, parse_cgroup_usage(
+                    usage_file.read_text(encoding="utf-8") if usage_file.exists() else ""
+                ))
+                usage["oom_killed"] = usage["oom_killed"] or container.attrs["State"].get("OOMKilled", False)
                 
                 return {
                     "success": result["StatusCode"] == 0,
                     "output": logs,
                     "error": "" if result["StatusCode"] == 0 else logs,
-                    "execution_time": None,
-                    "timed_out": False
+                    "execution_time": execution_time,
+                    "timed_out": False,
+                    **usage
                 }
             
             except Exception as timeout_error:
                 # Timeout - kill the container
                 try:
                     container.kill()
-                    container.remove()
                 except:
                     pass
                 
@@ -145,6 +450,12 @@ async def run_code_in_sandbox(
                     "execution_time": timeout,
                     "timed_out": True
                 }
+            
+            finally:
+                try:
+                    container.remove(force=True)
+                except:
+                    pass
         
         except ContainerError as e:
             return {
@@ -174,20 +485,113 @@ async def run_code_in_sandbox(
             }
 
 
+def run_in_warm_container(
+    pool,
+    files: dict,
+    image: str,
+    run_cmd: str,
+    timeout: int,
+    user: str = ""
+) -> dict:
+    """
+    Execute code through `exec` in a container checked out from the warm pool.
+    
+    The timeout is enforced inside the container with coreutils `timeout`,
+    so a runaway program never holds the exec open past its budget. The
+    exec runs as the pool's sandbox user unless `user` says otherwise.
+    """
+    try:
+        pooled = pool.acquire(image)
+    except APIError as e:
+        return docker_error(e, image)
+    
+    reusable = False
+    try:
+        pooled.put_files(files)
+        
+        start_time = time.time()
+        exit_code, logs = exec_captured(
+            pooled.container,
+            ["timeout", "-k", "1", str(timeout), "sh", "-c", run_cmd],
+            user=user
+        )
+        execution_time = time.time() - start_time
+        usage = read_container_usage(pooled)
+        
+        # 124: timeout fired; 137: still alive after the grace period
+        if exit_code == 124 or (exit_code == 137 and execution_time >= timeout):
+            return {
+                "success": False,
+                "output": "",
+                "error": "⏰ Execution timed out. Your code may have an infinite loop.",
+                "execution_time": timeout,
+                "timed_out": True,
+                **usage
+            }
+        
+        # An OOM kill can take down the idle process too; the reset check catches that
+        reusable = True
+        return {
+            "success": exit_code == 0,
+            "output": logs,
+            "error": "" if exit_code == 0 else logs,
+            "execution_time": execution_time,
+            "timed_out": False,
+            **usage
+        }
+    
+    except APIError as e:
+        return {
+            "success": False,
+            "output": "",
+            "error": f"Docker API error: {e}",
+            "execution_time": None,
+            "timed_out": False
+        }
+    
+    finally:
+        pool.release(pooled, reusable=reusable)
+
+
 async def run_code_fallback(
     code: str,
     language: str = "python",
-    timeout: Optional[int] = None
+    timeout: Optional[int] = None,
+    stdin: Optional[str] = None
 ) -> dict:
     """
     Fallback execution using subprocess when Docker is not available.
     ⚠️ Less secure - only use in development!
     """
-    import subprocess
-    import time
-    
-    timeout = timeout or settings.sandbox_timeout
+    return await get_sandbox_executor().submit(
+        run_code_fallback_sync, code, language, timeout, stdin
+    )
+
+
+def run_code_fallback_sync(
+    code: str,
+    language: str = "python",
+    timeout: Optional[int] = None,
+    stdin: Optional[str] = None
+) -> dict:
+    """Blocking implementation of run_code_fallback."""
+    return run_subprocess(code, language, timeout or settings.sandbox_timeout, stdin)
+
+
+def run_subprocess(
+    code: str,
+    language: str,
+    timeout: int,
+    stdin: Optional[str] = None,
+    on_output=None
+) -> dict:
+    """
+    Run Python code in a local child process and account for its resources.
     
+    Output is collected into bounded head + tail captures, or handed to
+    `on_output(stream, bytes)` as it arrives; returning False from the
+    callback stops the program.
+    """
     if language not in ["python", "python3"]:
         return {
             "success": False,
@@ -197,51 +601,113 @@ async def run_code_fallback(
             "timed_out": False
         }
     
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False, encoding='utf-8') as f:
-        f.write(code)
-        temp_file = f.name
+    captures = {"stdout": OutputCapture(), "stderr": OutputCapture()}
     
-    try:
-        start_time = time.time()
-        
-        result = subprocess.run(
-            ["python", temp_file],
-            capture_output=True,
-            text=True,
-            timeout=timeout
-        )
-        
-        execution_time = time.time() - start_time
+    def collect(stream: str, data: bytes) -> bool:
+        return captures[stream].write(data)
+    
+    with tempfile.TemporaryDirectory() as tmpdir:
+        code_file = Path(tmpdir) / "main.py"
+        code_file.write_text(code, encoding="utf-8")
+        stdin_file = Path(tmpdir) / "stdin.txt"
+        stdin_file.write_text(stdin or "", encoding="utf-8")
         
-        return {
-            "success": result.returncode == 0,
-            "output": result.stdout,
-            "error": result.stderr,
-            "execution_time": execution_time,
-            "timed_out": False
-        }
+        try:
+            with open(stdin_file, "rb") as stdin_handle:
+                process = subprocess.Popen(
+                    # Unbuffered when streaming so output shows up as it is printed
+                    ["python"] + (["-u"] if on_output else []) + [str(code_file)],
+                    stdin=stdin_handle,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE
+                )
+            outcome = pump_process(process, timeout, on_output or collect)
+        except Exception as e:
+            return {
+                "success": False,
+                "output": "",
+                "error": str(e),
+                "execution_time": None,
+                "timed_out": False
+            }
     
-    except subprocess.TimeoutExpired:
+    usage = rusage_fields(outcome["usage"])
+    if outcome["timed_out"]:
         return {
             "success": False,
             "output": "",
             "error": "⏰ Execution timed out. Your code may have an infinite loop.",
             "execution_time": timeout,
-            "timed_out": True
+            "timed_out": True,
+            **usage
         }
     
-    except Exception as e:
-        return {
-            "success": False,
-            "output": "",
-            "error": str(e),
-            "execution_time": None,
-            "timed_out": False
-        }
+    # Killed by SIGKILL without us doing it: the kernel OOM killer
+    usage["oom_killed"] = outcome["returncode"] == -signal.SIGKILL and not outcome["stopped"]
+    return {
+        "success": outcome["returncode"] == 0 and not outcome["stopped"],
+        "output": captures["stdout"].getvalue(),
+        "error": captures["stderr"].getvalue(),
+        "execution_time": outcome["execution_time"],
+        "timed_out": False,
+        **usage
+    }
+
+
+def pump_process(process, timeout: int, on_output) -> dict:
+    """
+    Forward a child's stdout/stderr to `on_output` until it exits or the
+    timeout passes, then reap it with wait4 to get its rusage.
+    
+    Returns:
+        dict with returncode, usage, execution_time, timed_out, stopped
+    """
+    streams = {process.stdout.fileno(): "stdout", process.stderr.fileno(): "stderr"}
+    selector = selectors.DefaultSelector()
+    for fd in streams:
+        selector.register(fd, selectors.EVENT_READ)
     
+    start_time = time.time()
+    deadline = start_time + timeout
+    timed_out = stopped = False
+    status = usage = None
+    try:
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                timed_out = True
+                break
+            if selector.get_map():
+                for key, _ in selector.select(timeout=remaining):
+                    data = os.read(key.fd, 65536)
+                    if not data:
+                        selector.unregister(key.fd)
+                    elif on_output(streams[key.fd], data) is False:
+                        stopped = True
+                        break
+                if stopped:
+                    break
+            else:
+                # Both pipes closed; wait for the exit without blocking past the deadline
+                pid, status, usage = os.wait4(process.pid, os.WNOHANG)
+                if pid:
+                    break
+                time.sleep(0.005)
+        execution_time = time.time() - start_time
+        
+        if status is None:
+            process.kill()
+            _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
     finally:
-        # Clean up temp file
-        try:
-            os.unlink(temp_file)
-        except:
-            pass
+        selector.close()
+        process.stdout.close()
+        process.stderr.close()
+    
+    return {
+        "returncode": process.returncode,
+        "usage": usage,
+        "execution_time": execution_time,
+        "timed_out": timed_out,
+        "stopped": stopped
+    }
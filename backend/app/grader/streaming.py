@@ -0,0 +1,372 @@
+"""
+Streaming Runs
+Runs student code and forwards stdout/stderr chunks as they are produced,
+instead of waiting for the program to finish.
+
+The sandbox thread pushes chunks into a small bounded queue that the
+WebSocket drains, so a slow client slows the reader down (backpressure),
+and a hard byte cap stops programs that print without end.
+"""
+
+import asyncio
+import codecs
+import concurrent.futures
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+# Docker is optional - only the docker paths below need its errors
+try:
+    from docker.errors import APIError
+except ImportError:
+    class APIError(Exception):
+        """Placeholder so the except clauses below work without docker."""
+
+from app.core.config import settings
+from app.grader.executor import get_sandbox_executor
+from app.grader.forkserver import run_code_forkserver
+from app.grader.pool import get_warm_pool
+from app.grader.metrics import CGROUP_USAGE_SCRIPT, parse_cgroup_usage, record_run, usage_fields
+from app.grader.runner import (
+    USAGE_FILE,
+    get_docker_client,
+    docker_error,
+    prepare_docker_run,
+    read_container_usage,
+    run_subprocess,
+    write_files,
+)
+
+
+TIMEOUT_MESSAGE = "⏰ Execution timed out. Your code may have an infinite loop."
+
+# Keep interpreters and C stdio from holding output back in pipe buffers
+STREAM_ENV = {"PYTHONUNBUFFERED": "1"}
+LINE_BUFFERED = {"cpp", "c"}
+
+# Seconds a blocked producer waits between checks that the consumer is still there
+PUT_POLL_INTERVAL = 0.25
+
+# Seconds a stream closed early waits for its run to wind down
+STOP_WAIT = 1.0
+
+
+class OutputSink:
+    """
+    Thread-to-event-loop bridge for streamed output.
+
+    `write` is called from the sandbox thread and blocks while the queue is
+    full. It returns False once the byte cap is hit or the consumer went
+    away, which tells the backend to stop the program.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, max_bytes: int, max_pending: int = 64):
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self.max_bytes = max_bytes
+        self.sent_bytes = 0
+        self.truncated = False
+        self.closed = False
+        self._decoders = {}
+        self._pending = None
+        self._lock = threading.Lock()
+
+    def write(self, stream: str, data) -> bool:
+        if self.closed or self.truncated:
+            return False
+
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        room = self.max_bytes - self.sent_bytes
+        if len(data) > room:
+            data = data[:room]
+            self.truncated = True
+        self.sent_bytes += len(data)
+
+        # Decode incrementally so multi-byte characters split across chunks survive
+        decoder = self._decoders.get(stream)
+        if decoder is None:
+            decoder = self._decoders[stream] = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        text = decoder.decode(data, final=self.truncated)
+        if text:
+            self._put({"type": stream, "data": text})
+        return not (self.closed or self.truncated)
+
+    def _put(self, event: dict):
+        # Under the lock, so a close() either sees this put or is seen by it
+        with self._lock:
+            if self.closed:
+                return
+            pending = self._pending = asyncio.run_coroutine_threadsafe(self.queue.put(event), self.loop)
+        # Waiting here is the backpressure; a running put cannot be cancelled
+        # from this thread, so keep checking whether the consumer went away
+        while True:
+            try:
+                pending.result(timeout=PUT_POLL_INTERVAL)
+                return
+            except concurrent.futures.TimeoutError:
+                if self.closed:
+                    pending.cancel()
+                    return
+            except Exception:
+                self.closed = True
+                return
+
+    def close(self):
+        """Consumer side: stop accepting output and unblock the producer."""
+        with self._lock:
+            self.closed = True
+            pending = self._pending
+        if pending is not None:
+            pending.cancel()
+
+
+async def stream_code_in_sandbox(
+    code: str,
+    language: str = "python",
+    timeout: Optional[int] = None,
+    stdin: Optional[str] = None,
+    lab_id: Optional[str] = None
+) -> AsyncIterator[dict]:
+    """
+    Run code and yield output events as the program produces them.
+
+    Yields {"type": "stdout" | "stderr", "data": str} events, then a final
+    {"type": "exit", "success", "error", "execution_time", "timed_out",
+    "truncated", "cpu_user", "cpu_system", "peak_memory", "oom_killed"} event.
+
+    Raises:
+        SandboxBusyError: if the admission queue is full
+    """
+    loop = asyncio.get_running_loop()
+    sink = OutputSink(loop, settings.sandbox_stream_max_bytes)
+    run = asyncio.ensure_future(
+        get_sandbox_executor().submit(stream_code_sync, code, language, timeout, stdin, sink)
+    )
+    finished = False
+
+    try:
+        while True:
+            next_event = asyncio.ensure_future(sink.queue.get())
+            done, _ = await asyncio.wait({next_event, run}, return_when=asyncio.FIRST_COMPLETED)
+            if next_event in done:
+                yield next_event.result()
+                continue
+            next_event.cancel()
+            break
+
+        while not sink.queue.empty():
+            yield sink.queue.get_nowait()
+
+        finished = True
+        result = run.result()
+        record_run(language, lab_id, result)
+        yield {
+            "type": "exit",
+            "success": result["success"],
+            "error": result.get("error", ""),
+            "execution_time": result.get("execution_time"),
+            "timed_out": result.get("timed_out", False),
+            "truncated": sink.truncated,
+            "cpu_user": result.get("cpu_user"),
+            "cpu_system": result.get("cpu_system"),
+            "peak_memory": result.get("peak_memory"),
+            "oom_killed": result.get("oom_killed", False)
+        }
+    finally:
+        sink.close()
+        if not finished:
+            # Client gone: the closed sink stops the program; collect the outcome
+            if not run.done():
+                await asyncio.wait({run}, timeout=STOP_WAIT)
+            if not run.done():
+                print(f"⚠️ Streamed run still stopping {STOP_WAIT:g}s after its client left")
+            elif not run.cancelled() and run.exception() is not None:
+                print(f"⚠️ Streamed run failed after its client left: {run.exception()}")
+
+
+def stream_code_sync(
+    code: str,
+    language: str,
+    timeout: Optional[int],
+    stdin: Optional[str],
+    sink: OutputSink
+) -> dict:
+    """Blocking implementation of stream_code_in_sandbox."""
+    timeout = timeout or settings.sandbox_timeout
+    language = language.lower()
+    backend = settings.sandbox_backend
+
+    if backend == "forkserver" and language in ("python", "python3"):
+        return run_code_forkserver(code, timeout, stdin, on_output=sink.write)
+
+    docker_client = get_docker_client() if backend != "subprocess" else None
+    if docker_client is None:
+        return stream_fallback(code, language, timeout, stdin, sink)
+
+    pool = get_warm_pool(docker_client)
+    image, files, run_cmd, failure = prepare_docker_run(
+        docker_client, pool, code, language, stdin
+    )
+    if failure is not None:
+        # Compiler output is what the student needs to see
+        if failure.get("output"):
+            sink.write("stderr", failure["output"])
+            failure["error"] = ""
+        return failure
+
+    if language in LINE_BUFFERED:
+        run_cmd = f"stdbuf -oL -eL sh -c '{run_cmd}'"
+
+    if pool is not None:
+        return stream_in_warm_container(pool, files, image, run_cmd, timeout, sink)
+    return stream_in_new_container(docker_client, files, image, run_cmd, timeout, sink)
+
+
+def stream_in_warm_container(pool, files: dict, image: str, run_cmd: str, timeout: int, sink: OutputSink) -> dict:
+    """Stream an exec in a pooled container; a stopped run discards the container."""
+    try:
+        pooled = pool.acquire(image)
+    except APIError as e:
+        return docker_error(e, image)
+
+    reusable = False
+    try:
+        pooled.put_files(files)
+        api = pooled.container.client.api
+        exec_id = api.exec_create(
+            pooled.container.id,
+            ["timeout", "-k", "1", str(timeout), "sh", "-c", run_cmd],
+            workdir="/code",
+            environment=STREAM_ENV
+        )["Id"]
+
+        start_time = time.time()
+        for stdout, stderr in api.exec_start(exec_id, stream=True, demux=True):
+            if stdout and not sink.write("stdout", stdout):
+                break
+            if stderr and not sink.write("stderr", stderr):
+                break
+        else:
+            execution_time = time.time() - start_time
+            exit_code = api.exec_inspect(exec_id).get("ExitCode")
+            usage = read_container_usage(pooled)
+            if exit_code == 124 or (exit_code == 137 and execution_time >= timeout):
+                return {
+                    "success": False,
+                    "error": TIMEOUT_MESSAGE,
+                    "execution_time": timeout,
+                    "timed_out": True,
+                    **usage
+                }
+            reusable = exit_code is not None
+            return {
+                "success": exit_code == 0,
+                "error": "",
+                "execution_time": execution_time,
+                "timed_out": False,
+                **usage
+            }
+
+        # Stopped early: byte cap reached or the client went away
+        return {
+            "success": False,
+            "error": "",
+            "execution_time": time.time() - start_time,
+            "timed_out": False
+        }
+
+    except APIError as e:
+        return docker_error(e, image)
+
+    finally:
+        pool.release(pooled, reusable=reusable)
+
+
+def stream_in_new_container(docker_client, files: dict, image: str, run_cmd: str, timeout: int, sink: OutputSink) -> dict:
+    """Stream a freshly created container's output; a timer kills it at the deadline."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        write_files(tmpdir, files)
+
+        try:
+            container = docker_client.containers.run(
+                image=image,
+                command=["sh", "-c", f"{run_cmd}; rc=$?; {CGROUP_USAGE_SCRIPT} > /code/{USAGE_FILE}; exit $rc"],
+                volumes={tmpdir: {"bind": "/code", "mode": "rw"}},
+                mem_limit=settings.sandbox_memory_limit,
+                network_disabled=True,  # No network access
+                environment=STREAM_ENV,
+                detach=True
+            )
+        except APIError as e:
+            return docker_error(e, image)
+
+        timed_out = threading.Event()
+
+        def kill_on_timeout():
+            timed_out.set()
+            try:
+                container.kill()
+            except Exception:
+                pass
+
+        timer = threading.Timer(timeout, kill_on_timeout)
+        start_time = time.time()
+        timer.start()
+        try:
+            stream = container.attach(stdout=True, stderr=True, stream=True, logs=True, demux=True)
+            for stdout, stderr in stream:
+                if stdout and not sink.write("stdout", stdout):
+                    break
+                if stderr and not sink.write("stderr", stderr):
+                    break
+            else:
+                exit_code = container.wait()["StatusCode"]
+                execution_time = time.time() - start_time
+                if timed_out.is_set():
+                    return {
+                        "success": False,
+                        "error": TIMEOUT_MESSAGE,
+                        "execution_time": timeout,
+                        "timed_out": True
+                    }
+                container.reload()
+                usage_file = Path(tmpdir) / USAGE_FILE
+                usage = usage_fields(None, parse_cgroup_usage(
+                    usage_file.read_text(encoding="utf-8") if usage_file.exists() else ""
+                ))
+                usage["oom_killed"] = usage["oom_killed"] or container.attrs["State"].get("OOMKilled", False)
+                return {
+                    "success": exit_code == 0,
+                    "error": "",
+                    "execution_time": execution_time,
+                    "timed_out": False,
+                    **usage
+                }
+
+            return {
+                "success": False,
+                "error": "",
+                "execution_time": time.time() - start_time,
+                "timed_out": False
+            }
+
+        except APIError as e:
+            return docker_error(e, image)
+
+        finally:
+            timer.cancel()
+            try:
+                container.remove(force=True)
+            except Exception:
+                pass
+
+
+def stream_fallback(code: str, language: str, timeout: int, stdin: Optional[str], sink: OutputSink) -> dict:
+    """
+    Stream a local subprocess run when Docker is not available.
+    ⚠️ Less secure - only use in development!
+    """
+    return run_subprocess(code, language, timeout, stdin, on_output=sink.write)
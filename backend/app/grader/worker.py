@@ -0,0 +1,146 @@
+"""
+Sandbox Worker Processes
+Standalone processes that take jobs from the durable job queue and run
+them in the sandbox, so execution capacity scales separately from the
+API (more processes, more cores, or more machines sharing the queue file).
+
+Run with:
+    python -m app.grader.worker [processes]
+"""
+
+import asyncio
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import time
+
+from app.core.config import settings
+from app.grader.executor import SandboxBusyError, shutdown_sandbox_executor
+from app.grader.forkserver import shutdown_forkserver
+from app.grader.grading import grade_code
+from app.grader.job_queue import get_job_queue
+from app.grader.pool import shutdown_warm_pool
+from app.grader.runner import run_code_in_sandbox
+
+
+# Idle polling backs off from MIN to MAX seconds while the queue is empty
+MIN_POLL_INTERVAL = 0.05
+MAX_POLL_INTERVAL = 1.0
+
+# Seconds between purges of old finished jobs
+PURGE_INTERVAL = 300
+
+
+async def handle_job(job: dict) -> dict:
+    """Execute one job and return its result (the same body the inline endpoint returns)."""
+    payload = job["payload"]
+
+    if job["kind"] == "run":
+        return await run_code_in_sandbox(**payload)
+
+    if job["kind"] == "submit":
+        report = await grade_code(**payload)
+        return {"submission_id": job["id"], **report}
+
+    raise ValueError(f"Unknown job kind: {job['kind']}")
+
+
+async def keep_lease(queue, job_id: str, worker: str):
+    """Renew the job's lease until cancelled."""
+    while True:
+        await asyncio.sleep(queue.lease_timeout / 3)
+        await asyncio.to_thread(queue.renew, job_id, worker)
+
+
+async def job_loop(queue, worker: str, stop: asyncio.Event):
+    """Claim and run jobs one at a time until asked to stop."""
+    interval = MIN_POLL_INTERVAL
+
+    while not stop.is_set():
+        job = await asyncio.to_thread(queue.claim, worker)
+        if job is None:
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            interval = min(interval * 2, MAX_POLL_INTERVAL)
+            continue
+        interval = MIN_POLL_INTERVAL
+
+        lease = asyncio.create_task(keep_lease(queue, job["id"], worker))
+        try:
+            result = await handle_job(job)
+            await asyncio.to_thread(queue.complete, job["id"], worker, result)
+        except SandboxBusyError:
+            # This process is saturated; let another worker have it
+            await asyncio.to_thread(queue.release, job["id"], worker)
+            await asyncio.sleep(MAX_POLL_INTERVAL)
+        except Exception as e:
+            print(f"❌ Job {job['id']} failed: {e}")
+            await asyncio.to_thread(queue.fail, job["id"], worker, str(e))
+        finally:
+            lease.cancel()
+
+
+async def run_worker(name: str):
+    """Run `job_worker_concurrency` job loops in this process until SIGTERM/SIGINT."""
+    queue = get_job_queue()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    print(f"👷 Worker {name} started ({settings.job_worker_concurrency} concurrent jobs)")
+    loops = [
+        asyncio.create_task(job_loop(queue, f"{name}/{slot}", stop))
+        for slot in range(settings.job_worker_concurrency)
+    ]
+
+    last_purge = 0.0
+    try:
+        while not stop.is_set():
+            if time.time() - last_purge > PURGE_INTERVAL:
+                await asyncio.to_thread(queue.purge, settings.job_result_ttl)
+                last_purge = time.time()
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=PURGE_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+        # Let running jobs finish
+        await asyncio.gather(*loops)
+    finally:
+        print(f"👋 Worker {name} stopping")
+        shutdown_sandbox_executor()
+        shutdown_warm_pool()
+        shutdown_forkserver()
+
+
+def worker_process(index: int):
+    asyncio.run(run_worker(f"{socket.gethostname()}-{os.getpid()}-{index}"))
+
+
+def main(processes: int):
+    """Start the worker processes and wait for them."""
+    workers = [
+        multiprocessing.Process(target=worker_process, args=(index,), name=f"sandbox-worker-{index}")
+        for index in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+
+    def forward(signum, frame):
+        for worker in workers:
+            if worker.is_alive():
+                os.kill(worker.pid, signum)
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+
+    for worker in workers:
+        worker.join()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count() or 1)
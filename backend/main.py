@@ -3,15 +3,21 @@ Autonomous Lab TA - Backend Application
 FastAPI entry point with CORS, routers, and startup events.
 """
 
+import asyncio
 from contextlib import asynccontextmanager
 from pathlib import Path
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse
 
 from app.api.endpoints import auth, chat, submissions
 from app.core.config import settings
+from app.grader.pool import shutdown_warm_pool
+from app.grader.executor import shutdown_sandbox_executor
+from app.grader.forkserver import shutdown_forkserver
+from app.ai_engine.llm.resilience import close_llm
+from app.ai_engine.rag.store import get_knowledge_base, is_ready, knowledge_base
 
 
 # Path to frontend folder
@@ -26,9 +32,24 @@ async def lifespan(app: FastAPI):
     print(f"📁 Frontend path: {FRONTEND_PATH}")
     if FRONTEND_PATH.exists():
         print("✅ Frontend found - serving at http://127.0.0.1:8000")
+    if settings.rag_preload:
+        # Load and warm the embedding model and index off the request path;
+        # /ready reports 503 until this finishes
+        print("📚 Loading knowledge base...")
+        app.state.knowledge_base_load = asyncio.create_task(
+            asyncio.to_thread(get_knowledge_base().load)
+        )
+    if settings.rag_watch:
+        # Apply edits to knowledge_base/ files as they happen
+        knowledge_base.start_watcher(settings.rag_watch_interval)
     yield
     # Shutdown
     print("👋 Shutting down...")
+    knowledge_base.stop_watcher()
+    shutdown_sandbox_executor()
+    shutdown_warm_pool()
+    shutdown_forkserver()
+    await close_llm()
 
 
 app = FastAPI(
@@ -72,6 +93,16 @@ async def health_check():
     return {"status": "healthy"}
 
 
+@app.get("/ready")
+async def readiness_check():
+    """Readiness for Docker/K8s: 503 until the knowledge base is loaded and warm."""
+    # The module instance: a readiness probe must not start a lazy load
+    stats = knowledge_base.stats()
+    if not is_ready():
+        return JSONResponse(status_code=503, content={"status": "starting", "knowledge_base": stats})
+    return {"status": "ready", "knowledge_base": stats}
+
+
 # Mount static files for CSS, JS, etc. (must be after specific routes)
 if FRONTEND_PATH.exists():
     app.mount("/", StaticFiles(directory=str(FRONTEND_PATH), html=True), name="frontend")
@@ -123,7 +123,8 @@ async function sendMessage() {
             },
             body: JSON.stringify({
                 message: message,
-                code: code
+                code: code,
+                language: languageSelect.value
             })
         });
 
@@ -2,13 +2,72 @@
 Sandbox Worker Script
 Utility script that runs inside the Docker container.
 Handles code execution, output capture, and timeout management.
+
+In suite mode it is also the grading harness: every test case of a lab's
+suite is run against the student's program inside one container launch.
 """
 
+import io
+import json
+import os
+import selectors
+import signal
+import subprocess
 import sys
+import threading
 import time
 import traceback
 
 
+# How a case's output is compared with the expected output
+COMPARISON_MODES = ('exact', 'strip', 'tokens', 'float', 'contains')
+
+# Bytes of output kept per stream; the middle of longer output is dropped
+MAX_OUTPUT_BYTES = int(os.environ.get('MAX_OUTPUT_BYTES', 64 * 1024))
+
+
+class BoundedCapture(io.TextIOBase):
+    """
+    Output buffer that keeps only the first and last MAX_OUTPUT_BYTES / 2
+    bytes, so memory stays fixed however much the program prints.
+    Accepts str (as a redirect_stdout target) or bytes (from a pipe).
+    """
+
+    encoding = 'utf-8'
+
+    def __init__(self, max_bytes: int = MAX_OUTPUT_BYTES):
+        self.head_limit = max_bytes // 2
+        self.tail_limit = max_bytes - self.head_limit
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total_bytes = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        raw = data.encode('utf-8', errors='replace') if isinstance(data, str) else data
+        self.total_bytes += len(raw)
+        room = self.head_limit - len(self.head)
+        if room > 0:
+            self.head += raw[:room]
+            raw = raw[room:]
+        if raw:
+            self.tail += raw
+            # Trim in batches so many small writes stay cheap
+            if len(self.tail) > 2 * self.tail_limit:
+                del self.tail[:len(self.tail) - self.tail_limit]
+        return len(data)
+
+    def getvalue(self) -> str:
+        tail = bytes(self.tail[-self.tail_limit:]) if self.tail_limit else b''
+        dropped = self.total_bytes - len(self.head) - len(tail)
+        text = self.head.decode('utf-8', errors='replace')
+        if dropped > 0:
+            text += f'\n... [truncated {dropped} bytes] ...\n'
+        return text + tail.decode('utf-8', errors='replace')
+
+
 def run_student_code(code_path: str) -> dict:
     """
     Execute the student's code file and capture output.
@@ -19,11 +78,10 @@ def run_student_code(code_path: str) -> dict:
     Returns:
         dict with success, output, error
     """
-    import io
     from contextlib import redirect_stdout, redirect_stderr
     
-    stdout_capture = io.StringIO()
-    stderr_capture = io.StringIO()
+    stdout_capture = BoundedCapture()
+    stderr_capture = BoundedCapture()
     
     start_time = time.time()
     
@@ -54,11 +112,257 @@ def run_student_code(code_path: str) -> dict:
         }
 
 
+def _parse_float(token: str):
+    try:
+        return float(token)
+    except ValueError:
+        return None
+
+
+def compare_output(actual: str, expected: str, mode: str = 'strip', tolerance: float = 1e-6) -> bool:
+    """
+    Compare a program's output with the expected output.
+
+    Args:
+        actual: What the program printed
+        expected: What the test case expects
+        mode: exact (byte for byte), strip (ignore trailing whitespace on
+            each line and trailing blank lines), tokens (ignore all
+            whitespace differences), float (tokens, with numbers equal
+            within `tolerance`), contains (expected appears in the output)
+        tolerance: Absolute/relative tolerance for float mode
+
+    Returns:
+        True if the output is accepted
+    """
+    if mode == 'exact':
+        return actual == expected
+
+    if mode == 'strip':
+        def lines(text):
+            return [line.rstrip() for line in text.rstrip().splitlines()]
+        return lines(actual) == lines(expected)
+
+    if mode == 'tokens':
+        return actual.split() == expected.split()
+
+    if mode == 'float':
+        actual_tokens, expected_tokens = actual.split(), expected.split()
+        if len(actual_tokens) != len(expected_tokens):
+            return False
+        for got, want in zip(actual_tokens, expected_tokens):
+            got_number, want_number = _parse_float(got), _parse_float(want)
+            if want_number is None or got_number is None:
+                if got != want:
+                    return False
+            elif abs(got_number - want_number) > tolerance * max(1.0, abs(want_number)):
+                return False
+        return True
+
+    if mode == 'contains':
+        return expected.strip() in actual
+
+    raise ValueError(f'Unknown comparison mode: {mode}')
+
+
+def read_process(process, input_data: bytes, timeout: float, max_bytes: int) -> tuple:
+    """
+    Feed stdin and drain stdout/stderr into bounded captures until the
+    process exits or the timeout passes.
+
+    Returns:
+        (stdout, stderr, timed_out) with stdout/stderr as text
+    """
+    def feed():
+        try:
+            process.stdin.write(input_data)
+            process.stdin.close()
+        except OSError:
+            pass  # the program exited without reading all of its input
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+
+    captures = {process.stdout: BoundedCapture(max_bytes), process.stderr: BoundedCapture(max_bytes)}
+    selector = selectors.DefaultSelector()
+    for stream in captures:
+        selector.register(stream, selectors.EVENT_READ)
+
+    deadline = time.time() + timeout
+    timed_out = False
+    while selector.get_map():
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            timed_out = True
+            break
+        for key, _ in selector.select(timeout=remaining):
+            data = os.read(key.fileobj.fileno(), 65536)
+            if data:
+                captures[key.fileobj].write(data)
+            else:
+                selector.unregister(key.fileobj)
+    selector.close()
+
+    if not timed_out:
+        try:
+            process.wait(timeout=max(0, deadline - time.time()))
+        except subprocess.TimeoutExpired:
+            timed_out = True
+    if timed_out:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        process.wait()
+
+    process.stdout.close()
+    process.stderr.close()
+    return captures[process.stdout].getvalue(), captures[process.stderr].getvalue(), timed_out
+
+
+def parse_user(user):
+    """(uid, gid) from "uid:gid", or None to keep the harness's own user."""
+    if not user or os.geteuid() != 0:
+        return None
+    uid, _, gid = str(user).partition(':')
+    return int(uid), int(gid or uid)
+
+
+def run_test_case(command: list, case: dict, timeout: float, mode: str, tolerance: float,
+                  max_output: int, max_capture: int = MAX_OUTPUT_BYTES, user=None) -> dict:
+    """
+    Run the program once with the case's input and judge its output.
+
+    The program runs in its own process group so a timeout also kills
+    anything it started, and as `user` ((uid, gid)) when given, so it
+    cannot look into the harness.
+
+    Returns:
+        dict with name, verdict (passed, wrong_answer, runtime_error,
+        timeout), passed, execution_time, output, error
+    """
+    credentials = {}
+    if user is not None:
+        credentials = {'user': user[0], 'group': user[1], 'extra_groups': []}
+
+    start_time = time.time()
+    process = subprocess.Popen(
+        command,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        start_new_session=True,
+        **credentials
+    )
+
+    output, error, timed_out = read_process(
+        process, case.get('input', '').encode('utf-8'), timeout, max_capture
+    )
+    execution_time = time.time() - start_time
+
+    if timed_out:
+        verdict = 'timeout'
+    elif process.returncode != 0:
+        verdict = 'runtime_error'
+    elif compare_output(output, case['expected'], mode, tolerance):
+        verdict = 'passed'
+    else:
+        verdict = 'wrong_answer'
+
+    return {
+        'name': case.get('name', ''),
+        'verdict': verdict,
+        'passed': verdict == 'passed',
+        'execution_time': execution_time,
+        'output': output[:max_output],
+        'error': error[:max_output]
+    }
+
+
+def run_suite(suite: dict) -> dict:
+    """
+    Run every case of a test suite.
+
+    Args:
+        suite: dict with command (argv of the student's program), tests,
+            and optional timeout, comparison, tolerance, max_output,
+            max_capture, max_report and stop_on_failure defaults; each test may
+            override timeout, comparison and tolerance. With user
+            ("uid:gid") and a harness running as root, the program runs
+            as that user
+
+    Returns:
+        dict with cases, tests_total, tests_run, tests_passed,
+        stopped_early, execution_time
+    """
+    start_time = time.time()
+    cases = []
+    user = parse_user(suite.get('user'))
+
+    for case in suite['tests']:
+        result = run_test_case(
+            suite['command'],
+            case,
+            timeout=case.get('timeout', suite.get('timeout', 5)),
+            mode=case.get('comparison', suite.get('comparison', 'strip')),
+            tolerance=case.get('tolerance', suite.get('tolerance', 1e-6)),
+            max_output=suite.get('max_output', 1000),
+            max_capture=suite.get('max_capture', MAX_OUTPUT_BYTES),
+            user=user
+        )
+        cases.append(result)
+        if not result['passed'] and suite.get('stop_on_failure'):
+            break
+
+    return {
+        'cases': cases,
+        'tests_total': len(suite['tests']),
+        'tests_run': len(cases),
+        'tests_passed': sum(case['passed'] for case in cases),
+        'stopped_early': len(cases) < len(suite['tests']),
+        'execution_time': time.time() - start_time
+    }
+
+
+def fit_report(report: dict, max_bytes: int) -> str:
+    """
+    Serialize a suite report in at most `max_bytes` where possible.
+
+    The backend reads the report through a bounded capture, and a report
+    cut in the middle no longer parses, so the per-case output and error
+    are shortened (evenly across cases) until the JSON fits.
+
+    Returns:
+        The report as one line of JSON
+    """
+    text = json.dumps(report)
+    limit = max((len(case['output']) for case in report['cases']), default=0)
+    limit = max(limit, max((len(case['error']) for case in report['cases']), default=0))
+    while len(text.encode('utf-8')) > max_bytes and limit > 0:
+        limit //= 2
+        for case in report['cases']:
+            case['output'] = case['output'][:limit]
+            case['error'] = case['error'][:limit]
+        text = json.dumps(report)
+    return text
+
+
 if __name__ == '__main__':
+    if len(sys.argv) == 3 and sys.argv[1] == '--suite':
+        with open(sys.argv[2], 'r') as f:
+            suite = json.load(f)
+        # The suite holds the expected output of hidden cases; it must be
+        # gone before the student's program first runs
+        os.unlink(sys.argv[2])
+        report = run_suite(suite)
+        print(fit_report(report, suite.get('max_report', MAX_OUTPUT_BYTES)))
+        sys.exit(0)
+
     if len(sys.argv) < 2:
         print("Usage: python run_code.py <code_file>")
+        print("       python run_code.py --suite <suite.json>")
         sys.exit(1)
-    
+
     result = run_student_code(sys.argv[1])
     
     # Print output